@@ -4,3 +4,20 @@
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        from django.conf import settings
+
+        from .utils.decode_sandbox import configure_sandbox
+        from .utils.image_pipeline import configure_backend, configure_limits, display_formats
+
+        display_formats()  # пробное кодирование WebP/AVIF — один раз при старте
+        configure_backend(getattr(settings, "PHOTO_IMAGE_BACKEND", "auto"))
+        configure_limits(getattr(settings, "PHOTO_UPLOAD_MAX_PIXELS", 0))
+        configure_sandbox(
+            getattr(settings, "PHOTO_DECODE_SANDBOX", False),
+            workers=getattr(settings, "PHOTO_DECODE_WORKERS", 1),
+            memory_mb=getattr(settings, "PHOTO_DECODE_MEMORY_MB", 2048),
+            timeout=getattr(settings, "PHOTO_DECODE_TIMEOUT", 60),
+            max_tasks=getattr(settings, "PHOTO_DECODE_MAX_TASKS", 50),
+        )
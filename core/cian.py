@@ -348,10 +348,7 @@ def _absolute_url(path: Optional[str]) -> str:
 
 
 def _resolve_photo_url(photo) -> str:
-    full_url = getattr(photo, "full_url", None)
-    absolute = _absolute_url(full_url)
-    if absolute:
-        return absolute
+    # Локальная копия (в т.ч. скачанная fetch_remote_photos) надёжнее чужой ссылки
     image = getattr(photo, "image", None)
     if image:
         try:
@@ -360,7 +357,8 @@ def _resolve_photo_url(photo) -> str:
             image_url = ""
         if image_url:
             return _absolute_url(image_url)
-    return ""
+    full_url = getattr(photo, "full_url", None)
+    return _absolute_url(full_url)
 
 
 def _collect_photos(prop) -> List[Tuple[str, bool]]:
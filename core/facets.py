@@ -0,0 +1,72 @@
+# core/facets.py
+from django.core.cache import cache
+from django.db.models import Count, Max
+
+from .models import CATEGORY_CHOICES, OPERATION_CHOICES, STATUS_CHOICES, Property
+
+FACETS_CACHE_KEY = "core:property_facets:v2"
+# Страховка на случай массовых .update(), которые не трогают updated_at.
+FACETS_CACHE_TIMEOUT = 10 * 60
+
+EXPORT_FACETS = [
+    ("export_to_cian", "ЦИАН"),
+    ("export_to_domklik", "ДомКлик"),
+]
+
+
+def _compute_property_facets():
+    """Один GROUP BY по всем измерениям сразу; раскладываем по фасетам в Python."""
+
+    rows = (
+        Property.objects.order_by()
+        .values("category", "operation", "status", "export_to_cian", "export_to_domklik")
+        .annotate(n=Count("id"))
+    )
+    total = 0
+    by_category = {}
+    by_operation = {}
+    by_status = {}
+    by_export = {}
+    for row in rows:
+        n = row["n"]
+        total += n
+        by_category[row["category"]] = by_category.get(row["category"], 0) + n
+        by_operation[row["operation"]] = by_operation.get(row["operation"], 0) + n
+        by_status[row["status"]] = by_status.get(row["status"], 0) + n
+        for field, _label in EXPORT_FACETS:
+            if row[field]:
+                by_export[field] = by_export.get(field, 0) + n
+
+    def _facet(choices, counts):
+        return [
+            {"value": value, "label": label, "count": counts.get(value, 0)}
+            for value, label in choices
+        ]
+
+    return {
+        "total": total,
+        "category": _facet(CATEGORY_CHOICES, by_category),
+        "operation": _facet(OPERATION_CHOICES, by_operation),
+        "status": _facet(STATUS_CHOICES, by_status),
+        "export": _facet(EXPORT_FACETS, by_export),
+    }
+
+
+def facets_version():
+    """Версия данных для ключа кэша: число объектов и последний updated_at.
+
+    Читается из БД (по индексу prop_updated_idx), поэтому после записи ключ
+    меняется во всех процессах сразу: LocMem-кэш у каждого воркера свой, и
+    сброс по сигналу дошёл бы только до процесса, который сохранял объект.
+    """
+
+    row = Property.objects.order_by().aggregate(n=Count("id"), last=Max("updated_at"))
+    last = row["last"].isoformat() if row["last"] else ""
+    return f"{row['n']}:{last}"
+
+
+def property_facets():
+    """Счётчики для сайдбара panel_list (кэш по версии данных, см. facets_version)."""
+
+    key = f"{FACETS_CACHE_KEY}:{facets_version()}"
+    return cache.get_or_set(key, _compute_property_facets, FACETS_CACHE_TIMEOUT)
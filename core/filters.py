@@ -0,0 +1,69 @@
+# core/filters.py
+import django_filters
+from django import forms
+
+from .models import CATEGORY_CHOICES, OPERATION_CHOICES, Property
+
+# Варианты сортировки списка: ключ из GET ?sort=... → order_by().
+# Хвост по id держит порядок стабильным; в SQLite rowid неявно входит в
+# каждый индекс, поэтому индексы из Property.Meta покрывают и его.
+SORT_CHOICES = [
+    ("-updated", "Изменены: новые"),
+    ("updated", "Изменены: старые"),
+    ("-created", "Добавлены: новые"),
+    ("price", "Цена: по возрастанию"),
+    ("-price", "Цена: по убыванию"),
+    ("area", "Площадь: по возрастанию"),
+    ("-area", "Площадь: по убыванию"),
+]
+SORT_ORDERINGS = {
+    "-updated": ("-updated_at", "-id"),
+    "updated": ("updated_at", "id"),
+    "-created": ("-created_at", "-id"),
+    "price": ("price", "id"),
+    "-price": ("-price", "-id"),
+    "area": ("total_area", "id"),
+    "-area": ("-total_area", "-id"),
+}
+DEFAULT_SORT = "-updated"
+
+
+class PropertyListFilter(django_filters.FilterSet):
+    """Структурные фильтры и сортировка для panel_list.
+
+    Некорректные значения просто игнорируются (поле не попадает в cleaned_data),
+    чтобы кривой URL не ронял список.
+    """
+
+    category = django_filters.ChoiceFilter(choices=CATEGORY_CHOICES, empty_label="Все типы")
+    operation = django_filters.ChoiceFilter(choices=OPERATION_CHOICES, empty_label="Все сделки")
+    price_min = django_filters.NumberFilter(
+        field_name="price",
+        lookup_expr="gte",
+        widget=forms.NumberInput(attrs={"placeholder": "Цена от", "min": "0"}),
+    )
+    price_max = django_filters.NumberFilter(
+        field_name="price",
+        lookup_expr="lte",
+        widget=forms.NumberInput(attrs={"placeholder": "Цена до", "min": "0"}),
+    )
+    area_min = django_filters.NumberFilter(
+        field_name="total_area",
+        lookup_expr="gte",
+        widget=forms.NumberInput(attrs={"placeholder": "S от", "min": "0"}),
+    )
+    area_max = django_filters.NumberFilter(
+        field_name="total_area",
+        lookup_expr="lte",
+        widget=forms.NumberInput(attrs={"placeholder": "S до", "min": "0"}),
+    )
+    sort = django_filters.ChoiceFilter(
+        choices=SORT_CHOICES, method="filter_sort", empty_label=None
+    )
+
+    class Meta:
+        model = Property
+        fields = ["category", "operation"]
+
+    def filter_sort(self, queryset, name, value):
+        return queryset.order_by(*SORT_ORDERINGS.get(value, SORT_ORDERINGS[DEFAULT_SORT]))
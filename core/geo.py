@@ -0,0 +1,196 @@
+# core/geo.py
+"""Геопоиск по объектам без GIS-расширений.
+
+Property.geo_cell хранит geohash точки (lat, lng) и индексирован. Ячейка —
+префикс geohash, поэтому «все точки в ячейке» — это диапазон строк
+[prefix, prefix + "~"), который SQLite/Postgres отдают по обычному B-tree.
+
+Поиск в прямоугольнике: покрываем его небольшим числом ячеек, префильтруем
+по ним в SQL и уточняем точными границами lat/lng. Поиск в радиусе:
+прямоугольник вокруг окружности + уточнение по гаверсинусу в Python.
+Кластеризация: GROUP BY по префиксу geo_cell длины, зависящей от зума.
+"""
+import math
+from decimal import Decimal
+
+from django.db.models import Avg, Count, Max, Min, Q
+from django.db.models.functions import Substr
+
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9  # ~5 м — с запасом для уточнения любых запросов
+CELL_RANGE_SUFFIX = "~"  # больше любого символа алфавита geohash
+MAX_PREFILTER_CELLS = 32
+EARTH_RADIUS_KM = 6371.0088
+
+
+def geohash_encode(lat, lng, precision: int = GEOHASH_PRECISION) -> str:
+    lat = float(lat)
+    lng = float(lng)
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # чётные биты — долгота
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def geohash_cell_size(precision: int):
+    """Размер ячейки (высота по широте, ширина по долготе) в градусах."""
+
+    total_bits = 5 * precision
+    lng_bits = (total_bits + 1) // 2
+    lat_bits = total_bits // 2
+    return 180.0 / (2 ** lat_bits), 360.0 / (2 ** lng_bits)
+
+
+def _steps(lo: float, hi: float, step: float):
+    value = lo
+    while value < hi:
+        yield value
+        value += step
+    yield hi
+
+
+def cells_for_bbox(south, west, north, east, max_cells: int = MAX_PREFILTER_CELLS):
+    """Набор префиксов geohash, покрывающих прямоугольник (не больше max_cells)."""
+
+    south, west, north, east = (float(v) for v in (south, west, north, east))
+    for precision in range(GEOHASH_PRECISION, 0, -1):
+        cell_h, cell_w = geohash_cell_size(precision)
+        rows = math.floor((north - south) / cell_h) + 2
+        cols = math.floor((east - west) / cell_w) + 2
+        if rows * cols <= max_cells:
+            break
+    cells = set()
+    for lat in _steps(south, north, cell_h):
+        for lng in _steps(west, east, cell_w):
+            cells.add(geohash_encode(lat, lng, precision))
+    return sorted(cells)
+
+
+def cells_q(cells):
+    """Q-фильтр «geo_cell начинается с одного из префиксов» через диапазоны (по индексу)."""
+
+    q = Q()
+    for prefix in cells:
+        q |= Q(geo_cell__gte=prefix, geo_cell__lt=prefix + CELL_RANGE_SUFFIX)
+    return q
+
+
+def haversine_km(lat1, lng1, lat2, lng2) -> float:
+    lat1, lng1, lat2, lng2 = (math.radians(float(v)) for v in (lat1, lng1, lat2, lng2))
+    dlat = lat2 - lat1
+    dlng = lng2 - lng1
+    a = math.sin(dlat / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(dlng / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def bbox_around(lat, lng, radius_km):
+    """Прямоугольник (south, west, north, east), гарантированно содержащий круг."""
+
+    lat = float(lat)
+    lng = float(lng)
+    dlat = math.degrees(radius_km / EARTH_RADIUS_KM)
+    cos_lat = max(math.cos(math.radians(lat)), 1e-6)
+    dlng = min(180.0, math.degrees(radius_km / (EARTH_RADIUS_KM * cos_lat)))
+    return (
+        max(-90.0, lat - dlat),
+        max(-180.0, lng - dlng),
+        min(90.0, lat + dlat),
+        min(180.0, lng + dlng),
+    )
+
+
+def _decimal(value) -> Decimal:
+    return Decimal(str(round(float(value), 6)))
+
+
+def filter_bbox(queryset, south, west, north, east):
+    """Объекты внутри прямоугольника: префильтр по ячейкам + точные границы."""
+
+    return queryset.filter(cells_q(cells_for_bbox(south, west, north, east))).filter(
+        lat__gte=_decimal(south),
+        lat__lte=_decimal(north),
+        lng__gte=_decimal(west),
+        lng__lte=_decimal(east),
+    )
+
+
+def within_radius(queryset, lat, lng, radius_km):
+    """Список (объект, расстояние_км) в радиусе, отсортированный по расстоянию."""
+
+    south, west, north, east = bbox_around(lat, lng, radius_km)
+    found = []
+    for obj in filter_bbox(queryset, south, west, north, east):
+        distance = haversine_km(lat, lng, obj.lat, obj.lng)
+        if distance <= radius_km:
+            found.append((obj, distance))
+    found.sort(key=lambda pair: pair[1])
+    return found
+
+
+def precision_for_zoom(zoom: int) -> int:
+    """Длина префикса geohash для кластеров на уровне зума карты (0–20).
+
+    Ячейка примерно соответствует 1/4–1/8 тайла 256px, этого хватает,
+    чтобы маркеры кластеров не налезали друг на друга.
+    """
+
+    zoom = max(0, min(20, int(zoom)))
+    return max(1, min(GEOHASH_PRECISION, (zoom + 4) // 2))
+
+
+def cluster(queryset, zoom):
+    """Кластеры точек на уровне зума одним GROUP BY по префиксу geo_cell."""
+
+    precision = precision_for_zoom(zoom)
+    rows = (
+        queryset.exclude(geo_cell="")
+        .annotate(cell=Substr("geo_cell", 1, precision))
+        .values("cell")
+        .annotate(
+            count=Count("id"),
+            lat=Avg("lat"),
+            lng=Avg("lng"),
+            min_id=Min("id"),
+            max_id=Max("id"),
+        )
+        .order_by("cell")
+    )
+    clusters = []
+    for row in rows:
+        clusters.append(
+            {
+                "cell": row["cell"],
+                "count": row["count"],
+                "lat": round(float(row["lat"]), 6),
+                "lng": round(float(row["lng"]), 6),
+                # одиночная точка — сразу id объекта, чтобы карта могла открыть карточку
+                "id": row["min_id"] if row["min_id"] == row["max_id"] else None,
+            }
+        )
+    return clusters
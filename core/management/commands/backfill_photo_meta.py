@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import Photo
+
+
+class Command(BaseCommand):
+    help = (
+        "Fill stored file metadata (width, height, byte_size, mime_type, content_hash, dhash) "
+        "for photos uploaded before these columns existed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max", type=int, default=0, help="Max photos to process (0 = all)")
+        parser.add_argument(
+            "--force", action="store_true", help="Re-read files even if metadata is already filled"
+        )
+
+    def handle(self, *args, **opts):
+        qs = Photo.objects.exclude(image="").exclude(image=None).order_by("id")
+        if not opts["force"]:
+            qs = qs.filter(Q(byte_size__isnull=True) | Q(dhash=""))
+        if opts["max"]:
+            qs = qs[: opts["max"]]
+
+        processed = 0
+        seen_names = set()
+        for ph in qs.iterator():
+            name = ph.image.name
+            if name in seen_names:
+                continue  # общий файл уже заполнен у всех ссылающихся фото
+            seen_names.add(name)
+            try:
+                meta = ph.read_file_meta()
+            except Exception as exc:
+                self.stderr.write(f"Skip {ph.id}: {exc}")
+                continue
+            processed += Photo.objects.filter(image=name).update(**meta)
+            self.stdout.write(f"OK {ph.id}: {meta['width']}x{meta['height']}, {meta['byte_size']} B")
+
+        self.stdout.write(self.style.SUCCESS(f"Photos updated: {processed}"))
@@ -0,0 +1,281 @@
+import io
+import math
+import multiprocessing
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.utils import image_pipeline
+from core.utils.image_pipeline import Image
+
+SYNTHETIC_SIZE = (4000, 3000)
+LARGE_SYNTHETIC_SIZE = (8000, 6000)  # ~48 Мп, как у современных телефонов
+
+
+def _synthetic_photo(size):
+    from PIL import ImageFilter
+
+    w, h = size
+    base = (
+        Image.effect_noise((w // 8, h // 8), 90)
+        .filter(ImageFilter.GaussianBlur(3))
+        .resize(size, Image.BICUBIC)
+    )
+    grain = Image.effect_noise(size, 12)
+    return Image.merge("RGB", (base, Image.blend(base, grain, 0.3), grain))
+
+
+def _encoded(img, fmt="JPEG") -> bytes:
+    buf = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buf, format="JPEG", quality=95)
+    else:
+        img.save(buf, format=fmt)
+    return buf.getvalue()
+
+
+def _synthetic_sources(size=SYNTHETIC_SIZE):
+    """Набор «фото» без внешних файлов: мягкие пятна с зерном, шум и градиент."""
+
+    images = {
+        "photo": _synthetic_photo(size),
+        "noise": Image.effect_noise(size, 40).convert("RGB"),
+        "gradient": Image.linear_gradient("L").resize(size).convert("RGB"),
+    }
+    for name, img in images.items():
+        yield name, _encoded(img)
+
+
+def _large_sources():
+    img = _synthetic_photo(LARGE_SYNTHETIC_SIZE)
+    yield "photo48mp.jpg", _encoded(img, "JPEG")
+    yield "photo48mp.png", _encoded(img, "PNG")
+
+
+def _proc_status_kb(field: str) -> int:
+    try:
+        with open("/proc/self/status") as fh:
+            for line in fh:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+def _decode_probe(path: str, reduced: bool):
+    """Выполняется в отдельном процессе: время и прирост пикового RSS одной загрузки."""
+
+    with open(path, "rb") as fh:
+        orig = fh.read()
+    baseline = _proc_status_kb("VmRSS")
+    started = time.perf_counter()
+    img = image_pipeline.decode_for_target(orig, reduced=reduced)
+    data, _q = image_pipeline.encode_jpeg_to_target(img, image_pipeline._target_size(len(orig)))
+    elapsed = time.perf_counter() - started
+    peak = _proc_status_kb("VmHWM")
+    return elapsed, max(0, peak - baseline), img.size, len(data)
+
+
+def _backend_probe(path: str, backend: str):
+    """Как _decode_probe, но целиком через бэкенд сжатия (источник читается с диска)."""
+
+    baseline = _proc_status_kb("VmRSS")
+    started = time.perf_counter()
+    data = image_pipeline.BACKENDS[backend](path, os.path.getsize(path))
+    elapsed = time.perf_counter() - started
+    peak = _proc_status_kb("VmHWM")
+    return elapsed, max(0, peak - baseline), len(data)
+
+
+def _file_sources(directory: Path):
+    for path in sorted(directory.iterdir()):
+        if path.suffix.lower() in (".jpg", ".jpeg", ".png", ".webp"):
+            yield path.name, path.read_bytes()
+
+
+def _psnr(reference, data: bytes) -> float:
+    from PIL import ImageChops, ImageStat
+
+    with Image.open(io.BytesIO(data)) as decoded:
+        diff = ImageChops.difference(reference, decoded.convert("RGB"))
+    mse = sum(rms * rms for rms in ImageStat.Stat(diff).rms) / 3.0
+    return float("inf") if mse == 0 else 10 * math.log10(255.0 * 255.0 / mse)
+
+
+class _CountingEncoder:
+    def __init__(self, img):
+        self.img = img
+        self.calls = 0
+
+    def __call__(self, q):
+        self.calls += 1
+        return image_pipeline._jpeg_save_size_pillow(self.img, q)
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark the upload image pipeline: JPEG quality search (bisection vs "
+        "proxy-calibrated), full vs reduced (draft/reduce) decode of large sources, "
+        "or Pillow vs pyvips compression backends."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--mode",
+            choices=("quality", "decode", "backends"),
+            default="quality",
+            help="quality: JPEG quality search; decode: full vs reduced (draft) decode, "
+            "time and peak RSS per upload; backends: Pillow vs pyvips throughput, "
+            "peak RSS and output size",
+        )
+        parser.add_argument("--dir", help="Directory with sample images (default: synthetic set)")
+        parser.add_argument("--repeat", type=int, default=3, help="Runs per image (median CPU time)")
+
+    def _run(self, fn, repeat):
+        timings, result = [], None
+        for _ in range(repeat):
+            started = time.process_time()
+            result = fn()
+            timings.append(time.process_time() - started)
+        timings.sort()
+        return timings[len(timings) // 2], result
+
+    def handle(self, *args, **opts):
+        if not hasattr(Image, "effect_noise"):
+            raise CommandError("Pillow is required for bench_images")
+        repeat = max(1, opts["repeat"])
+        if opts["dir"]:
+            directory = Path(opts["dir"])
+            if not directory.is_dir():
+                raise CommandError(f"Not a directory: {directory}")
+            sources = list(_file_sources(directory))
+        elif opts["mode"] in ("decode", "backends"):
+            sources = list(_large_sources())
+        else:
+            sources = list(_synthetic_sources())
+
+        if opts["mode"] == "decode":
+            self._bench_decode(sources, repeat)
+        elif opts["mode"] == "backends":
+            self._bench_backends(sources, repeat)
+        else:
+            self._bench_quality(sources, repeat)
+
+    def _bench_decode(self, sources, repeat):
+        # Каждый замер — в свежем процессе (spawn), иначе пиковый RSS копится.
+        ctx = multiprocessing.get_context("spawn")
+        self.stdout.write(
+            f"{'image':<16} {'decode':<8} {'ms':>9} {'peak rss MB':>12} {'size':>11} {'bytes':>10}"
+        )
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, orig in sources:
+                path = os.path.join(tmp, "source.bin")
+                with open(path, "wb") as fh:
+                    fh.write(orig)
+                for label, reduced in (("full", False), ("reduced", True)):
+                    runs = []
+                    for _ in range(repeat):
+                        with ctx.Pool(1) as pool:
+                            runs.append(pool.apply(_decode_probe, (path, reduced)))
+                    runs.sort(key=lambda run: run[0])
+                    elapsed, rss_kb, size, length = runs[len(runs) // 2]
+                    self.stdout.write(
+                        f"{name[:16]:<16} {label:<8} {elapsed * 1000:>9.1f} {rss_kb / 1024:>12.1f} "
+                        f"{size[0]:>5}x{size[1]:<5} {length:>10}"
+                    )
+
+    def _bench_backends(self, sources, repeat):
+        backends = image_pipeline.available_backends()
+        missing = sorted(set(image_pipeline.BACKENDS) - set(backends))
+        if missing:
+            self.stdout.write(f"unavailable: {', '.join(missing)}")
+        ctx = multiprocessing.get_context("spawn")
+        self.stdout.write(
+            f"{'image':<16} {'backend':<8} {'ms':>9} {'MP/s':>7} {'peak rss MB':>12} {'bytes':>10}"
+        )
+        totals = {backend: [0.0, 0] for backend in backends}
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, orig in sources:
+                path = os.path.join(tmp, "source.bin")
+                with open(path, "wb") as fh:
+                    fh.write(orig)
+                with Image.open(path) as probe:
+                    megapixels = probe.size[0] * probe.size[1] / 1e6
+                for backend in backends:
+                    runs = []
+                    for _ in range(repeat):
+                        with ctx.Pool(1) as pool:
+                            runs.append(pool.apply(_backend_probe, (path, backend)))
+                    runs.sort(key=lambda run: run[0])
+                    elapsed, rss_kb, length = runs[len(runs) // 2]
+                    totals[backend][0] += elapsed
+                    totals[backend][1] += 1
+                    self.stdout.write(
+                        f"{name[:16]:<16} {backend:<8} {elapsed * 1000:>9.1f} "
+                        f"{megapixels / elapsed:>7.1f} {rss_kb / 1024:>12.1f} {length:>10}"
+                    )
+
+        summary = ", ".join(
+            f"{backend} {count / elapsed:.2f} images/s"
+            for backend, (elapsed, count) in totals.items()
+            if elapsed
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"throughput: {summary}; selected backend: {image_pipeline.current_backend()}"
+            )
+        )
+
+    def _bench_quality(self, sources, repeat):
+        self.stdout.write(
+            f"{'image':<16} {'method':<8} {'encodes':>7} {'cpu ms':>9} {'q':>3} "
+            f"{'bytes':>10} {'target':>10} {'psnr':>6}"
+        )
+        total = {"bisect": 0.0, "proxy": 0.0}
+        for name, orig in sources:
+            with Image.open(io.BytesIO(orig)) as opened:
+                img = image_pipeline._resize_max_side_pillow(opened.convert("RGB"))
+            target = image_pipeline._target_size(len(orig))
+
+            def bisect():
+                encoder = _CountingEncoder(img)
+                data, q = image_pipeline._search_quality(encoder, target)
+                return data, q, encoder.calls
+
+            def proxy():
+                encoder = _CountingEncoder(img)
+                proxy_img, scale = image_pipeline._proxy_image(img)
+                data, q = image_pipeline._search_quality(
+                    encoder,
+                    target,
+                    proxy_fn=(
+                        (lambda q: image_pipeline._jpeg_save_size_pillow(proxy_img, q))
+                        if proxy_img is not None
+                        else None
+                    ),
+                    proxy_scale=scale,
+                )
+                return data, q, encoder.calls
+
+            for method, fn in (("bisect", bisect), ("proxy", proxy)):
+                cpu, (data, q, calls) = self._run(fn, repeat)
+                total[method] += cpu
+                self.stdout.write(
+                    f"{name[:16]:<16} {method:<8} {calls:>7} {cpu * 1000:>9.1f} {q:>3} "
+                    f"{len(data):>10} {target:>10} {_psnr(img, data):>6.2f}"
+                )
+
+        if total["proxy"]:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f"total cpu: bisect {total['bisect'] * 1000:.0f} ms, "
+                    f"proxy {total['proxy'] * 1000:.0f} ms "
+                    f"(x{total['bisect'] / total['proxy']:.2f})"
+                )
+            )
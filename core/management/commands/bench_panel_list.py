@@ -0,0 +1,77 @@
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import Client
+from django.urls import reverse
+
+from core.models import Property
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark panel_list rendering: cold (empty cache) vs warm (row fragments cached). "
+        "Synthetic rows are created inside a transaction and rolled back."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--rows", type=int, default=500, help="Synthetic objects to create")
+        parser.add_argument("--repeat", type=int, default=5, help="Requests per measurement")
+
+    def _measure(self, client, url, repeat, clear):
+        timings = []
+        for _ in range(repeat):
+            if clear:
+                cache.clear()
+            started = time.perf_counter()
+            response = client.get(url)
+            timings.append(time.perf_counter() - started)
+            if response.status_code != 200:
+                raise RuntimeError(f"panel_list returned {response.status_code}")
+        timings.sort()
+        return timings[len(timings) // 2]
+
+    def handle(self, *args, **opts):
+        rows, repeat = max(1, opts["rows"]), max(1, opts["repeat"])
+        client = Client()
+        url = reverse("panel_list")
+
+        with transaction.atomic():
+            Property.objects.bulk_create(
+                [
+                    Property(
+                        external_id=f"BENCH{i:06d}",
+                        category="flat",
+                        operation="sale",
+                        address=f"г. Новокузнецк, ул. Тестовая, {i}",
+                        flat_number=str(i % 120),
+                        floor_number=i % 9 + 1,
+                        building_floors=9,
+                        price=Decimal(1_000_000 + i * 1000),
+                    )
+                    for i in range(rows)
+                ]
+            )
+
+            cold = self._measure(client, url, repeat, clear=True)
+            cache.clear()
+            client.get(url)  # прогрев фрагментов
+            warm = self._measure(client, url, repeat, clear=False)
+
+            # Одна правка инвалидирует только свою строку.
+            edited = Property.objects.filter(external_id__startswith="BENCH").first()
+            edited.price = Decimal(1)
+            edited.save(update_fields=["price", "updated_at"])
+            one_edit = self._measure(client, url, 1, clear=False)
+
+            transaction.set_rollback(True)
+        cache.clear()
+
+        self.stdout.write(f"rows={rows} repeat={repeat} (median)")
+        self.stdout.write(f"cold (no cache):   {cold * 1000:8.1f} ms")
+        self.stdout.write(f"warm (fragments):  {warm * 1000:8.1f} ms")
+        self.stdout.write(f"after one edit:    {one_edit * 1000:8.1f} ms")
+        if warm:
+            self.stdout.write(self.style.SUCCESS(f"speedup: x{cold / warm:.2f}"))
@@ -0,0 +1,74 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core import photo_store
+from core.models import Photo
+from core.utils import image_pipeline
+
+
+class Command(BaseCommand):
+    help = "Generate missing gallery thumbnails (Photo.variants) for already uploaded photos."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max", type=int, default=0, help="Max photos to process (0 = all)")
+        parser.add_argument(
+            "--force", action="store_true", help="Rebuild variants even if they already exist"
+        )
+
+    def handle(self, *args, **opts):
+        qs = Photo.objects.exclude(image="").exclude(image=None).order_by("id")
+        if not opts["force"]:
+            # без производных законно остаются фото не шире самой мелкой копии —
+            # их ширина известна (Photo.width), и раскодировать их снова незачем
+            qs = qs.filter(variants="").filter(
+                Q(width__isnull=True)
+                | Q(width__gt=min(image_pipeline.THUMB_WIDTHS))
+                | ~Q(orientation=0)
+            )
+        if opts["max"]:
+            qs = qs[: opts["max"]]
+
+        processed = 0
+        for ph in qs.iterator():
+            if ph.orientation:
+                # поворот пересобирает производные из уже повёрнутого файла
+                try:
+                    photo_store.apply_orientation(ph)
+                except Exception as exc:
+                    self.stderr.write(f"Skip {ph.id}: {exc}")
+                    continue
+                processed += 1
+                self.stdout.write(f"OK {ph.id} (rotated)")
+                continue
+            field_file = ph.image
+            try:
+                field_file.open("rb")
+                orig = field_file.read()
+            except Exception as exc:
+                self.stderr.write(f"Skip {ph.id}: {exc}")
+                continue
+            finally:
+                try:
+                    field_file.close()
+                except Exception:
+                    pass
+
+            try:
+                img = image_pipeline.decode_for_target(orig)
+            except image_pipeline.InvalidImage as exc:
+                self.stderr.write(f"Skip {ph.id}: {exc}")
+                continue
+
+            variants = image_pipeline.make_derivatives(img)
+            if not variants:
+                # картинка уже меньше самой мелкой копии — отдаём основной файл;
+                # с заполненной шириной следующий запуск её не выберет
+                if ph.width is None:
+                    Photo.objects.filter(image=ph.image.name).update(**Photo.file_meta(orig))
+                self.stdout.write(f"Small {ph.id}")
+                continue
+            ph.store_variants(variants)
+            processed += 1
+            self.stdout.write(f"OK {ph.id}")
+
+        self.stdout.write(self.style.SUCCESS(f"Variants built: {processed}"))
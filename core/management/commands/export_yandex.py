@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from core.models import Property
+from core import photo_store
+from core.models import Photo, Property
 from xml.etree.ElementTree import Element, SubElement, ElementTree
 from pathlib import Path
 from datetime import datetime, timezone
@@ -12,7 +13,10 @@ def handle(self, *args, **kwargs):
         root = Element("realty-feed")
         SubElement(root, "generation-date").text = datetime.now(timezone.utc).isoformat()
         offers = SubElement(root, "offers")
-        for p in Property.objects.filter(is_published=True):
+        queryset = Property.objects.filter(is_published=True)
+        # отложенные повороты должны попасть в файлы до того, как площадка их заберёт
+        photo_store.apply_pending_orientations(Photo.objects.filter(property__in=queryset))
+        for p in queryset:
             offer = SubElement(offers, "offer", {"internal-id": p.external_id})
             SubElement(offer, "type").text = "продажа" if p.operation == "sale" else "аренда"
             SubElement(offer, "property-type").text = "жилая"
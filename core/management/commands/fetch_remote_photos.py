@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+
+from core import remote_photos
+
+
+class Command(BaseCommand):
+    help = (
+        "Download photos added by URL (Photo.full_url) through the upload compression "
+        "pipeline and keep local copies; re-checks use conditional requests (ETag/Last-Modified)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max", type=int, default=0, help="Max photos to check (0 = all due)")
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=remote_photos.FETCH_CONCURRENCY,
+            help="Simultaneous downloads",
+        )
+        parser.add_argument(
+            "--timeout",
+            type=float,
+            default=remote_photos.FETCH_TIMEOUT,
+            help="Seconds for connect and each read",
+        )
+        parser.add_argument(
+            "--force",
+            action="store_true",
+            help="Check every URL now and download unconditionally",
+        )
+
+    def handle(self, *args, **opts):
+        stats = remote_photos.ingest_remote_photos(
+            limit=opts["max"] or None,
+            concurrency=opts["concurrency"],
+            timeout=opts["timeout"],
+            force=opts["force"],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Stored: {stats['stored']}, not modified: {stats['not_modified']}, "
+                f"unchanged: {stats['unchanged']}, failed: {stats['failed']}"
+            )
+        )
@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from core import photo_similar
+from core.models import Photo
+
+
+class Command(BaseCommand):
+    help = (
+        "Report duplicate and near-duplicate photos (perceptual dHash within a Hamming "
+        "distance) inside listings and across the catalogue."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--distance",
+            type=int,
+            default=photo_similar.DEFAULT_MAX_DISTANCE,
+            help="Max differing bits of the 64-bit dHash (0 = identical hash only)",
+        )
+        parser.add_argument("--property", type=int, help="Only photos of this listing")
+        parser.add_argument(
+            "--cross-listing",
+            action="store_true",
+            help="Only groups that span more than one listing",
+        )
+        parser.add_argument("--json", action="store_true", help="Machine-readable output")
+
+    def handle(self, *args, **opts):
+        qs = Photo.objects.all()
+        if opts["property"]:
+            qs = qs.filter(property_id=opts["property"])
+        groups = photo_similar.duplicate_groups(qs, max(0, opts["distance"]))
+        if opts["cross_listing"]:
+            groups = [g for g in groups if len({ph.property_id for ph in g}) > 1]
+
+        if opts["json"]:
+            payload = [
+                [
+                    {"id": ph.id, "property_id": ph.property_id, "dhash": ph.dhash, "src": ph.src}
+                    for ph in group
+                ]
+                for group in groups
+            ]
+            self.stdout.write(json.dumps(payload, ensure_ascii=False))
+            return
+
+        redundant = 0
+        for idx, group in enumerate(groups, 1):
+            redundant += len(group) - 1
+            listings = len({ph.property_id for ph in group})
+            self.stdout.write(f"Group {idx}: {len(group)} photos in {listings} listing(s)")
+            for ph in group:
+                self.stdout.write(
+                    f"  #{ph.id} property {ph.property_id} «{ph.property.title}» {ph.dhash} {ph.src}"
+                )
+        self.stdout.write(
+            self.style.SUCCESS(f"Groups: {len(groups)}, redundant photos: {redundant}")
+        )
@@ -0,0 +1,120 @@
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from core.models import Photo, PhotoCleanup, PhotoJob
+from core.utils import image_pipeline
+
+
+def scan_files(root: str, base: str, older_than: float):
+    """Файлы под root (рекурсивно, os.scandir) старше older_than: (имя от base, размер)."""
+
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            entries = os.scandir(current)
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if not entry.is_file(follow_symlinks=False):
+                        continue
+                    stat = entry.stat(follow_symlinks=False)
+                except OSError:
+                    continue
+                if stat.st_mtime > older_than:
+                    continue  # свежий файл: загрузка могла ещё не дойти до БД
+                name = os.path.relpath(entry.path, base).replace(os.sep, "/")
+                yield name, stat.st_size
+
+
+def referenced_names() -> set[str]:
+    """Все имена файлов, на которые ссылается БД (фото, их производные, очереди)."""
+
+    names = set()
+    rows = Photo.objects.exclude(image="").exclude(image=None).values_list("image", "variants")
+    for name, variants in rows.iterator(chunk_size=2000):
+        names.add(name)
+        names.update(
+            image_pipeline.variant_name(name, key) for key in (variants or "").split(",") if key
+        )
+    # исходники в очереди обработки и файлы, которые ещё сотрёт sweep_cleanup
+    names.update(PhotoJob.objects.exclude(source="").values_list("source", flat=True).iterator())
+    names.update(PhotoCleanup.objects.values_list("name", flat=True).iterator())
+    return names
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        return True
+    except OSError:
+        return False
+    return True
+
+
+class Command(BaseCommand):
+    help = (
+        "Find files under MEDIA_ROOT/photos that no Photo, variant or queued job references "
+        "and delete them (or only report with --dry-run)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only report orphans, do not delete"
+        )
+        parser.add_argument(
+            "--min-age-hours",
+            type=float,
+            default=24.0,
+            help="Ignore files modified more recently than this (in-flight uploads)",
+        )
+        parser.add_argument("--dir", default="photos", help="Subdirectory of MEDIA_ROOT to scan")
+        parser.add_argument("--workers", type=int, default=8, help="Parallel deletions (threads)")
+        parser.add_argument("--verbose-list", action="store_true", help="Print every orphan name")
+
+    def handle(self, *args, **opts):
+        base = os.path.abspath(str(settings.MEDIA_ROOT))
+        root = os.path.join(base, opts["dir"])
+        if not os.path.isdir(root):
+            raise CommandError(f"Not a directory: {root}")
+
+        started = time.perf_counter()
+        older_than = time.time() - max(0.0, opts["min_age_hours"]) * 3600
+        # ссылки читаются до обхода: файл, сохранённый после этого момента, моложе min-age
+        referenced = referenced_names()
+        sizes = dict(scan_files(root, base, older_than))
+        orphans = sorted(sizes.keys() - referenced)
+        orphan_bytes = sum(sizes[name] for name in orphans)
+
+        if opts["verbose_list"] or opts["dry_run"]:
+            for name in orphans:
+                self.stdout.write(name)
+
+        summary = (
+            f"Scanned: {len(sizes)} files, referenced: {len(referenced)}, "
+            f"orphans: {len(orphans)} ({orphan_bytes / 1048576:.1f} MB)"
+        )
+        if opts["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"{summary}; dry run, nothing deleted"))
+            return
+
+        workers = max(1, opts["workers"])
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="gc-media") as pool:
+            results = list(pool.map(_remove, (os.path.join(base, name) for name in orphans)))
+        failed = results.count(False)
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"{summary}; deleted: {len(orphans) - failed}, failed: {failed} in {elapsed:.1f}s"
+            )
+        )
@@ -4,7 +4,8 @@
 from django.core.management.base import BaseCommand
 
 from core.cian import build_cian_feed_xml
-from core.models import Property
+from core import photo_store
+from core.models import Photo, Property
 
 
 class Command(BaseCommand):
@@ -24,6 +25,7 @@ def handle(self, *args, **options):
             .prefetch_related("photos")
         )
 
+        photo_store.apply_pending_orientations(Photo.objects.filter(property__in=queryset))
         xml_bytes = build_cian_feed_xml(queryset)
 
         feeds_dir = Path(settings.MEDIA_ROOT) / "feeds"
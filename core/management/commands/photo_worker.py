@@ -0,0 +1,86 @@
+import logging
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from core import photo_jobs, photo_store
+
+log = logging.getLogger("upload")
+
+ROTATION_BATCH = 20
+CLEANUP_BATCH = 200
+
+
+class Command(BaseCommand):
+    help = (
+        "Process queued photo uploads (PhotoJob) with the regular compression pipeline; "
+        "apply pending panel rotations and delete files of bulk-deleted photos when "
+        "the queue is idle."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--once",
+            action="store_true",
+            help="Drain the queue and exit instead of polling forever.",
+        )
+        parser.add_argument(
+            "--sleep", type=float, default=2.0, help="Seconds to wait when the queue is empty"
+        )
+        parser.add_argument(
+            "--max-jobs", type=int, default=0, help="Exit after N jobs (0 = unlimited)"
+        )
+        parser.add_argument(
+            "--stale-minutes",
+            type=int,
+            default=10,
+            help="Requeue jobs stuck in 'processing' longer than this (crashed worker)",
+        )
+
+    def handle(self, *args, **opts):
+        done = failed = 0
+        stale_after = timedelta(minutes=max(1, opts["stale_minutes"]))
+        requeued = photo_jobs.requeue_stale_jobs(stale_after)
+        if requeued:
+            self.stdout.write(f"Requeued stale jobs: {requeued}")
+
+        while True:
+            job = photo_jobs.claim_next_job()
+            if job is None:
+                # свободное время — на отложенные повороты из панели и удаление файлов
+                rotated = photo_store.apply_pending_orientations(limit=ROTATION_BATCH)
+                if rotated:
+                    self.stdout.write(f"Rotated: {rotated}")
+                    continue
+                swept = photo_store.sweep_cleanup(limit=CLEANUP_BATCH)
+                if swept:
+                    self.stdout.write(f"Files deleted: {swept}")
+                    continue
+                if opts["once"]:
+                    break
+                close_old_connections()
+                time.sleep(max(0.1, opts["sleep"]))
+                photo_jobs.requeue_stale_jobs(stale_after)
+                continue
+
+            try:
+                ok = photo_jobs.process_job(job)
+            except Exception as exc:
+                log.exception("photo_worker: job %s crashed", job.pk)
+                photo_jobs.mark_failed(job, photo_jobs.UNEXPECTED_ERROR_MESSAGE)
+                self.stderr.write(f"FAIL {job.pk}: {exc}")
+                ok = False
+
+            if ok:
+                done += 1
+                self.stdout.write(f"OK {job.pk}")
+            else:
+                failed += 1
+                self.stdout.write(f"FAIL {job.pk}")
+
+            if opts["max_jobs"] and done + failed >= opts["max_jobs"]:
+                break
+
+        self.stdout.write(self.style.SUCCESS(f"Processed: {done}, failed: {failed}"))
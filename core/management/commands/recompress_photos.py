@@ -1,100 +1,227 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from io import BytesIO
 from pathlib import Path
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.management.base import BaseCommand
 
 from core.models import Photo
+from core.utils import image_pipeline
 
-try:
-    from PIL import Image, ImageFile
-except ImportError as exc:  # pragma: no cover - Pillow is required in production
-    raise RuntimeError("Pillow is required for recompress_photos") from exc
-
-ImageFile.LOAD_TRUNCATED_IMAGES = True
+DEFAULT_MAX_BPP = image_pipeline.PASSTHROUGH_MAX_BPP  # тот же порог, что и при загрузке
 
 
 def encode_jpeg_to_target(img, base_name: str, orig_bytes: bytes) -> ContentFile:
     target = max(150 * 1024, (len(orig_bytes) // 5) if orig_bytes else 150 * 1024)
-    lo, hi = 65, 90
-    best_buf = None
-    while lo <= hi:
-        q = (lo + hi) // 2
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=q, optimize=True, progressive=True)
-        size = buf.tell()
-        if size <= target:
-            best_buf = buf
-            lo = q + 1
-        else:
-            hi = q - 1
-    if best_buf is None:
-        best_buf = BytesIO()
-        img.save(best_buf, format="JPEG", quality=75, optimize=True, progressive=True)
-    best_buf.seek(0)
+    data, _q = image_pipeline.encode_jpeg_to_target(img, target, 65, 90)
+    if len(data) > target:
+        data = image_pipeline._jpeg_save_size_pillow(img, 75)
     safe_base = base_name or "photo"
-    return ContentFile(best_buf.read(), name=f"{safe_base}.jpg")
+    return ContentFile(data, name=f"{safe_base}.jpg")
 
 
-class Command(BaseCommand):
-    help = "Recompress existing photos to ~1/5 size with minimal quality loss."
+def within_bounds(orig: bytes, max_bpp: float) -> bool:
+    """JPEG уже не больше MAX_SIDE и достаточно сжат — перекодировать незачем.
 
-    def add_arguments(self, parser):
-        parser.add_argument("--max", type=int, default=1000, help="Max photos to process")
+    Читается только заголовок (размеры), пиксели не декодируются.
+    """
 
-    def handle(self, *args, **opts):
-        qs = Photo.objects.exclude(image="").order_by("id")[: opts["max"]]
-        processed = 0
-        for ph in qs:
-            field_file = ph.image
-            if not field_file:
-                continue
-            try:
-                field_file.open("rb")
-                orig = field_file.read()
-            except Exception as exc:
-                self.stderr.write(f"Skip {ph.id}: {exc}")
-                continue
-            finally:
-                try:
-                    field_file.close()
-                except Exception:
-                    pass
+    try:
+        with image_pipeline.Image.open(BytesIO(orig)) as probe:
+            if probe.format != "JPEG":
+                return False
+            w, h = probe.size
+    except Exception:
+        return False
+    return image_pipeline.jpeg_within_bounds(w, h, len(orig), max_bpp)
 
-            if not orig:
-                self.stderr.write(f"Skip {ph.id}: empty file")
-                continue
 
-            try:
-                img = Image.open(BytesIO(orig)).convert("RGB")
-            except Exception as exc:
-                self.stderr.write(f"Skip {ph.id}: {exc}")
-                continue
+def meta_within_bounds(ph, max_bpp: float) -> bool:
+    """То же по сохранённым width/height/byte_size — без чтения файла."""
 
-            w, h = img.size
-            if max(w, h) > 2560:
-                ratio = 2560 / float(max(w, h))
-                img = img.resize((int(w * ratio), int(h * ratio)), Image.LANCZOS)
+    if ph.mime_type != "image/jpeg" or not (ph.width and ph.height and ph.byte_size):
+        return False
+    return image_pipeline.jpeg_within_bounds(ph.width, ph.height, ph.byte_size, max_bpp)
 
-            base = Path(field_file.name or "photo").stem or "photo"
-            try:
-                new_content = encode_jpeg_to_target(img, base, orig)
-            except Exception as exc:
-                self.stderr.write(f"Skip {ph.id}: {exc}")
-                continue
 
-            old_name = field_file.name or ""
-            new_name = str(Path(old_name or base).with_suffix(".jpg"))
+def _recompress(name, storage, max_bpp, force, known_ok=False):
+    """Выполняется в пуле: чтение, проверка границ, декодирование и кодирование (без БД)."""
+
+    if known_ok:
+        return "ok_already", 0, None
+    try:
+        with storage.open(name, "rb") as fh:
+            orig = fh.read()
+    except Exception as exc:
+        return "skip", str(exc), None
+    if not orig:
+        return "skip", "empty file", None
+    if not force and within_bounds(orig, max_bpp):
+        return "ok_already", len(orig), None
+    try:
+        img = image_pipeline.decode_for_target(orig)
+    except image_pipeline.InvalidImage as exc:
+        return "skip", str(exc), None
+    content = encode_jpeg_to_target(img, Path(name or "photo").stem, orig)
+    return "done", len(orig), (content, image_pipeline.make_derivatives(img))
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompress existing photos to ~1/5 size with minimal quality loss. "
+        "Streams the table, skips files already within bounds, encodes in a thread "
+        "pool and can resume from a checkpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max", type=int, default=1000, help="Max photos to process (0 = all)")
+        parser.add_argument(
+            "--workers",
+            type=int,
+            default=getattr(settings, "PHOTO_UPLOAD_WORKERS", 1),
+            help="Parallel encodes (threads; Pillow releases the GIL)",
+        )
+        parser.add_argument("--since-id", type=int, default=None, help="Start after this photo id")
+        parser.add_argument(
+            "--checkpoint",
+            default="",
+            help="File with the last processed id: read on start, updated while running",
+        )
+        parser.add_argument(
+            "--max-bpp",
+            type=float,
+            default=DEFAULT_MAX_BPP,
+            help="Skip JPEGs within MAX_SIDE at or below this many bits per pixel",
+        )
+        parser.add_argument(
+            "--force", action="store_true", help="Recompress even files already within bounds"
+        )
+
+    def _read_checkpoint(self, path):
+        try:
+            with open(path, encoding="utf-8") as fh:
+                return int(fh.read().strip() or 0)
+        except (OSError, ValueError):
+            return None
+
+    def _write_checkpoint(self, path, last_id):
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as fh:
+            fh.write(str(last_id))
+        os.replace(tmp, path)
+
+    def _store(self, ph, content, variants):
+        """Записать новый файл; все фото с тем же (общим) файлом переводятся на него."""
+
+        storage = ph.image.storage
+        old_name = ph.image.name
+        old_variants = ph.variant_keys()
+        meta = Photo.file_meta(content.read())
+        content.seek(0)
+        new_name = storage.save(str(Path(old_name).with_suffix(".jpg")), content)
+        ph.image.name = new_name
+        # a.png → a.jpg: производные у обоих имён одни и те же (a.w320.jpg)
+        same_root = Path(old_name).with_suffix("") == Path(new_name).with_suffix("")
+        written = ph._write_variant_files(variants, owned=old_variants if same_root else ())
+        Photo.objects.filter(image=old_name).update(
+            image=new_name, variants=",".join(written), **meta
+        )
+        for key in old_variants:
+            if same_root and key in written:
+                continue
+            try:
+                storage.delete(image_pipeline.variant_name(old_name, key))
+            except Exception:
+                pass
+        if old_name != new_name:
             try:
-                ph.image.save(new_name, new_content, save=True)
-                if new_name != old_name and old_name:
-                    try:
-                        field_file.storage.delete(old_name)
-                    except Exception:
-                        pass
-                processed += 1
-                self.stdout.write(f"OK {ph.id}")
-            except Exception as exc:
-                self.stderr.write(f"Skip {ph.id}: {exc}")
-
-        self.stdout.write(self.style.SUCCESS(f"Recompressed: {processed}"))
+                storage.delete(old_name)
+            except Exception:
+                pass
+
+    def handle(self, *args, **opts):
+        checkpoint = opts["checkpoint"]
+        since_id = opts["since_id"]
+        if since_id is None and checkpoint:
+            since_id = self._read_checkpoint(checkpoint)
+            if since_id:
+                self.stdout.write(f"Resuming after id {since_id}")
+
+        qs = Photo.objects.exclude(image="").exclude(image=None).order_by("id")
+        if since_id:
+            qs = qs.filter(id__gt=since_id)
+        if opts["max"]:
+            qs = qs[: opts["max"]]
+        qs = qs.only("id", "image", "variants", "width", "height", "byte_size", "mime_type")
+
+        workers = max(1, opts["workers"])
+        stats = {"done": 0, "ok_already": 0, "shared": 0, "skip": 0}
+        totals = {"before": 0, "after": 0}
+        seen_names = set()
+        started = time.perf_counter()
+
+        def consume(ph, future):
+            status, detail, payload = future.result()
+            if status == "skip":
+                stats["skip"] += 1
+                self.stderr.write(f"Skip {ph.id}: {detail}")
+            elif status == "ok_already":
+                stats["ok_already"] += 1
+            else:
+                content, variants = payload
+                try:
+                    self._store(ph, content, variants)
+                except Exception as exc:
+                    stats["skip"] += 1
+                    self.stderr.write(f"Skip {ph.id}: {exc}")
+                else:
+                    stats["done"] += 1
+                    totals["before"] += detail
+                    totals["after"] += content.size
+                    self.stdout.write(f"OK {ph.id}")
+            if checkpoint:
+                self._write_checkpoint(checkpoint, ph.id)
+
+        # Результаты забираются строго по порядку id: чекпоинт — последний
+        # забранный id, и после остановки ничего не теряется и не повторяется.
+        in_flight = deque()
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="recompress") as pool:
+            for ph in qs.iterator(chunk_size=500):
+                if ph.image.name in seen_names:
+                    # общий (дедуплицированный) файл уже перекодирован вместе с первым фото
+                    stats["shared"] += 1
+                    continue
+                seen_names.add(ph.image.name)
+                future = pool.submit(
+                    _recompress,
+                    ph.image.name,
+                    ph.image.storage,
+                    opts["max_bpp"],
+                    opts["force"],
+                    not opts["force"] and meta_within_bounds(ph, opts["max_bpp"]),
+                )
+                in_flight.append((ph, future))
+                if len(in_flight) >= workers * 2:
+                    consume(*in_flight.popleft())
+            while in_flight:
+                consume(*in_flight.popleft())
+
+        elapsed = time.perf_counter() - started
+        checked = sum(stats.values())
+        rate = checked / elapsed if elapsed else 0.0
+        self.stdout.write(
+            f"Checked: {checked} in {elapsed:.1f}s ({rate:.1f} photos/s, workers={workers}); "
+            f"within bounds: {stats['ok_already']}, shared: {stats['shared']}, "
+            f"skipped: {stats['skip']}"
+        )
+        before, after = totals["before"], totals["after"]
+        if before:
+            self.stdout.write(
+                f"Bytes: {before / 1048576:.1f} MB -> {after / 1048576:.1f} MB, "
+                f"saved {(before - after) / 1048576:.1f} MB ({(before - after) * 100.0 / before:.0f}%)"
+            )
+        self.stdout.write(self.style.SUCCESS(f"Recompressed: {stats['done']}"))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from core import photo_store
+from core.models import PhotoCleanup
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete files of bulk-deleted photos queued in PhotoCleanup "
+        "(photo_worker does the same when idle; use this from cron without the worker)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--max", type=int, default=0, help="Max queue entries to process (0 = all)")
+
+    def handle(self, *args, **opts):
+        queued = PhotoCleanup.objects.count()
+        removed = photo_store.sweep_cleanup(limit=opts["max"] or None)
+        self.stdout.write(self.style.SUCCESS(f"Queued: {queued}, files deleted: {removed}"))
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0010_property_room_area"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("is_archived", False)), fields=["updated_at"], name="prop_active_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("is_archived", False)), fields=["created_at"], name="prop_active_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("is_archived", False)), fields=["category", "operation", "updated_at"], name="prop_active_cat_op_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("is_archived", False)), fields=["price"], name="prop_active_price_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("is_archived", False)), fields=["total_area"], name="prop_active_area_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("is_archived", True)), fields=["updated_at"], name="prop_archived_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(fields=["updated_at"], name="prop_updated_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("export_to_cian", True), ("is_archived", False)), fields=["id"], name="prop_export_cian_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="property",
+            index=models.Index(condition=models.Q(("export_to_domklik", True), ("is_archived", False)), fields=["id"], name="prop_export_dom_idx"),
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:51
+
+from django.db import migrations, models
+
+# Копия core.geo.geohash_encode на момент миграции: исторические миграции не
+# должны зависеть от живого кода, который может поменяться.
+GEOHASH_ALPHABET = "0123456789bcdefghjkmnpqrstuvwxyz"
+GEOHASH_PRECISION = 9
+
+
+def geohash_encode(lat, lng, precision=GEOHASH_PRECISION):
+    lat = float(lat)
+    lng = float(lng)
+    lat_lo, lat_hi = -90.0, 90.0
+    lng_lo, lng_hi = -180.0, 180.0
+    chars = []
+    bits = 0
+    bit_count = 0
+    even = True  # чётные биты — долгота
+    while len(chars) < precision:
+        if even:
+            mid = (lng_lo + lng_hi) / 2
+            if lng >= mid:
+                bits = (bits << 1) | 1
+                lng_lo = mid
+            else:
+                bits <<= 1
+                lng_hi = mid
+        else:
+            mid = (lat_lo + lat_hi) / 2
+            if lat >= mid:
+                bits = (bits << 1) | 1
+                lat_lo = mid
+            else:
+                bits <<= 1
+                lat_hi = mid
+        even = not even
+        bit_count += 1
+        if bit_count == 5:
+            chars.append(GEOHASH_ALPHABET[bits])
+            bits = 0
+            bit_count = 0
+    return "".join(chars)
+
+
+def fill_geo_cell(apps, schema_editor):
+    Property = apps.get_model("core", "Property")
+    rows = Property.objects.exclude(lat=None).exclude(lng=None).only("id", "lat", "lng")
+    batch = []
+    for prop in rows.iterator():
+        prop.geo_cell = geohash_encode(prop.lat, prop.lng)
+        batch.append(prop)
+        if len(batch) >= 500:
+            Property.objects.bulk_update(batch, ["geo_cell"])
+            batch = []
+    if batch:
+        Property.objects.bulk_update(batch, ["geo_cell"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0011_property_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="property",
+            name="geo_cell",
+            field=models.CharField(
+                blank=True,
+                db_index=True,
+                default="",
+                editable=False,
+                help_text="Заполняется автоматически из lat/lng, см. core.geo",
+                max_length=12,
+                verbose_name="Геоячейка (geohash)",
+            ),
+        ),
+        migrations.RunPython(fill_geo_cell, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.7 on 2026-10-19 06:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0012_property_geo_cell"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PhotoJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("source", models.FileField(max_length=255, upload_to="photos/incoming/%Y/%m/%d")),
+                ("original_name", models.CharField(blank=True, max_length=255)),
+                ("content_type", models.CharField(blank=True, max_length=100)),
+                ("make_default", models.BooleanField(default=False)),
+                ("sort", models.PositiveIntegerField(default=0)),
+                ("status", models.CharField(choices=[("pending", "В очереди"), ("processing", "Обрабатывается"), ("failed", "Ошибка")], default="pending", max_length=12)),
+                ("error", models.CharField(blank=True, max_length=255)),
+                ("attempts", models.PositiveSmallIntegerField(default=0)),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("property", models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name="photo_jobs", to="core.property")),
+            ],
+            options={
+                "ordering": ["id"],
+                "indexes": [models.Index(fields=["status", "id"], name="photojob_status_idx")],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_photojob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='variants',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Ключи уменьшенных копий рядом с image (w320.jpg,…), см. image_pipeline', max_length=255, verbose_name='Производные файлы'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0014_photo_variants'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='source_hash',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Одинаковые загрузки ссылаются на один файл, см. core.photo_store', max_length=64, verbose_name='sha256 исходника'),
+        ),
+    ]
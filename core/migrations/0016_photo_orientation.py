@@ -0,0 +1,22 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_photo_source_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='orientation',
+            field=models.PositiveSmallIntegerField(choices=[(0, '0°'), (90, '90°'), (180, '180°'), (270, '270°')], default=0, help_text='Ещё не применённый к файлу поворот, см. photo_store.apply_orientation', verbose_name='Поворот (по часовой)'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(condition=models.Q(('orientation', 0), _negated=True), fields=['id'], name='photo_rotation_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_photo_orientation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='byte_size',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True, verbose_name='Размер файла, байт'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='content_hash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Хеш сохранённого (сжатого) файла, в отличие от source_hash', max_length=64, verbose_name='sha256 файла'),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='mime_type',
+            field=models.CharField(blank=True, default='', editable=False, max_length=32),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, editable=False, null=True),
+        ),
+    ]
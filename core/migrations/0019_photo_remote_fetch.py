@@ -0,0 +1,33 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_photo_cleanup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='remote_checked_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='remote_etag',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='remote_last_modified',
+            field=models.CharField(blank=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='remote_status',
+            field=models.PositiveSmallIntegerField(blank=True, editable=False, help_text='HTTP-код последней проверки (0 — сеть/таймаут), см. core.remote_photos', null=True, verbose_name='Ответ по full_url'),
+        ),
+    ]
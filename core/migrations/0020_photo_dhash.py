@@ -0,0 +1,18 @@
+# Generated by Django 5.2.7 on 2026-10-19 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_photo_remote_fetch'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='dhash',
+            field=models.CharField(blank=True, default='', editable=False, help_text='dHash файла для поиска похожих фото, см. core.photo_similar', max_length=16, verbose_name='Перцептивный хеш'),
+        ),
+    ]
@@ -1,12 +1,21 @@
 # core/models.py
 import builtins
+import contextlib
+import hashlib
+import logging
 import random
+import threading
 
+from django.core.files.base import ContentFile
 from django.db import models
 from django.db.models.signals import post_delete, pre_save
 from django.dispatch import receiver
 from django.utils import timezone
 
+from .geo import geohash_encode
+
+log = logging.getLogger("upload")
+
 
 def gen_external_id():
     """
@@ -167,6 +176,15 @@ class Property(models.Model):
     address = models.CharField("Адрес (как на Я.Картах)", max_length=255, blank=True)
     lat = models.DecimalField("Широта", max_digits=9, decimal_places=6, null=True, blank=True)
     lng = models.DecimalField("Долгота", max_digits=9, decimal_places=6, null=True, blank=True)
+    geo_cell = models.CharField(
+        "Геоячейка (geohash)",
+        max_length=12,
+        blank=True,
+        default="",
+        db_index=True,
+        editable=False,
+        help_text="Заполняется автоматически из lat/lng, см. core.geo",
+    )
     cadastral_number = models.CharField("Кадастровый номер", max_length=64, blank=True)
 
     phone_country = models.CharField(
@@ -332,6 +350,58 @@ class Property(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        # Индексы под реальные пути доступа. Django рендерит булевы фильтры как
+        # `NOT "is_archived"` / `"export_to_cian"`, а не `= 0`, поэтому ведущая
+        # булева колонка в составном индексе SQLite не помогает — используем
+        # частичные индексы с тем же условием, что и в запросах.
+        indexes = [
+            # panel_list: рабочий список (не архив) + фильтры/сортировки core.filters
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(is_archived=False),
+                name="prop_active_updated_idx",
+            ),
+            models.Index(
+                fields=["created_at"],
+                condition=models.Q(is_archived=False),
+                name="prop_active_created_idx",
+            ),
+            models.Index(
+                fields=["category", "operation", "updated_at"],
+                condition=models.Q(is_archived=False),
+                name="prop_active_cat_op_idx",
+            ),
+            models.Index(
+                fields=["price"],
+                condition=models.Q(is_archived=False),
+                name="prop_active_price_idx",
+            ),
+            models.Index(
+                fields=["total_area"],
+                condition=models.Q(is_archived=False),
+                name="prop_active_area_idx",
+            ),
+            # panel_list: архив и «все объекты»
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(is_archived=True),
+                name="prop_archived_updated_idx",
+            ),
+            models.Index(fields=["updated_at"], name="prop_updated_idx"),
+            # export_cian / export_domklik / generate_cian_feed: порядок по id
+            models.Index(
+                fields=["id"],
+                condition=models.Q(export_to_cian=True, is_archived=False),
+                name="prop_export_cian_idx",
+            ),
+            models.Index(
+                fields=["id"],
+                condition=models.Q(export_to_domklik=True, is_archived=False),
+                name="prop_export_dom_idx",
+            ),
+        ]
+
     def __str__(self):
         base = f"{self.get_category_display()} | {self.address or ''}".strip()
         return f"{base} [{self.external_id}]"
@@ -345,8 +415,21 @@ def save(self, *args, **kwargs):
                     break
             else:
                 raise ValueError("Не удалось сгенерировать уникальный external_id")
+        self.geo_cell = (
+            geohash_encode(self.lat, self.lng)
+            if self.lat is not None and self.lng is not None
+            else ""
+        )
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and {"lat", "lng"} & set(update_fields):
+            kwargs["update_fields"] = set(update_fields) | {"geo_cell"}
         super().save(*args, **kwargs)
 
+PHOTO_ORIENTATION_CHOICES = [(0, "0°"), (90, "90°"), (180, "180°"), (270, "270°")]
+# Сведения о сохранённом файле, которые пишутся вместе с ним (Photo.file_meta).
+PHOTO_FILE_META_FIELDS = ("width", "height", "byte_size", "mime_type", "content_hash", "dhash")
+
+
 class Photo(models.Model):
     property = models.ForeignKey(
         "Property", related_name="photos", on_delete=models.CASCADE
@@ -358,9 +441,71 @@ class Photo(models.Model):
     is_default = models.BooleanField(default=False)
     sort = models.PositiveIntegerField(default=0, db_index=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    variants = models.CharField(
+        max_length=255,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Производные файлы",
+        help_text="Ключи уменьшенных копий рядом с image (w320.jpg,…), см. image_pipeline",
+    )
+    source_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        db_index=True,
+        editable=False,
+        verbose_name="sha256 исходника",
+        help_text="Одинаковые загрузки ссылаются на один файл, см. core.photo_store",
+    )
+    orientation = models.PositiveSmallIntegerField(
+        choices=PHOTO_ORIENTATION_CHOICES,
+        default=0,
+        verbose_name="Поворот (по часовой)",
+        help_text="Ещё не применённый к файлу поворот, см. photo_store.apply_orientation",
+    )
+    width = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    height = models.PositiveIntegerField(null=True, blank=True, editable=False)
+    byte_size = models.PositiveIntegerField(
+        null=True, blank=True, editable=False, verbose_name="Размер файла, байт"
+    )
+    mime_type = models.CharField(max_length=32, blank=True, default="", editable=False)
+    content_hash = models.CharField(
+        max_length=64,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="sha256 файла",
+        help_text="Хеш сохранённого (сжатого) файла, в отличие от source_hash",
+    )
+    dhash = models.CharField(
+        max_length=16,
+        blank=True,
+        default="",
+        editable=False,
+        verbose_name="Перцептивный хеш",
+        help_text="dHash файла для поиска похожих фото, см. core.photo_similar",
+    )
+    remote_etag = models.CharField(max_length=255, blank=True, default="", editable=False)
+    remote_last_modified = models.CharField(max_length=64, blank=True, default="", editable=False)
+    remote_status = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        editable=False,
+        verbose_name="Ответ по full_url",
+        help_text="HTTP-код последней проверки (0 — сеть/таймаут), см. core.remote_photos",
+    )
+    remote_checked_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         ordering = ["-is_default", "sort", "id"]
+        indexes = [
+            models.Index(
+                fields=["id"],
+                condition=~models.Q(orientation=0),
+                name="photo_rotation_pending_idx",
+            ),
+        ]
 
     def __str__(self):
         if self.image:
@@ -369,30 +514,217 @@ def __str__(self):
             return self.full_url
         return f"Photo #{self.pk}" if self.pk else "Photo"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        if "image" in field_names:
+            # имя файла в БД — чтобы pre_save заметил замену без лишнего SELECT
+            instance._loaded_image_name = values[field_names.index("image")] or ""
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        if fields is None or "image" in fields:
+            self._loaded_image_name = self.image.name or ""
+
     def save(self, *args, **kwargs):
+        pending = self._pending_variants()
+        self._variants_fresh = pending is not None
+        if pending is not None:
+            self.variants = ",".join(pending)
+            self.set_file_meta(self._pending_data())
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                extra = {"variants", *PHOTO_FILE_META_FIELDS} - set(update_fields)
+                kwargs["update_fields"] = [*update_fields, *sorted(extra)]
         super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or "image" in update_fields:
+            self._loaded_image_name = self.image.name or ""
+        if pending:
+            written = self._write_variant_files(pending)
+            if len(written) != len(pending):
+                self.variants = ",".join(written)
+                Photo.objects.filter(pk=self.pk).update(variants=self.variants)
 
     def delete(self, using=None, keep_parents=False):
         super().delete(using=using, keep_parents=keep_parents)
 
-    def file_size_bytes(self):
+    def _pending_variants(self):
+        """Производные, приложенные конвейером к ещё не сохранённому файлу (None — файл не менялся)."""
+
+        image = self.image
+        if not image or getattr(image, "_committed", True):
+            return None
+        return dict(getattr(image.file, "derivatives", None) or {})
+
+    def _pending_data(self):
+        content = self.image.file
         try:
-            f = self.image
-            if not f:
-                return None
-            size = getattr(f, "size", None)
-            if size is None:
-                try:
-                    f.open("rb")
-                    size = f.size
-                finally:
-                    try:
-                        f.close()
-                    except Exception:
-                        pass
-            return int(size) if size is not None else None
+            content.seek(0)
         except Exception:
+            pass
+        data = content.read()
+        try:
+            content.seek(0)
+        except Exception:
+            pass
+        return data
+
+    @staticmethod
+    def file_meta(data):
+        """Значения PHOTO_FILE_META_FIELDS для байтов файла (размеры — по заголовку,
+        dHash — по draft-копии JPEG, это единицы миллисекунд)."""
+
+        from .utils.image_pipeline import dhash, image_info
+
+        width, height, mime_type = image_info(data) or (None, None, "")
+        return {
+            "width": width,
+            "height": height,
+            "byte_size": len(data),
+            "mime_type": mime_type,
+            "content_hash": hashlib.sha256(data).hexdigest(),
+            "dhash": dhash(data),
+        }
+
+    def set_file_meta(self, data):
+        meta = self.file_meta(data)
+        for field, value in meta.items():
+            setattr(self, field, value)
+        return meta
+
+    def read_file_meta(self):
+        """Прочитать текущий файл из хранилища и заполнить сведения (для backfill)."""
+
+        field_file = self.image
+        try:
+            field_file.open("rb")
+            data = field_file.read()
+        finally:
+            try:
+                field_file.close()
+            except Exception:
+                pass
+        return self.set_file_meta(data)
+
+    def _write_variant_files(self, variants, owned=()):
+        """Записать производные рядом с image; возвращает ключи, которые записаны.
+
+        Перезаписывается только файл из owned — производная, которую это фото
+        уже числит за собой. Любой другой файл с тем же именем (например,
+        загрузка, названная «a.w320.jpg») чужой: такой ключ пропускается.
+        """
+
+        from .utils.image_pipeline import variant_name
+
+        storage = self.image.storage
+        written = []
+        for key, data in variants.items():
+            name = variant_name(self.image.name, key)
+            try:
+                if storage.exists(name):
+                    if key not in owned:
+                        log.warning("photo %s: %s is taken, variant %s skipped", self.pk, name, key)
+                        continue
+                    storage.delete(name)
+                stored = storage.save(name, ContentFile(data))
+                if stored != name:  # имя заняли между exists() и save()
+                    storage.delete(stored)
+                    continue
+            except Exception:
+                log.exception("photo %s: failed to store variant %s", self.pk, key)
+                continue
+            written.append(key)
+        return written
+
+    def store_variants(self, variants):
+        """Записать производные для уже сохранённого image и обновить список (без save()).
+
+        Файл может быть общим (дедупликация) — список обновляется у всех ссылающихся фото.
+        """
+
+        owned = self.variant_keys()
+        stale = [key for key in owned if key not in variants]
+        self.delete_variant_files(stale, force=True)
+        written = self._write_variant_files(variants, owned=owned) if variants else []
+        self.variants = ",".join(written)
+        Photo.objects.filter(image=self.image.name).update(variants=self.variants)
+
+    def variant_keys(self):
+        return [key for key in (self.variants or "").split(",") if key]
+
+    @classmethod
+    def image_in_use(cls, name, exclude_pk=None):
+        """Ссылается ли ещё какое-нибудь фото на файл name (счётчик ссылок для удаления)."""
+
+        if not name:
+            return False
+        qs = cls.objects.filter(image=name)
+        if exclude_pk is not None:
+            qs = qs.exclude(pk=exclude_pk)
+        return qs.exists()
+
+    def delete_variant_files(self, keys=None, name=None, force=False):
+        from .utils.image_pipeline import variant_name
+
+        name = name or getattr(self.image, "name", None)
+        if not name:
+            return
+        if not force and Photo.image_in_use(name, exclude_pk=self.pk):
+            return
+        storage = self.image.storage
+        for key in self.variant_keys() if keys is None else keys:
+            try:
+                storage.delete(variant_name(name, key))
+            except Exception:
+                pass
+
+    def _variant_widths(self, ext):
+        from .utils.image_pipeline import parse_variant_key, variant_name
+
+        if not self.image or not self.image.name:
+            return []
+        found = []
+        for key in self.variant_keys():
+            parsed = parse_variant_key(key)
+            if parsed and parsed[1] == ext:
+                found.append((parsed[0], self.image.storage.url(variant_name(self.image.name, key))))
+        return sorted(found)
+
+    @builtins.property
+    def thumb_src(self):
+        """Самая маленькая копия для плитки галереи; без производных — основной файл."""
+
+        widths = self._variant_widths("jpg")
+        return widths[0][1] if widths else self.src
+
+    def _srcset(self, ext):
+        return ", ".join(f"{url} {width}w" for width, url in self._variant_widths(ext))
+
+    @builtins.property
+    def thumb_srcset(self):
+        return self._srcset("jpg")
+
+    @builtins.property
+    def display_sources(self):
+        """[(mime, srcset)] современных форматов для <source> в <picture> (без JPEG)."""
+
+        from .utils.image_pipeline import DISPLAY_FORMATS
+
+        sources = []
+        for ext, fmt, _options in DISPLAY_FORMATS:
+            srcset = self._srcset(ext)
+            if srcset:
+                sources.append((f"image/{fmt.lower()}", srcset))
+        return sources
+
+    def file_size_bytes(self):
+        """Размер файла из byte_size; хранилище не открывается (None — ещё не заполнен)."""
+
+        if not self.image:
             return None
+        return self.byte_size
 
     def human_size(self):
         size = self.file_size_bytes()
@@ -414,8 +746,82 @@ def src(self):
         return self.full_url or ""
 
 
+PHOTO_JOB_STATUS_CHOICES = [
+    ("pending", "В очереди"),
+    ("processing", "Обрабатывается"),
+    ("failed", "Ошибка"),
+]
+
+
+class PhotoJob(models.Model):
+    """Загруженный, но ещё не обработанный файл (очередь для photo_worker).
+
+    Исходник хранится как есть; после успешной обработки задание удаляется,
+    а вместо него появляется Photo. Неудачные задания остаются со статусом
+    failed, пока их ошибка не будет показана на странице объекта.
+    """
+
+    property = models.ForeignKey(
+        "Property", related_name="photo_jobs", on_delete=models.CASCADE
+    )
+    source = models.FileField(upload_to="photos/incoming/%Y/%m/%d", max_length=255)
+    original_name = models.CharField(max_length=255, blank=True)
+    content_type = models.CharField(max_length=100, blank=True)
+    make_default = models.BooleanField(default=False)
+    sort = models.PositiveIntegerField(default=0)
+    status = models.CharField(
+        max_length=12, choices=PHOTO_JOB_STATUS_CHOICES, default="pending"
+    )
+    error = models.CharField(max_length=255, blank=True)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["id"]
+        indexes = [models.Index(fields=["status", "id"], name="photojob_status_idx")]
+
+    def __str__(self):
+        return f"PhotoJob #{self.pk} [{self.status}] {self.original_name}"
+
+
+class PhotoCleanup(models.Model):
+    """Файл удалённого фото, который ещё предстоит стереть из хранилища.
+
+    Массовое удаление (photo_store.bulk_delete) убирает строки Photo, не
+    трогая хранилище, и только ставит сюда имена; сами файлы и производные удаляет
+    photo_store.sweep_cleanup (photo_worker или sweep_photo_cleanup).
+    """
+
+    name = models.CharField(max_length=255)
+    variants = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ["id"]
+
+    def __str__(self):
+        return f"PhotoCleanup #{self.pk} {self.name}"
+
+
+_file_cleanup = threading.local()
+
+
+@contextlib.contextmanager
+def deferred_file_cleanup():
+    """Удаление Photo внутри блока не трогает файлы — их удалит sweep_cleanup."""
+
+    _file_cleanup.deferred = True
+    try:
+        yield
+    finally:
+        _file_cleanup.deferred = False
+
+
 @receiver(post_delete, sender=Photo)
 def delete_photo_image_on_delete(sender, instance, **kwargs):
+    if getattr(_file_cleanup, "deferred", False):
+        return  # файлы уже в очереди PhotoCleanup (photo_store.bulk_delete)
     image = getattr(instance, "image", None)
     if not image:
         return
@@ -423,29 +829,56 @@ def delete_photo_image_on_delete(sender, instance, **kwargs):
     name = getattr(image, "name", None)
     if not storage or not name:
         return
+    if Photo.image_in_use(name):
+        return  # файл общий (дедупликация) — удалит последнее фото
     try:
         storage.delete(name)
     except Exception:
         pass
+    instance.delete_variant_files(force=True)
 
 
 @receiver(pre_save, sender=Photo)
-def delete_old_photo_image_on_change(sender, instance, **kwargs):
+def delete_old_photo_image_on_change(sender, instance, update_fields=None, **kwargs):
     if not instance.pk:
         return
+    if update_fields is not None and "image" not in update_fields:
+        return  # файл не сохраняется — и заменить его нечем
     try:
-        old_instance = sender.objects.get(pk=instance.pk)
-    except sender.DoesNotExist:
-        return
-    old_image = getattr(old_instance, "image", None)
-    if not old_image:
+        old_name = instance._loaded_image_name
+    except AttributeError:
+        # экземпляр собран вручную или image был отложен (defer/only)
+        old_name = sender.objects.filter(pk=instance.pk).values_list("image", flat=True).first()
+    if not old_name:
         return
     new_image = getattr(instance, "image", None)
     new_name = getattr(new_image, "name", None)
-    if new_name and new_name == old_image.name:
+    if new_name and new_name == old_name:
+        return
+    if not Photo.image_in_use(old_name, exclude_pk=instance.pk):
+        storage = sender._meta.get_field("image").storage
+        try:
+            storage.delete(old_name)
+        except Exception:
+            pass
+        # производные старого файла — замена файла бывает редко, тут запрос допустим
+        old_variants = (
+            sender.objects.filter(pk=instance.pk).values_list("variants", flat=True).first() or ""
+        )
+        instance.delete_variant_files(
+            [key for key in old_variants.split(",") if key], name=old_name, force=True
+        )
+    if not getattr(instance, "_variants_fresh", False):
+        instance.variants = ""
+
+
+@receiver(post_delete, sender=PhotoJob)
+def delete_photo_job_source_on_delete(sender, instance, **kwargs):
+    source = getattr(instance, "source", None)
+    if not source:
         return
-    storage = getattr(old_image, "storage", None)
-    name = getattr(old_image, "name", None)
+    storage = getattr(source, "storage", None)
+    name = getattr(source, "name", None)
     if not storage or not name:
         return
     try:
@@ -0,0 +1,168 @@
+# core/photo_jobs.py
+"""Очередь обработки загруженных фото (PhotoJob) на базе БД.
+
+Включается настройкой PHOTO_UPLOAD_QUEUE: panel_add_photo сохраняет исходники
+как есть и ставит задания в очередь, а `manage.py photo_worker` раскодирует/
+сжимает их тем же конвейером, что и синхронная загрузка.
+"""
+import logging
+from datetime import timedelta
+
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, F, Max
+from django.utils import timezone
+
+from . import photo_store
+from .models import Photo, PhotoJob
+
+log = logging.getLogger("upload")
+
+UNEXPECTED_ERROR_MESSAGE = "Не удалось загрузить одно из фото (код: UnexpectedError)"
+MAX_ATTEMPTS = 3
+ACTIVE_STATUSES = ("pending", "processing")
+
+
+def next_sort_value(prop) -> int:
+    """Максимальный sort среди фото объекта и ещё не обработанных заданий."""
+
+    photo_max = Photo.objects.filter(property=prop).aggregate(Max("sort")).get("sort__max") or 0
+    job_max = (
+        PhotoJob.objects.filter(property=prop, status__in=ACTIVE_STATUSES)
+        .aggregate(Max("sort"))
+        .get("sort__max")
+        or 0
+    )
+    return max(photo_max, job_max)
+
+
+def enqueue_uploads(prop, files, make_default=False):
+    """Сохранить исходники без обработки и поставить задания. Возвращает список PhotoJob.
+
+    sort и «главное фото» назначаются так же, как при синхронной загрузке:
+    первый файл при make_default получает sort=0, остальные — max_sort + 10.
+    """
+
+    jobs = []
+    max_sort = next_sort_value(prop)
+    for idx, uploaded in enumerate(files):
+        job = PhotoJob(
+            property=prop,
+            original_name=(uploaded.name or "photo")[:255],
+            content_type=(getattr(uploaded, "content_type", "") or "")[:100],
+        )
+        if make_default and idx == 0:
+            job.make_default = True
+            job.sort = 0
+        else:
+            max_sort += 10
+            job.sort = max_sort
+        job.source.save(uploaded.name or "photo", uploaded, save=False)
+        job.save()
+        jobs.append(job)
+    return jobs
+
+
+def claim_next_job():
+    """Атомарно забрать самое старое задание из очереди (безопасно для нескольких воркеров)."""
+
+    while True:
+        job = PhotoJob.objects.filter(status="pending").order_by("id").first()
+        if job is None:
+            return None
+        claimed = PhotoJob.objects.filter(pk=job.pk, status="pending").update(
+            status="processing",
+            attempts=F("attempts") + 1,
+            updated_at=timezone.now(),
+        )
+        if claimed:
+            job.refresh_from_db()
+            return job
+
+
+def requeue_stale_jobs(older_than: timedelta) -> int:
+    """Вернуть в очередь задания, «зависшие» в processing (упавший воркер)."""
+
+    cutoff = timezone.now() - older_than
+    stale = PhotoJob.objects.filter(status="processing", updated_at__lt=cutoff)
+    # через mark_failed, а не bulk update: исходники исчерпавших попытки удаляются
+    failed = list(stale.filter(attempts__gte=MAX_ATTEMPTS))
+    for job in failed:
+        mark_failed(job, UNEXPECTED_ERROR_MESSAGE)
+    requeued = stale.update(status="pending", updated_at=timezone.now())
+    return len(failed) + requeued
+
+
+def mark_failed(job, message):
+    job.status = "failed"
+    job.error = message[:255]
+    job.save(update_fields=["status", "error", "updated_at"])
+    # исходник больше не нужен — ошибку покажем по полю error
+    if job.source:
+        try:
+            job.source.storage.delete(job.source.name)
+        except Exception:
+            pass
+
+
+def process_job(job) -> bool:
+    """Обработать одно задание. True — создано фото, False — задание помечено failed."""
+
+    from .views import _process_one_file
+
+    reuse = None
+    try:
+        with job.source.open("rb") as fh:
+            uploaded = File(fh, name=job.original_name or "photo")
+            uploaded.content_type = job.content_type
+            digest = photo_store.source_digest(uploaded)
+            reuse = photo_store.find_reusable([digest]).get(digest)
+            if reuse is None:
+                processed = _process_one_file(uploaded)
+    except ValueError as e:
+        log.warning("upload rejected (job %s): %s", job.pk, e)
+        mark_failed(job, str(e))
+        return False
+    except Exception:
+        log.exception("upload failed (job %s)", job.pk)
+        mark_failed(job, UNEXPECTED_ERROR_MESSAGE)
+        return False
+
+    with transaction.atomic():
+        ph = Photo(property_id=job.property_id, sort=job.sort, source_hash=digest)
+        if reuse is not None:
+            photo_store.share_image(ph, reuse)
+        else:
+            ph.image = processed
+        if job.make_default:
+            Photo.objects.filter(property_id=job.property_id).update(is_default=False)
+            ph.is_default = True
+        ph.save()
+        job.delete()
+    return True
+
+
+def job_status(prop) -> dict:
+    counts = {status: 0 for status, _ in PhotoJob._meta.get_field("status").choices}
+    rows = (
+        PhotoJob.objects.filter(property=prop)
+        .order_by()
+        .values("status")
+        .annotate(n=Count("id"))
+    )
+    for row in rows:
+        counts[row["status"]] = row["n"]
+    return {
+        "pending": counts["pending"] + counts["processing"],
+        "failed": counts["failed"],
+    }
+
+
+def pop_failed_jobs(prop):
+    """Забрать сообщения об ошибках обработки (задания удаляются после показа)."""
+
+    failed = list(PhotoJob.objects.filter(property=prop, status="failed").order_by("id"))
+    errors = [job.error or UNEXPECTED_ERROR_MESSAGE for job in failed]
+    for job in failed:
+        job.delete()
+    return errors
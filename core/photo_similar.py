@@ -0,0 +1,93 @@
+# core/photo_similar.py
+"""Поиск одинаковых и почти одинаковых фото по перцептивному хешу (Photo.dhash).
+
+Расстояние между фото — число различающихся бит dHash (расстояние Хэмминга).
+Индекс — BK-дерево: поиск соседей в радиусе d обходит только ветви, которые
+по неравенству треугольника могут содержать ответ, а не все хеши каталога.
+"""
+from collections import defaultdict
+
+from .models import Photo
+
+DEFAULT_MAX_DISTANCE = 6  # из 64 бит: пересжатие/ресайз дают 0–4, другой кадр — 20+
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """BK-дерево над целыми хешами с метрикой hamming."""
+
+    def __init__(self, items=()):
+        self._root = None  # [hash, {расстояние: узел}]
+        self.size = 0
+        for item in items:
+            self.add(item)
+
+    def add(self, value: int):
+        if self._root is None:
+            self._root = [value, {}]
+            self.size = 1
+            return
+        node = self._root
+        while True:
+            distance = hamming(value, node[0])
+            if distance == 0:
+                return  # уже есть
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [value, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, value: int, radius: int):
+        """[(расстояние, хеш)] всех хешей не дальше radius."""
+
+        found = []
+        stack = [self._root] if self._root is not None else []
+        while stack:
+            node_value, children = stack.pop()
+            distance = hamming(value, node_value)
+            if distance <= radius:
+                found.append((distance, node_value))
+            low, high = distance - radius, distance + radius
+            stack.extend(child for d, child in children.items() if low <= d <= high)
+        return sorted(found)
+
+
+def duplicate_groups(queryset=None, max_distance=DEFAULT_MAX_DISTANCE):
+    """Группы фото (списки Photo) с dHash не дальше max_distance друг от друга по цепочке.
+
+    Общие (дедуплицированные) файлы имеют один хеш и попадают в одну группу.
+    """
+
+    queryset = Photo.objects.all() if queryset is None else queryset
+    photos = queryset.exclude(dhash="").select_related("property").order_by("id")
+    by_hash = defaultdict(list)
+    for photo in photos:
+        by_hash[int(photo.dhash, 16)].append(photo)
+
+    tree = BKTree(by_hash)
+    parent = {value: value for value in by_hash}
+
+    def root(value):
+        while parent[value] != value:
+            parent[value] = parent[parent[value]]
+            value = parent[value]
+        return value
+
+    for value in by_hash:
+        for _distance, other in tree.search(value, max_distance):
+            a, b = root(value), root(other)
+            if a != b:
+                parent[max(a, b)] = min(a, b)
+
+    groups = defaultdict(list)
+    for value, members in by_hash.items():
+        groups[root(value)].extend(members)
+    return sorted(
+        (sorted(members, key=lambda ph: ph.id) for members in groups.values() if len(members) > 1),
+        key=lambda members: members[0].id,
+    )
@@ -0,0 +1,257 @@
+# core/photo_store.py
+"""Дедупликация загрузок по содержимому.
+
+Photo.source_hash — sha256 исходных байтов загрузки (до сжатия). Повторная
+загрузка того же файла (тот же набор фото в другой объект, повтор после
+ошибки) не сжимается заново: новое Photo ссылается на уже сохранённый файл
+и его производные. Поэтому файлы удаляются со счётчиком ссылок — см.
+Photo.image_in_use и сигналы в models.py.
+
+Поворот из панели тоже не трогает файл сразу: копится в Photo.orientation и
+применяется один раз (apply_orientation) — воркером, перед выгрузкой фида
+или при пересборке производных.
+
+Массовое удаление (bulk_delete) так же откладывает работу с хранилищем:
+строки удаляются без обращения к файлам, а файлы стирает sweep_cleanup.
+"""
+import hashlib
+import logging
+import time
+
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Mod
+
+from .models import PHOTO_FILE_META_FIELDS, Photo, PhotoCleanup, deferred_file_cleanup
+from .utils import image_pipeline
+
+log = logging.getLogger("upload")
+
+_CHUNK = 1024 * 1024
+# неожиданный сбой поворота (хранилище, БД) не повторяется на каждом опросе воркера
+ROTATION_RETRY_AFTER = 3600.0  # секунд
+_rotation_failures: dict[int, float] = {}
+
+
+def source_digest(uploaded) -> str:
+    """sha256 загруженного файла; позиция чтения возвращается в начало."""
+
+    digest = hashlib.sha256()
+    try:
+        uploaded.seek(0)
+    except Exception:
+        pass
+    if hasattr(uploaded, "chunks"):
+        for chunk in uploaded.chunks(_CHUNK):
+            digest.update(chunk)
+    else:
+        digest.update(uploaded.read())
+    try:
+        uploaded.seek(0)
+    except Exception:
+        pass
+    return digest.hexdigest()
+
+
+def find_reusable(digests):
+    """{digest: Photo} для уже обработанных загрузок, файл которых ещё на месте."""
+
+    wanted = {digest for digest in digests if digest}
+    if not wanted:
+        return {}
+    found = {}
+    rows = (
+        Photo.objects.filter(source_hash__in=wanted)
+        .exclude(image="")
+        .exclude(image=None)
+        .order_by("id")
+    )
+    for photo in rows:
+        if photo.source_hash in found:
+            continue
+        try:
+            if not photo.image.storage.exists(photo.image.name):
+                continue
+        except Exception:
+            continue
+        found[photo.source_hash] = photo
+    return found
+
+
+def share_image(photo, source):
+    """Сослаться на файл (и производные) другого Photo без копирования."""
+
+    photo.image = source.image.name
+    photo.variants = source.variants
+    photo.source_hash = source.source_hash
+    for field in PHOTO_FILE_META_FIELDS:
+        setattr(photo, field, getattr(source, field))
+    return photo
+
+
+def discard_written_files(photos) -> None:
+    """Стереть файлы, которые save() успел записать для фото из откатившейся
+    транзакции: основной файл и его производные. Имена свежие (их выдал
+    get_available_name), поэтому строк, ссылающихся на них, нет. Общие файлы
+    дедупликации (share_image) не записывались и не трогаются.
+    """
+
+    for photo in photos:
+        image = photo.image
+        if not image or not image.name or not getattr(image, "_committed", False):
+            continue
+        if Photo.image_in_use(image.name):
+            continue
+        try:
+            image.storage.delete(image.name)
+        except Exception:
+            log.warning("photo upload rollback: failed to delete %s", image.name)
+        photo.delete_variant_files(force=True)
+
+
+def apply_orientation(photo) -> bool:
+    """Повернуть пиксели файла на photo.orientation и обнулить поле.
+
+    Повёрнутый файл всегда получает новое имя; старый удаляется после
+    обновления строки и только если на него больше никто не ссылается (общий
+    файл дедупликации остаётся у остальных фото). Производные пересобираются
+    из уже повёрнутого изображения.
+    """
+
+    if not photo.orientation or not photo.image:
+        return False
+    field_file = photo.image
+    try:
+        field_file.open("rb")
+        orig = field_file.read()
+    finally:
+        try:
+            field_file.close()
+        except Exception:
+            pass
+    applied = photo.orientation
+    data, rotated = image_pipeline.rotate_jpeg(orig, applied)
+
+    old_name = field_file.name
+    old_variants = photo.variant_keys()
+    storage = field_file.storage
+    # новое имя рядом со старым (get_available_name): сначала пишем файл, потом
+    # переключаем строку и только после этого удаляем старый — сбой не теряет фото
+    new_name = storage.save(old_name, ContentFile(data))
+    meta = Photo.file_meta(data)
+    try:
+        # повёрнутый файл больше не равен результату сжатия исходника
+        Photo.objects.filter(pk=photo.pk).update(
+            image=new_name, source_hash="", variants="", **meta
+        )
+    except Exception:
+        storage.delete(new_name)
+        raise
+    field_file.name = new_name
+    photo._loaded_image_name = new_name
+    photo.source_hash = ""
+    photo.variants = ""
+    for field, value in meta.items():
+        setattr(photo, field, value)
+    if not Photo.image_in_use(old_name):
+        # общий файл (дедупликация) остаётся у остальных фото вместе с производными
+        try:
+            storage.delete(old_name)
+        except Exception:
+            log.warning("photo %s: failed to delete %s", photo.pk, old_name)
+        photo.delete_variant_files(old_variants, name=old_name, force=True)
+    # вычитаем применённое, а не обнуляем: клик «повернуть» мог прийти во время обработки
+    Photo.objects.filter(pk=photo.pk).update(
+        orientation=Mod(F("orientation") + (360 - applied), 360)
+    )
+    photo.refresh_from_db(fields=["orientation"])
+    photo.store_variants(image_pipeline.make_derivatives(rotated))
+    return True
+
+
+def pending_orientations(queryset=None):
+    queryset = Photo.objects.all() if queryset is None else queryset
+    return queryset.filter(~Q(orientation=0)).exclude(image="").exclude(image=None).order_by("id")
+
+
+def apply_pending_orientations(queryset=None, limit=None) -> int:
+    """Применить накопленные повороты (например, только к фото объектов фида).
+
+    Файл, который не прочитать или не раскодировать, не повернуть никогда —
+    orientation сбрасывается. После прочих сбоев фото откладывается на
+    ROTATION_RETRY_AFTER: поворот не теряется, но и лог не засоряется.
+    """
+
+    now = time.monotonic()
+    backoff = [pk for pk, at in _rotation_failures.items() if now - at < ROTATION_RETRY_AFTER]
+    pending = pending_orientations(queryset)
+    if backoff:
+        pending = pending.exclude(pk__in=backoff)
+    if limit:
+        pending = pending[:limit]
+    applied = 0
+    for photo in pending:
+        try:
+            applied += apply_orientation(photo)
+        except (image_pipeline.InvalidImage, FileNotFoundError) as e:
+            log.warning("photo %s: cannot rotate (%s), orientation reset", photo.pk, e)
+            Photo.objects.filter(pk=photo.pk).update(orientation=0)
+        except Exception as e:
+            if photo.pk in _rotation_failures:
+                log.warning("photo %s: rotation failed again (%s)", photo.pk, e)
+            else:
+                log.exception("photo %s: failed to apply orientation", photo.pk)
+            _rotation_failures[photo.pk] = time.monotonic()
+        else:
+            _rotation_failures.pop(photo.pk, None)
+    return applied
+
+
+def bulk_delete(queryset) -> list[int]:
+    """Удалить фото без обращения к хранилищу; файлы ставятся в очередь PhotoCleanup.
+
+    Обычный QuerySet.delete() (каскады и сигналы работают), только обработчик
+    post_delete не удаляет файлы: время ответа не зависит от хранилища.
+    """
+
+    with transaction.atomic():
+        rows = list(queryset.values_list("id", "image", "variants"))
+        ids = [pk for pk, _name, _variants in rows]
+        if not ids:
+            return []
+        with deferred_file_cleanup():
+            Photo.objects.filter(pk__in=ids).delete()
+        files = {name: variants for _pk, name, variants in rows if name}
+        PhotoCleanup.objects.bulk_create(
+            PhotoCleanup(name=name, variants=variants) for name, variants in files.items()
+        )
+    return ids
+
+
+def sweep_cleanup(limit=None) -> int:
+    """Стереть файлы из очереди PhotoCleanup. Возвращает число удалённых файлов.
+
+    Файл, на который снова кто-то ссылается (дедупликация), остаётся на месте.
+    """
+
+    pending = PhotoCleanup.objects.order_by("id")
+    if limit:
+        pending = pending[:limit]
+    storage = Photo._meta.get_field("image").storage
+    removed = 0
+    for entry in pending:
+        if not Photo.image_in_use(entry.name):
+            names = [entry.name] + [
+                image_pipeline.variant_name(entry.name, key)
+                for key in entry.variants.split(",")
+                if key
+            ]
+            for name in names:
+                try:
+                    storage.delete(name)
+                except Exception:
+                    log.warning("cleanup %s: failed to delete %s", entry.pk, name)
+            removed += 1
+        entry.delete()
+    return removed
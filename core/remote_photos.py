@@ -0,0 +1,262 @@
+# core/remote_photos.py
+"""Локальные копии фото, добавленных ссылкой (Photo.full_url).
+
+Ссылки скачиваются параллельно: asyncio ограничивает число одновременных
+запросов (семафор), сами запросы (requests) идут в потоках через
+asyncio.to_thread. Общий предел времени на файл проверяется в самом потоке
+(_download): отменить поток снаружи нельзя, а timeout у requests — на каждое
+чтение, и медленный сервер иначе тянул бы загрузку бесконечно. Ссылки вводят
+люди, поэтому адреса loopback/частных/link-local сетей не запрашиваются — в
+том числе после перенаправлений. Повторные проверки условные (If-None-Match /
+If-Modified-Since): неизменившийся файл отвечает 304 и не скачивается.
+Скачанное проходит тот же конвейер сжатия, что и загрузка из панели, и
+сохраняется в Photo.image рядом с full_url; remote_status хранит код
+последней проверки (0 — сеть или таймаут).
+"""
+import asyncio
+import hashlib
+import ipaddress
+import logging
+import socket
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+from urllib.parse import urljoin, urlsplit
+
+import requests
+import urllib3
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import photo_store
+from .models import PHOTO_FILE_META_FIELDS, Photo
+from .utils import decode_sandbox, image_pipeline
+
+log = logging.getLogger("upload")
+
+FETCH_CONCURRENCY = 4
+FETCH_TIMEOUT = 20  # секунд: на соединение и на каждое чтение
+RECHECK_AFTER = timedelta(hours=24)
+DEADLINE_FACTOR = 3  # общий предел на файл — timeout × 3
+MAX_REDIRECTS = 5
+ALLOW_PRIVATE_HOSTS = False  # True — только для тестов с локальным сервером
+USER_AGENT = "realcrm-photo-fetcher/1.0"
+_CHUNK = 64 * 1024
+
+
+class BlockedURL(requests.RequestException):
+    """Ссылка ведёт не в интернет (loopback, частная сеть, link-local) или не по http(s)."""
+
+
+@dataclass
+class FetchResult:
+    photo_id: int
+    status: int  # HTTP-код; 0 — сеть или таймаут
+    etag: str = ""
+    last_modified: str = ""
+    digest: str = ""
+    content: ContentFile | None = None
+    error: str = ""
+
+
+def _check_url(url):
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise BlockedURL(f"unsupported url: {url}")
+    if ALLOW_PRIVATE_HOSTS:
+        return
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    try:
+        infos = socket.getaddrinfo(parts.hostname, port, proto=socket.IPPROTO_TCP)
+    except socket.gaierror as e:
+        raise requests.ConnectionError(f"{parts.hostname}: {e}")
+    for info in infos:
+        ip = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        mapped = getattr(ip, "ipv4_mapped", None)
+        if not (mapped or ip).is_global:
+            raise BlockedURL(f"{parts.hostname} resolves to non-public address {ip}")
+
+
+def _download(url, headers, timeout, max_bytes, deadline):
+    """(ответ, байты) — байты только для 200; размер режется по max_bytes, время —
+    по deadline (time.monotonic) на каждом прочитанном куске."""
+
+    for _hop in range(MAX_REDIRECTS + 1):
+        _check_url(url)
+        response = requests.get(
+            url, headers=headers, timeout=timeout, stream=True, allow_redirects=False
+        )
+        with response:
+            if response.is_redirect:
+                # адрес перенаправления проверяется так же, как исходный
+                url = urljoin(url, response.headers["Location"])
+                continue
+            if response.status_code != 200:
+                return response, None
+            declared = int(response.headers.get("Content-Length") or 0)
+            if max_bytes and declared > max_bytes:
+                raise ValueError(f"file too large: {declared} bytes")
+            buf = bytearray()
+            while True:
+                if time.monotonic() > deadline:
+                    raise requests.Timeout("download deadline exceeded")
+                try:
+                    # read1 отдаёт то, что уже пришло, и не ждёт полного куска
+                    chunk = response.raw.read1(_CHUNK, decode_content=True)
+                except urllib3.exceptions.HTTPError as e:
+                    raise requests.ConnectionError(str(e))
+                if not chunk:
+                    break
+                buf += chunk
+                if max_bytes and len(buf) > max_bytes:
+                    raise ValueError(f"file too large: over {max_bytes} bytes")
+            return response, bytes(buf)
+    raise requests.TooManyRedirects(f"more than {MAX_REDIRECTS} redirects")
+
+
+def fetch_one(
+    photo_id, url, etag="", last_modified="", source_hash="", timeout=FETCH_TIMEOUT, max_bytes=0
+):
+    """Скачать и сжать одну ссылку. Выполняется в потоке: без обращений к БД.
+
+    На всё скачивание — не дольше timeout × DEADLINE_FACTOR (плюс одно чтение).
+    """
+
+    headers = {"User-Agent": USER_AGENT}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    try:
+        deadline = time.monotonic() + timeout * DEADLINE_FACTOR
+        response, data = _download(url, headers, timeout, max_bytes, deadline)
+    except requests.RequestException as e:
+        return FetchResult(photo_id, 0, error=str(e))
+    except ValueError as e:
+        return FetchResult(photo_id, 200, error=str(e))
+
+    result = FetchResult(
+        photo_id,
+        response.status_code,
+        etag=response.headers.get("ETag", ""),
+        last_modified=response.headers.get("Last-Modified", ""),
+    )
+    if data is None:
+        return result
+    result.digest = hashlib.sha256(data).hexdigest()
+    if result.digest == source_hash:
+        return result  # сервер отдал тот же файл целиком — пересжимать нечего
+    try:
+        main, derivatives = decode_sandbox.compress_upload(data)
+    except image_pipeline.InvalidImage as e:
+        result.error = f"invalid image: {e}"
+        return result
+    result.content = ContentFile(main, name=f"remote-{photo_id}.jpg")
+    # Photo.save() разложит их рядом с основным файлом, как при загрузке
+    result.content.derivatives = derivatives
+    return result
+
+
+async def fetch_all(items, concurrency=FETCH_CONCURRENCY, timeout=FETCH_TIMEOUT, max_bytes=0):
+    """fetch_one для каждого словаря items, не больше concurrency одновременно.
+
+    Слот семафора держится, пока поток не вернётся: предел времени соблюдает
+    сам fetch_one, а wait_for лишь отпустил бы слот при ещё идущей загрузке.
+    """
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run(item):
+        async with semaphore:
+            return await asyncio.to_thread(
+                fetch_one, timeout=timeout, max_bytes=max_bytes, **item
+            )
+
+    return await asyncio.gather(*(run(item) for item in items))
+
+
+def due_for_fetch(queryset=None, force=False):
+    queryset = Photo.objects.all() if queryset is None else queryset
+    queryset = queryset.exclude(full_url="").exclude(full_url=None)
+    if not force:
+        cutoff = timezone.now() - RECHECK_AFTER
+        queryset = queryset.filter(
+            Q(remote_checked_at__isnull=True) | Q(remote_checked_at__lt=cutoff)
+        )
+    return queryset.order_by(F("remote_checked_at").asc(nulls_first=True), "id")
+
+
+def store_result(photo, result):
+    """Записать итог проверки; новый файл — через обычный Photo.save()."""
+
+    photo.remote_status = result.status
+    photo.remote_checked_at = timezone.now()
+    fields = ["remote_status", "remote_checked_at"]
+    if result.status == 200 and not result.error:
+        photo.remote_etag = result.etag[:255]
+        photo.remote_last_modified = result.last_modified[:64]
+        fields += ["remote_etag", "remote_last_modified"]
+    if result.content is None:
+        photo.save(update_fields=fields)
+        return False
+
+    reuse = photo_store.find_reusable([result.digest]).get(result.digest)
+    if reuse is not None and reuse.pk != photo.pk:
+        photo_store.share_image(photo, reuse)
+        photo.save(update_fields=[*fields, "image", "source_hash", *PHOTO_FILE_META_FIELDS])
+        # pre_save сбрасывает производные при смене файла — у общего файла они уже есть
+        Photo.objects.filter(pk=photo.pk).update(variants=reuse.variants)
+        photo.variants = reuse.variants
+    else:
+        photo.image = result.content
+        photo.source_hash = result.digest
+        photo.save(update_fields=[*fields, "image", "source_hash"])
+    return True
+
+
+def ingest_remote_photos(
+    queryset=None, limit=None, concurrency=FETCH_CONCURRENCY, timeout=FETCH_TIMEOUT, force=False
+):
+    """Проверить/скачать ссылки, которым пора. Возвращает счётчики для отчёта."""
+
+    due = due_for_fetch(queryset, force=force)
+    photos = list(due[:limit] if limit else due)
+    items = [
+        {
+            "photo_id": ph.pk,
+            "url": ph.full_url,
+            "etag": "" if force or not ph.image else ph.remote_etag,
+            "last_modified": "" if force or not ph.image else ph.remote_last_modified,
+            "source_hash": "" if force or not ph.image else ph.source_hash,
+        }
+        for ph in photos
+    ]
+    stats = {"stored": 0, "not_modified": 0, "unchanged": 0, "failed": 0}
+    if not items:
+        return stats
+    max_bytes = getattr(settings, "PHOTO_UPLOAD_MAX_BYTES", 0)
+    results = asyncio.run(fetch_all(items, concurrency, timeout, max_bytes))
+
+    by_id = {ph.pk: ph for ph in photos}
+    for result in results:
+        photo = by_id[result.photo_id]
+        try:
+            stored = store_result(photo, result)
+        except Exception:
+            log.exception("photo %s: failed to store %s", photo.pk, photo.full_url)
+            stats["failed"] += 1
+            continue
+        if stored:
+            stats["stored"] += 1
+        elif result.status == 304:
+            stats["not_modified"] += 1
+        elif result.status == 200 and not result.error:
+            stats["unchanged"] += 1
+        else:
+            log.warning(
+                "photo %s: %s -> %s %s", photo.pk, photo.full_url, result.status, result.error
+            )
+            stats["failed"] += 1
+    return stats
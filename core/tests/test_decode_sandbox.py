@@ -0,0 +1,117 @@
+import os
+import signal
+import tempfile
+import threading
+import time
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.utils import decode_sandbox, image_pipeline
+
+
+def _jpeg(size=(640, 480)):
+    buf = BytesIO()
+    image_pipeline.Image.effect_noise(size, 40).convert("RGB").save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+class DecodePoolTest(SimpleTestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+
+    def _pool(self, **kwargs):
+        kwargs.setdefault("timeout", 30)
+        pool = decode_sandbox.DecodePool(1, **kwargs).start()
+        self.addCleanup(pool.close)
+        return pool
+
+    def _fifo(self):
+        """Путь к FIFO: процесс, открывший его на чтение, висит, пока не убит."""
+
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        path = os.path.join(tmp.name, "stuck.jpg")
+        os.mkfifo(path)
+        return path
+
+    def _pids(self, pool):
+        return {w.process.pid for w in pool._all}
+
+    def test_result_matches_in_process_compression(self):
+        data = _jpeg()
+        pool = self._pool()
+        main, derivatives = pool.compress_upload(data)
+        expected_main, expected_derivatives = image_pipeline.compress_upload(data)
+        self.assertEqual(len(main), len(expected_main))
+        self.assertEqual(set(derivatives), set(expected_derivatives))
+
+        with tempfile.NamedTemporaryFile(suffix=".jpg") as fh:
+            fh.write(data)
+            fh.flush()
+            from_path, _ = pool.compress_upload(fh.name, len(data))
+        self.assertEqual(len(from_path), len(expected_main))
+
+    def test_errors_come_back_as_pipeline_exceptions(self):
+        pool = self._pool()
+        with self.assertRaises(image_pipeline.InvalidImage):
+            pool.compress_upload(b"\xff\xd8\xff\xe0" + b"not-an-image" * 8)
+        with mock.patch.object(image_pipeline, "MAX_PIXELS", 2000):
+            small_budget = self._pool()
+        with self.assertRaises(image_pipeline.ImageTooLarge) as ctx:
+            small_budget.compress_upload(_jpeg((64, 48)))
+        self.assertEqual((ctx.exception.width, ctx.exception.height), (64, 48))
+
+    def test_worker_recycled_after_max_tasks(self):
+        pool = self._pool(max_tasks=2)
+        data = _jpeg((320, 240))
+        first = self._pids(pool)
+        pool.compress_upload(data)
+        self.assertEqual(self._pids(pool), first)
+        pool.compress_upload(data)
+        self.assertFalse(self._pids(pool))  # отслуживший процесс остановлен
+        pool.compress_upload(data)
+        self.assertTrue(self._pids(pool))
+        self.assertFalse(self._pids(pool) & first)
+
+    def test_timeout_kills_only_that_task(self):
+        pool = self._pool(timeout=0.5)
+        stuck = self._pids(pool)
+        with self.assertRaises(decode_sandbox.DecodeFailed) as ctx:
+            pool.compress_upload(self._fifo(), 1)
+        self.assertEqual(ctx.exception.reason, "timeout")
+        self.assertIsInstance(ctx.exception, image_pipeline.InvalidImage)
+
+        main, _ = pool.compress_upload(_jpeg((320, 240)))
+        self.assertTrue(main.startswith(b"\xff\xd8"))
+        self.assertFalse(self._pids(pool) & stuck)
+
+    def test_crashed_worker_fails_one_upload_and_is_replaced(self):
+        pool = self._pool()
+        (pid,) = self._pids(pool)
+        errors = []
+
+        def upload():
+            try:
+                pool.compress_upload(self._fifo(), 1)
+            except decode_sandbox.DecodeFailed as e:
+                errors.append(e)
+
+        thread = threading.Thread(target=upload)
+        thread.start()
+        time.sleep(0.3)
+        os.kill(pid, signal.SIGKILL)  # как segfault в декодере
+        thread.join(10)
+
+        self.assertEqual([e.reason for e in errors], ["crash"])
+        main, _ = pool.compress_upload(_jpeg((320, 240)))
+        self.assertTrue(main.startswith(b"\xff\xd8"))
+
+    def test_disabled_sandbox_runs_in_process(self):
+        decode_sandbox.configure_sandbox(False)
+        self.assertIsNone(decode_sandbox.get_pool())
+        with mock.patch.object(image_pipeline, "compress_upload", return_value=(b"x", {})) as run:
+            self.assertEqual(decode_sandbox.compress_upload(b"data", 4), (b"x", {}))
+        run.assert_called_once_with(b"data", 4)
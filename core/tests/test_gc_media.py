@@ -0,0 +1,52 @@
+import os
+import tempfile
+import time
+from io import StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core.models import Photo, Property
+
+
+class GcMediaTest(TestCase):
+    def setUp(self):
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        prop = Property.objects.create(title="GC", address="Addr")
+        self.photo = Photo.objects.create(property=prop, variants="w320.jpg")
+        self.photo.image.save("kept.jpg", ContentFile(b"kept"), save=True)
+        self.kept = self._path(self.photo.image.name)
+        self.thumb = self.kept.replace(".jpg", ".w320.jpg")
+        self.orphan = self._path("photos/2020/01/01/orphan.jpg")
+        self.fresh = self._path("photos/2020/01/01/fresh.jpg")
+        for path in (self.thumb, self.orphan, self.fresh):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "wb") as fh:
+                fh.write(b"x")
+        old = time.time() - 3 * 86400
+        for path in (self.kept, self.thumb, self.orphan):
+            os.utime(path, (old, old))
+
+    def _path(self, name):
+        return os.path.join(self._media.name, name)
+
+    def test_dry_run_reports_only_old_orphans(self):
+        out = StringIO()
+        call_command("gc_media", "--dry-run", stdout=out)
+        output = out.getvalue()
+        self.assertIn("photos/2020/01/01/orphan.jpg", output)
+        self.assertNotIn("fresh.jpg", output)
+        self.assertIn("orphans: 1", output)
+        self.assertTrue(os.path.exists(self.orphan))
+
+    def test_deletes_orphans_and_keeps_referenced(self):
+        call_command("gc_media", stdout=StringIO())
+        self.assertFalse(os.path.exists(self.orphan))
+        self.assertTrue(os.path.exists(self.fresh))
+        self.assertTrue(os.path.exists(self.kept))
+        self.assertTrue(os.path.exists(self.thumb))
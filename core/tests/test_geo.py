@@ -0,0 +1,85 @@
+from decimal import Decimal
+
+from django.test import TestCase
+from django.urls import reverse
+
+from core import geo
+from core.models import Property
+
+
+class GeohashTest(TestCase):
+    def test_encode_known_value(self):
+        self.assertEqual(geo.geohash_encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_cells_cover_bbox(self):
+        cells = geo.cells_for_bbox(53.70, 87.05, 53.80, 87.20)
+        self.assertLessEqual(len(cells), geo.MAX_PREFILTER_CELLS)
+        for lat, lng in ((53.70, 87.05), (53.80, 87.20), (53.75, 87.12)):
+            code = geo.geohash_encode(lat, lng)
+            self.assertTrue(any(code.startswith(c) for c in cells), (lat, lng))
+
+
+class GeoSearchTest(TestCase):
+    def setUp(self):
+        # Новокузнецк: центр, ~3 км к северу, ~20 км к югу; плюс Москва
+        self.center = self._create(53.757547, 87.136044, "Center")
+        self.north = self._create(53.784500, 87.136044, "North")
+        self.south = self._create(53.577000, 87.136044, "South")
+        self.moscow = self._create(55.755826, 37.617300, "Moscow")
+        self.no_coords = Property.objects.create(address="Nowhere")
+
+    def _create(self, lat, lng, address):
+        return Property.objects.create(
+            lat=Decimal(str(lat)), lng=Decimal(str(lng)), address=address
+        )
+
+    def test_geo_cell_maintained_on_save(self):
+        self.assertEqual(self.center.geo_cell, geo.geohash_encode(53.757547, 87.136044))
+        self.assertEqual(self.no_coords.geo_cell, "")
+
+        self.center.lat = Decimal("55.755826")
+        self.center.lng = Decimal("37.617300")
+        self.center.save(update_fields=["lat", "lng"])
+        self.center.refresh_from_db()
+        self.assertEqual(self.center.geo_cell, self.moscow.geo_cell)
+
+    def test_bbox(self):
+        qs = geo.filter_bbox(Property.objects.all(), 53.70, 87.0, 53.80, 87.3)
+        self.assertCountEqual(qs.values_list("id", flat=True), [self.center.id, self.north.id])
+
+    def test_bbox_prefilter_uses_index(self):
+        qs = Property.objects.filter(geo.cells_q(geo.cells_for_bbox(53.70, 87.0, 53.80, 87.3)))
+        self.assertIn("geo_cell", qs.explain())
+
+    def test_radius_refines_with_haversine(self):
+        found = geo.within_radius(Property.objects.all(), 53.757547, 87.136044, 5)
+        self.assertEqual([obj.id for obj, _ in found], [self.center.id, self.north.id])
+        self.assertAlmostEqual(found[1][1], 3.0, delta=0.1)
+
+    def test_clusters_merge_nearby_points(self):
+        clusters = geo.cluster(Property.objects.all(), zoom=2)
+        self.assertEqual(sum(c["count"] for c in clusters), 4)
+        self.assertEqual(len(clusters), 2)
+        moscow = next(c for c in clusters if c["count"] == 1)
+        self.assertEqual(moscow["id"], self.moscow.id)
+
+        detailed = geo.cluster(Property.objects.all(), zoom=16)
+        self.assertEqual(len(detailed), 4)
+
+    def test_endpoint(self):
+        url = reverse("panel_geo")
+        data = self.client.get(url, {"bbox": "53.70,87.0,53.80,87.3"}).json()
+        self.assertEqual(data["mode"], "points")
+        self.assertCountEqual([i["id"] for i in data["items"]], [self.center.id, self.north.id])
+
+        data = self.client.get(url, {"lat": "53.757547", "lng": "87.136044", "radius": "25"}).json()
+        self.assertEqual([i["id"] for i in data["items"]], [self.center.id, self.north.id, self.south.id])
+        self.assertIn("distance_km", data["items"][0])
+
+        data = self.client.get(url, {"bbox": "40,30,60,90", "zoom": "3"}).json()
+        self.assertEqual(data["mode"], "clusters")
+        self.assertEqual(sum(c["count"] for c in data["items"]), 4)
+
+        resp = self.client.get(url, {"bbox": "1,2,3"})
+        self.assertEqual(resp.status_code, 400)
+        self.assertEqual(self.client.get(url).status_code, 400)
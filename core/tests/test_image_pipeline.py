@@ -0,0 +1,238 @@
+import struct
+import zlib
+from io import BytesIO
+from unittest import mock
+
+from django.test import SimpleTestCase
+
+from core.utils import image_pipeline
+
+
+def _fake_encoder(size_of_q):
+    calls = []
+
+    def encode(q):
+        calls.append(q)
+        return b"x" * size_of_q(q)
+
+    return encode, calls
+
+
+class QualitySearchTest(SimpleTestCase):
+    def _exact(self, size_of_q, target, lo=55, hi=95):
+        fitting = [q for q in range(lo, hi + 1) if size_of_q(q) <= target]
+        return max(fitting) if fitting else lo
+
+    def test_proxy_search_matches_bisection_with_fewer_encodes(self):
+        def full(q):  # размер растёт быстрее к q=95, как у настоящего JPEG
+            return int(2000 * 1.06 ** q)
+
+        def proxy(q):  # коэффициент full/proxy плавно зависит от q
+            return b"x" * int(full(q) / (12 + (q - 55) * 0.2))
+
+        for target in (60_000, 150_000, 300_000, 400_000):
+            encode, calls = _fake_encoder(full)
+            data, q = image_pipeline._search_quality(
+                encode, target, proxy_fn=proxy, proxy_scale=8.0
+            )
+            self.assertEqual(q, self._exact(full, target), target)
+            self.assertLessEqual(len(data), target)
+            self.assertLessEqual(len(set(calls)), 3)
+
+    def test_without_proxy_falls_back_to_bisection(self):
+        encode, calls = _fake_encoder(lambda q: q * 1000)
+        data, q = image_pipeline._search_quality(encode, 80_500)
+        self.assertEqual(q, 80)
+        self.assertEqual(len(data), 80_000)
+
+    def test_nothing_fits_returns_lowest_quality(self):
+        encode, _calls = _fake_encoder(lambda q: 10_000 + q)
+
+        def proxy(q):
+            return b"x" * (100 + q)
+
+        data, q = image_pipeline._search_quality(
+            encode, 5_000, proxy_fn=proxy, proxy_scale=10.0
+        )
+        self.assertEqual(q, 55)
+        self.assertEqual(len(data), 10_055)
+
+
+class ReducedDecodeTest(SimpleTestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+
+    def _encoded(self, fmt, size=(1200, 900)):
+        import io
+
+        img = image_pipeline.Image.effect_noise(size, 30).convert("RGB")
+        buf = io.BytesIO()
+        img.save(buf, format=fmt)
+        return buf.getvalue()
+
+    def test_jpeg_uses_draft_and_keeps_target_size(self):
+        import io
+        from unittest import mock
+
+        orig = self._encoded("JPEG")
+        jpeg_cls = type(image_pipeline.Image.open(io.BytesIO(orig)))
+        with mock.patch.object(
+            jpeg_cls, "draft", autospec=True, side_effect=jpeg_cls.draft
+        ) as draft:
+            img = image_pipeline.decode_for_target(orig, max_side=200)
+        draft.assert_called_once()
+        self.assertEqual(draft.call_args.args[2], (200, 150))
+        self.assertEqual(img.size, (200, 150))
+        self.assertEqual(img.mode, "RGB")
+
+    def test_png_is_reduced_before_resize(self):
+        orig = self._encoded("PNG")
+        img = image_pipeline.decode_for_target(orig, max_side=200)
+        self.assertEqual(img.size, (200, 150))
+
+    def test_small_source_is_not_touched(self):
+        orig = self._encoded("JPEG", size=(120, 90))
+        img = image_pipeline.decode_for_target(orig, max_side=200)
+        self.assertEqual(img.size, (120, 90))
+        self.assertIsNone(image_pipeline._draft_size((120, 90), 200))
+
+
+class BackendSelectionTest(SimpleTestCase):
+    def setUp(self):
+        self.addCleanup(setattr, image_pipeline, "_backend", image_pipeline._backend)
+
+    def test_unavailable_backend_falls_back_to_pillow(self):
+        with mock.patch.object(image_pipeline, "available_backends", return_value=("pillow",)):
+            self.assertEqual(image_pipeline.configure_backend("vips"), "pillow")
+            self.assertEqual(image_pipeline.configure_backend("auto"), "pillow")
+
+    def test_auto_picks_faster_backend(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        with mock.patch.object(
+            image_pipeline, "available_backends", return_value=("pillow", "vips")
+        ), mock.patch.dict(
+            image_pipeline.BACKENDS,
+            {"pillow": lambda orig: image_pipeline.time.sleep(0.05), "vips": lambda orig: b""},
+        ):
+            self.assertEqual(image_pipeline.configure_backend("auto"), "vips")
+            self.assertEqual(image_pipeline.current_backend(), "vips")
+
+    def test_vips_backend_output_feeds_derivatives(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        buf = BytesIO()
+        image_pipeline.Image.new("RGB", (1200, 800), (90, 120, 30)).save(buf, format="JPEG")
+        main = buf.getvalue()
+        image_pipeline._backend = "vips"
+        with mock.patch.object(image_pipeline, "compress_with_vips", return_value=main) as vips:
+            data, variants = image_pipeline.compress_upload(b"source-bytes")
+        vips.assert_called_once_with(b"source-bytes", len(b"source-bytes"))
+        self.assertEqual(data, main)
+        self.assertIn("w320.jpg", variants)
+        self.assertIn("w960.jpg", variants)
+
+
+class PassthroughJpegTest(SimpleTestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+
+    def _jpeg(self, size=(1600, 1200), quality=75, orientation=None, comment=b"camera"):
+        w, h = size
+        img = (
+            image_pipeline.Image.effect_noise((w // 8, h // 8), 60)
+            .resize(size, image_pipeline.Image.BICUBIC)
+            .convert("RGB")
+        )
+        exif = image_pipeline.Image.Exif()
+        exif[0x010F] = "PhoneMaker"
+        if orientation:
+            exif[0x0112] = orientation
+        buf = BytesIO()
+        img.save(buf, format="JPEG", quality=quality, exif=exif.tobytes(), comment=comment)
+        return buf.getvalue()
+
+    def test_compliant_jpeg_kept_without_metadata(self):
+        orig = self._jpeg()
+        with mock.patch.object(image_pipeline, "encode_jpeg_to_target") as encode:
+            data, variants = image_pipeline.compress_upload(orig)
+        encode.assert_not_called()
+        self.assertLess(len(data), len(orig))
+        self.assertNotIn(b"Exif", data)
+        self.assertNotIn(b"camera", data)
+        self.assertIn("w960.jpg", variants)
+        # сжатые данные не тронуты: пиксели те же
+        with image_pipeline.Image.open(BytesIO(orig)) as a, image_pipeline.Image.open(
+            BytesIO(data)
+        ) as b:
+            self.assertEqual(a.tobytes(), b.tobytes())
+
+    def test_dense_or_rotated_jpeg_is_reencoded(self):
+        dense = self._jpeg(quality=98)
+        rotated = self._jpeg(orientation=6)
+        self.assertFalse(image_pipeline.passthrough_jpeg(dense, len(dense)))
+        self.assertFalse(image_pipeline.passthrough_jpeg(rotated, len(rotated)))
+        compliant = self._jpeg()
+        self.assertTrue(image_pipeline.passthrough_jpeg(compliant, len(compliant)))
+        data, _variants = image_pipeline.compress_upload(rotated)
+        with image_pipeline.Image.open(BytesIO(data)) as stored:
+            self.assertEqual(stored.size, (1200, 1600))
+
+    def test_strip_keeps_icc_profile_and_rejects_garbage(self):
+        self.assertEqual(image_pipeline.strip_jpeg_metadata(b"not a jpeg"), b"not a jpeg")
+        img = image_pipeline.Image.new("RGB", (64, 64), (10, 20, 30))
+        buf = BytesIO()
+        img.save(buf, format="JPEG", icc_profile=b"\0" * 128, comment=b"note")
+        stripped = image_pipeline.strip_jpeg_metadata(buf.getvalue())
+        self.assertIn(b"ICC_PROFILE", stripped)
+        self.assertNotIn(b"note", stripped)
+
+
+def _png_header_only(width, height):
+    """PNG с пустым IDAT: заголовок обещает width×height, пиксельных данных нет."""
+
+    def chunk(tag, body):
+        return struct.pack(">I", len(body)) + tag + body + struct.pack(">I", zlib.crc32(tag + body))
+
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", ihdr) + chunk(b"IDAT", b"")
+
+
+class HeaderProbeTest(SimpleTestCase):
+    def test_sniff_format_by_signature(self):
+        self.assertEqual(image_pipeline.sniff_format(b"\xff\xd8\xff\xe0rest"), "jpeg")
+        self.assertEqual(image_pipeline.sniff_format(_png_header_only(1, 1)), "png")
+        self.assertEqual(image_pipeline.sniff_format(b"RIFF\0\0\0\0WEBPVP8 "), "webp")
+        self.assertEqual(image_pipeline.sniff_format(b"\0\0\0\x18ftypheic"), "heic")
+        self.assertIsNone(image_pipeline.sniff_format(b"RIFF\0\0\0\0WAVEfmt "))
+        self.assertIsNone(image_pipeline.sniff_format(b"not-an-image"))
+
+    def test_bomb_rejected_from_header_without_decoding(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        bomb = _png_header_only(60_000, 60_000)  # 3,6 Гп: полное декодирование — ~10 ГБ
+        oversized = _png_header_only(12_000, 10_000)
+        with mock.patch.object(image_pipeline, "compress_to_jpeg") as fallback:
+            with self.assertRaises(image_pipeline.ImageTooLarge) as ctx:
+                image_pipeline.compress_upload(bomb)
+            self.assertIsInstance(ctx.exception, image_pipeline.InvalidImage)
+            with self.assertRaises(image_pipeline.ImageTooLarge) as ctx:
+                image_pipeline.compress_upload(oversized)
+            self.assertIn("12000×10000", str(ctx.exception))
+            with self.assertRaises(image_pipeline.ImageTooLarge):
+                image_pipeline.decode_for_target(oversized)
+        fallback.assert_not_called()
+
+    def test_configure_limits_moves_budget(self):
+        old_max, old_pillow = image_pipeline.MAX_PIXELS, image_pipeline.Image.MAX_IMAGE_PIXELS
+        self.addCleanup(setattr, image_pipeline, "MAX_PIXELS", old_max)
+        self.addCleanup(setattr, image_pipeline.Image, "MAX_IMAGE_PIXELS", old_pillow)
+
+        image_pipeline.configure_limits(5_000)
+        self.assertEqual(image_pipeline.Image.MAX_IMAGE_PIXELS, 5_000)
+        self.assertEqual(image_pipeline.probe_dimensions(_png_header_only(50, 100)), (50, 100))
+        with self.assertRaises(image_pipeline.ImageTooLarge):
+            image_pipeline.probe_dimensions(_png_header_only(100, 100))
+        self.assertIsNone(image_pipeline.probe_dimensions(b"not-an-image"))
@@ -0,0 +1,64 @@
+from django.core.cache import cache
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from core.facets import property_facets
+from core.models import Property
+
+
+def _counts(facet):
+    return {item["value"]: item["count"] for item in facet}
+
+
+class PanelFacetsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        Property.objects.create(category="flat", operation="sale", export_to_cian=True)
+        Property.objects.create(category="flat", operation="rent_long", export_to_cian=False)
+        Property.objects.create(
+            category="house", operation="sale", status="archived",
+            is_archived=True, export_to_domklik=True,
+        )
+
+    def test_counts_from_single_aggregate(self):
+        with self.assertNumQueries(2):  # версия данных + GROUP BY
+            facets = property_facets()
+        self.assertEqual(facets["total"], 3)
+        self.assertEqual(_counts(facets["category"])["flat"], 2)
+        self.assertEqual(_counts(facets["category"])["house"], 1)
+        self.assertEqual(_counts(facets["operation"])["sale"], 2)
+        self.assertEqual(_counts(facets["status"]), {"active": 2, "archived": 1})
+        self.assertEqual(
+            _counts(facets["export"]), {"export_to_cian": 2, "export_to_domklik": 1}
+        )
+
+    def test_cached_until_property_changes(self):
+        property_facets()
+        with self.assertNumQueries(1):  # только версия данных
+            property_facets()
+
+        prop = Property.objects.create(category="land", operation="sale")
+        self.assertEqual(_counts(property_facets()["category"])["land"], 1)
+
+        prop.delete()
+        self.assertEqual(_counts(property_facets()["category"])["land"], 0)
+
+    def test_write_from_another_process_changes_key(self):
+        property_facets()
+        # .update() не шлёт сигналов — как запись, сделанная другим воркером
+        Property.objects.filter(category="house").update(
+            category="land", updated_at=timezone.now()
+        )
+        facets = property_facets()
+        self.assertEqual(_counts(facets["category"])["land"], 1)
+        self.assertEqual(_counts(facets["category"])["house"], 0)
+
+    def test_list_page_shows_facets_with_one_version_query(self):
+        url = reverse("panel_list")
+        self.client.get(url)  # прогреваем кэш
+        with self.assertNumQueries(2):
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertContains(resp, "panel-facets")
+        self.assertContains(resp, "?category=flat")
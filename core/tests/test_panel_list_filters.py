@@ -0,0 +1,110 @@
+import re
+
+from django.http import QueryDict
+from django.test import TestCase
+from django.urls import reverse
+
+from core.models import Property
+
+# «SCAN core_property» без «USING INDEX» — полный проход по таблице.
+FULL_SCAN_RE = re.compile(r"\bSCAN core_property\b(?! USING)")
+
+
+def _list_queryset(query):
+    # core.views подменяет заглушку PIL на настоящий Pillow при импорте;
+    # импортируем лениво, чтобы не влиять на сбор других тестов.
+    from core.views import _panel_list_queryset
+
+    qs, _ = _panel_list_queryset(QueryDict(query))
+    return qs
+
+
+class PanelListFiltersTest(TestCase):
+    def setUp(self):
+        self.flat_cheap = Property.objects.create(
+            title="Flat cheap", address="Addr FlatCheap", category="flat",
+            operation="sale", price=3_000_000, total_area=30,
+        )
+        self.flat_big = Property.objects.create(
+            title="Flat big", address="Addr FlatBig", category="flat",
+            operation="sale", price=9_000_000, total_area=90,
+        )
+        self.house_rent = Property.objects.create(
+            title="House", address="Addr HouseRent", category="house",
+            operation="rent_long", price=50_000, total_area=120,
+        )
+        self.archived = Property.objects.create(
+            title="Old", address="Addr Archived", category="flat",
+            operation="sale", price=1_000_000, is_archived=True,
+        )
+
+    def _ids(self, query):
+        return list(_list_queryset(query).values_list("id", flat=True))
+
+    def test_category_and_operation_filters(self):
+        self.assertCountEqual(
+            self._ids("category=flat"), [self.flat_cheap.id, self.flat_big.id]
+        )
+        self.assertEqual(self._ids("operation=rent_long"), [self.house_rent.id])
+
+    def test_price_and_area_ranges(self):
+        self.assertEqual(self._ids("price_min=5000000"), [self.flat_big.id])
+        self.assertCountEqual(
+            self._ids("price_max=5000000"), [self.flat_cheap.id, self.house_rent.id]
+        )
+        self.assertEqual(self._ids("area_min=50&area_max=100"), [self.flat_big.id])
+
+    def test_sort_options(self):
+        self.assertEqual(
+            self._ids("sort=price"),
+            [self.house_rent.id, self.flat_cheap.id, self.flat_big.id],
+        )
+        self.assertEqual(
+            self._ids("sort=-area"),
+            [self.house_rent.id, self.flat_big.id, self.flat_cheap.id],
+        )
+
+    def test_invalid_values_are_ignored(self):
+        self.assertEqual(
+            len(self._ids("category=spaceship&sort=bogus&price_min=abc")), 3
+        )
+
+    def test_page_renders_with_filters(self):
+        resp = self.client.get(reverse("panel_list") + "?category=house&sort=-price")
+        self.assertEqual(resp.status_code, 200)
+        html = resp.content.decode()
+        self.assertIn("Addr HouseRent", html)
+        self.assertNotIn("Addr FlatBig", html)
+
+
+class PanelListQueryPlanTest(TestCase):
+    """Все основные пути доступа списка и фидов должны идти через индексы."""
+
+    LIST_QUERIES = [
+        "",
+        "show=archived",
+        "show=all",
+        "sort=updated",
+        "sort=-created",
+        "sort=price",
+        "sort=-area",
+        "category=flat",
+        "category=flat&operation=sale",
+        "price_min=100&price_max=500",
+        "area_min=30&area_max=60",
+    ]
+
+    def assertNoFullScan(self, qs, label):
+        plan = qs.explain()
+        self.assertIsNone(FULL_SCAN_RE.search(plan), f"{label}: {plan}")
+
+    def test_panel_list_paths_use_indexes(self):
+        for query in self.LIST_QUERIES:
+            with self.subTest(query=query):
+                self.assertNoFullScan(_list_queryset(query), query or "<default>")
+
+    def test_export_paths_use_indexes(self):
+        for flag in ("export_to_cian", "export_to_domklik"):
+            with self.subTest(flag=flag):
+                qs = Property.objects.filter(**{flag: True, "is_archived": False}).order_by("id")
+                self.assertNoFullScan(qs, flag)
@@ -0,0 +1,40 @@
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.test import TestCase
+from django.urls import reverse
+
+from core.models import Property
+
+
+def _row_key(prop):
+    prop.refresh_from_db()
+    return make_template_fragment_key("panel_row", [prop.pk, prop.updated_at.isoformat()])
+
+
+class PanelRowFragmentCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.first = Property.objects.create(address="Addr First", price=1000)
+        self.second = Property.objects.create(address="Addr Second", price=2000)
+
+    def test_rows_are_cached_after_first_render(self):
+        self.client.get(reverse("panel_list"))
+        self.assertIsNotNone(cache.get(_row_key(self.first)))
+        self.assertIsNotNone(cache.get(_row_key(self.second)))
+
+    def test_edit_invalidates_only_own_row(self):
+        self.client.get(reverse("panel_list"))
+        second_key = _row_key(self.second)
+        first_key_before = _row_key(self.first)
+
+        resp = self.client.post(
+            reverse("panel_update_price", args=[self.first.pk]), {"price": "777555"}
+        )
+        self.assertEqual(resp.status_code, 200)
+        self.assertNotEqual(_row_key(self.first), first_key_before)
+        self.assertIsNone(cache.get(_row_key(self.first)))
+        self.assertIsNotNone(cache.get(second_key))
+
+        html = self.client.get(reverse("panel_list")).content.decode()
+        self.assertIn("777 555", html)
+        self.assertIsNotNone(cache.get(_row_key(self.first)))
@@ -0,0 +1,84 @@
+import os
+import tempfile
+from io import StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Photo, PhotoCleanup, Property
+
+
+class PhotoBulkDeleteTest(TestCase):
+    def setUp(self):
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.prop = Property.objects.create(title="Bulk", address="Addr")
+
+    def _photo(self, name, variants=""):
+        photo = Photo.objects.create(property=self.prop)
+        photo.image.save(name, ContentFile(b"data"), save=False)
+        photo.variants = variants
+        photo.save()
+        return photo
+
+    def _exists(self, name):
+        return os.path.exists(os.path.join(self._media.name, name))
+
+    def test_bulk_delete_defers_files_to_sweeper(self):
+        first = self._photo("a.jpg", "w320.jpg")
+        second = self._photo("b.jpg")
+        kept = self._photo("c.jpg")
+        thumb = first.image.name.replace(".jpg", ".w320.jpg")
+        first.image.storage.save(thumb, ContentFile(b"thumb"))
+
+        with mock.patch.object(FileSystemStorage, "delete", side_effect=AssertionError):
+            resp = self.client.post(
+                reverse("panel_photos_bulk_delete"),
+                {"property_id": self.prop.id, "ids[]": [first.id, second.id]},
+            )
+        self.assertCountEqual(resp.json()["deleted"], [first.id, second.id])
+        self.assertEqual(list(Photo.objects.values_list("id", flat=True)), [kept.id])
+        # файлы ещё на месте — их удалит sweeper
+        self.assertTrue(self._exists(first.image.name))
+        self.assertEqual(PhotoCleanup.objects.count(), 2)
+
+        out = StringIO()
+        call_command("sweep_photo_cleanup", stdout=out)
+        self.assertIn("files deleted: 2", out.getvalue())
+        self.assertFalse(self._exists(first.image.name))
+        self.assertFalse(self._exists(thumb))
+        self.assertFalse(self._exists(second.image.name))
+        self.assertTrue(self._exists(kept.image.name))
+        self.assertFalse(PhotoCleanup.objects.exists())
+
+    def test_sweeper_keeps_file_still_referenced(self):
+        first = self._photo("shared.jpg")
+        other = Property.objects.create(title="Other", address="Addr 2")
+        Photo.objects.create(property=other, image=first.image.name)
+
+        self.client.post(
+            reverse("panel_photos_bulk_delete"),
+            {"property_id": self.prop.id, "ids[]": [first.id]},
+        )
+        call_command("sweep_photo_cleanup", stdout=StringIO())
+        self.assertTrue(self._exists(first.image.name))
+        self.assertFalse(PhotoCleanup.objects.exists())
+
+    def test_files_of_single_delete_after_bulk_delete_are_removed(self):
+        first = self._photo("a.jpg")
+        second = self._photo("b.jpg")
+        self.client.post(
+            reverse("panel_photos_bulk_delete"),
+            {"property_id": self.prop.id, "ids[]": [first.id]},
+        )
+        # флаг bulk_delete не остаётся включённым после запроса
+        second.delete()
+        self.assertFalse(self._exists(second.image.name))
+        self.assertTrue(self._exists(first.image.name))
@@ -0,0 +1,81 @@
+import os
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import views
+from core.models import Photo, Property
+from core.utils import image_pipeline
+
+
+def _jpeg_bytes(color=(120, 60, 30), size=(1200, 900)):
+    buf = BytesIO()
+    image_pipeline.Image.new("RGB", size, color).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class PhotoDedupTest(TestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.first = Property.objects.create(title="First", address="Addr 1")
+        self.second = Property.objects.create(title="Second", address="Addr 2")
+
+    def _upload(self, prop, *payloads):
+        files = [
+            SimpleUploadedFile(f"p{i}.jpg", payload, content_type="image/jpeg")
+            for i, payload in enumerate(payloads)
+        ]
+        with mock.patch.object(views, "compress_upload", wraps=views.compress_upload) as spy:
+            self.client.post(reverse("panel_add_photo", args=[prop.id]), {"images": files})
+        return spy.call_count
+
+    def _path(self, photo):
+        return os.path.join(self._media.name, photo.image.name)
+
+    def test_reupload_reuses_stored_file_without_compression(self):
+        payload = _jpeg_bytes()
+        self.assertEqual(self._upload(self.first, payload), 1)
+        self.assertEqual(self._upload(self.second, payload), 0)
+
+        original = Photo.objects.get(property=self.first)
+        copy = Photo.objects.get(property=self.second)
+        self.assertEqual(original.image.name, copy.image.name)
+        self.assertEqual(original.variants, copy.variants)
+        self.assertEqual(len(original.source_hash), 64)
+
+    def test_duplicate_in_one_batch_is_compressed_once(self):
+        payload = _jpeg_bytes()
+        self.assertEqual(self._upload(self.first, payload, _jpeg_bytes((1, 2, 3)), payload), 2)
+        photos = list(Photo.objects.filter(property=self.first).order_by("sort"))
+        self.assertEqual(len(photos), 3)
+        self.assertEqual(photos[0].image.name, photos[2].image.name)
+        self.assertNotEqual(photos[0].image.name, photos[1].image.name)
+
+    def test_shared_file_is_deleted_with_last_reference(self):
+        payload = _jpeg_bytes()
+        self._upload(self.first, payload)
+        self._upload(self.second, payload)
+        original = Photo.objects.get(property=self.first)
+        copy = Photo.objects.get(property=self.second)
+        path = self._path(original)
+        thumb = os.path.join(
+            self._media.name, image_pipeline.variant_name(original.image.name, "w320.jpg")
+        )
+
+        original.delete()
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(os.path.exists(thumb))
+
+        copy.delete()
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(thumb))
@@ -0,0 +1,118 @@
+import tempfile
+from datetime import timedelta
+from io import BytesIO, StringIO
+
+from django.contrib.messages import get_messages
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core import photo_jobs
+from core.models import Photo, PhotoJob, Property
+
+
+def _jpeg_bytes(size=(64, 48)):
+    from PIL import Image
+
+    buf = BytesIO()
+    Image.new("RGB", size, (120, 60, 30)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class PhotoUploadQueueTest(TestCase):
+    def setUp(self):
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name, PHOTO_UPLOAD_QUEUE=True)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.prop = Property.objects.create(title="Queue", address="Addr")
+        self.upload_url = reverse("panel_add_photo", args=[self.prop.id])
+        self.status_url = reverse("panel_photo_jobs_status", args=[self.prop.id])
+
+    def _upload(self, *files, **extra):
+        return self.client.post(self.upload_url, {"images": list(files), **extra})
+
+    def _run_worker(self):
+        call_command("photo_worker", "--once", stdout=StringIO())
+
+    def test_upload_is_queued_and_processed_by_worker(self):
+        resp = self._upload(
+            SimpleUploadedFile("a.jpg", _jpeg_bytes(), content_type="image/jpeg"),
+            SimpleUploadedFile("b.jpg", _jpeg_bytes(), content_type="image/jpeg"),
+            is_default="on",
+        )
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(Photo.objects.filter(property=self.prop).exists())
+        self.assertEqual(PhotoJob.objects.filter(property=self.prop).count(), 2)
+        self.assertEqual(self.client.get(self.status_url).json()["pending"], 2)
+
+        self._run_worker()
+
+        self.assertEqual(self.client.get(self.status_url).json()["pending"], 0)
+        self.assertFalse(PhotoJob.objects.exists())
+        photos = list(Photo.objects.filter(property=self.prop).order_by("-is_default", "sort"))
+        self.assertEqual(len(photos), 2)
+        self.assertTrue(photos[0].is_default)
+        self.assertEqual(photos[0].sort, 0)
+        self.assertFalse(photos[1].is_default)
+        self.assertTrue(photos[1].image.name.endswith(".jpg"))
+
+    def test_failed_job_error_is_shown_once(self):
+        # сигнатура JPEG верная (проходит проверку заголовка), но данные битые
+        payload = b"\xff\xd8\xff\xe0" + b"not-an-image" * 8
+        self._upload(SimpleUploadedFile("bad.jpg", payload, content_type="image/jpeg"))
+        self._run_worker()
+        job = PhotoJob.objects.get()
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(self.client.get(self.status_url).json()["failed"], 1)
+
+        resp = self.client.get(reverse("panel_edit", args=[self.prop.id]))
+        msgs = [m.message for m in get_messages(resp.wsgi_request)]
+        self.assertIn("Неподдерживаемый формат или повреждённое изображение.", msgs)
+        self.assertFalse(PhotoJob.objects.exists())
+
+    def test_unknown_signature_rejected_without_queueing(self):
+        resp = self._upload(
+            SimpleUploadedFile("bad.jpg", b"not-an-image", content_type="image/jpeg")
+        )
+        msgs = [m.message for m in get_messages(resp.wsgi_request)]
+        self.assertIn("Неподдерживаемый формат или повреждённое изображение.", msgs)
+        self.assertFalse(PhotoJob.objects.exists())
+
+    def test_heic_rejected_without_queueing(self):
+        resp = self._upload(SimpleUploadedFile("x.heic", b"fake", content_type="image/heic"))
+        msgs = [m.message for m in get_messages(resp.wsgi_request)]
+        self.assertIn("HEIC/HEIF пока не поддерживается — сохраните как JPG/PNG/WebP.", msgs)
+        self.assertFalse(PhotoJob.objects.exists())
+
+    def test_edit_page_polls_while_pending(self):
+        self._upload(SimpleUploadedFile("a.jpg", _jpeg_bytes(), content_type="image/jpeg"))
+        resp = self.client.get(reverse("panel_edit", args=[self.prop.id]))
+        self.assertContains(resp, 'id="photo-jobs-status"')
+        self.assertContains(resp, self.status_url)
+
+    def test_stale_job_out_of_attempts_fails_and_drops_source(self):
+        self._upload(SimpleUploadedFile("a.jpg", _jpeg_bytes(), content_type="image/jpeg"))
+        self._upload(SimpleUploadedFile("b.jpg", _jpeg_bytes(), content_type="image/jpeg"))
+        exhausted, retried = PhotoJob.objects.order_by("id")
+        long_ago = timezone.now() - timedelta(hours=1)
+        PhotoJob.objects.filter(pk=exhausted.pk).update(
+            status="processing", attempts=photo_jobs.MAX_ATTEMPTS, updated_at=long_ago
+        )
+        PhotoJob.objects.filter(pk=retried.pk).update(
+            status="processing", attempts=1, updated_at=long_ago
+        )
+        storage = exhausted.source.storage
+
+        self.assertEqual(photo_jobs.requeue_stale_jobs(timedelta(minutes=10)), 2)
+
+        exhausted.refresh_from_db()
+        self.assertEqual(exhausted.status, "failed")
+        self.assertEqual(exhausted.error, photo_jobs.UNEXPECTED_ERROR_MESSAGE)
+        self.assertFalse(storage.exists(exhausted.source.name))
+        retried.refresh_from_db()
+        self.assertEqual(retried.status, "pending")
+        self.assertTrue(storage.exists(retried.source.name))
@@ -0,0 +1,75 @@
+import hashlib
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.storage import FileSystemStorage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Photo, Property
+from core.utils import image_pipeline
+
+
+def _jpeg_bytes(size=(1200, 900)):
+    buf = BytesIO()
+    image_pipeline.Image.new("RGB", size, (120, 60, 30)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class PhotoFileMetaTest(TestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.prop = Property.objects.create(title="Meta", address="Addr")
+
+    def _stored_bytes(self, photo):
+        with open(os.path.join(self._media.name, photo.image.name), "rb") as fh:
+            return fh.read()
+
+    def test_upload_stores_file_meta(self):
+        self.client.post(
+            reverse("panel_add_photo", args=[self.prop.id]),
+            {"image": SimpleUploadedFile("p.jpg", _jpeg_bytes(), content_type="image/jpeg")},
+        )
+        photo = Photo.objects.get(property=self.prop)
+        data = self._stored_bytes(photo)
+        self.assertEqual((photo.width, photo.height), (1200, 900))
+        self.assertEqual(photo.byte_size, len(data))
+        self.assertEqual(photo.mime_type, "image/jpeg")
+        self.assertEqual(photo.content_hash, hashlib.sha256(data).hexdigest())
+
+    def test_gallery_render_does_not_touch_files(self):
+        self.client.post(
+            reverse("panel_add_photo", args=[self.prop.id]),
+            {"image": SimpleUploadedFile("p.jpg", _jpeg_bytes(), content_type="image/jpeg")},
+        )
+        photo = Photo.objects.get(property=self.prop)
+        with mock.patch.object(FileSystemStorage, "open", side_effect=AssertionError), \
+                mock.patch.object(FileSystemStorage, "size", side_effect=AssertionError):
+            self.assertTrue(photo.human_size().endswith("КБ"))
+            resp = self.client.get(reverse("panel_edit", args=[self.prop.id]))
+        self.assertEqual(resp.status_code, 200)
+
+    def test_backfill_fills_legacy_rows(self):
+        data = _jpeg_bytes((640, 480))
+        name = FileSystemStorage().save("photos/legacy.jpg", BytesIO(data))
+        first = Photo.objects.create(property=self.prop, image=name)
+        shared = Photo.objects.create(property=self.prop, image=name)
+        self.assertIsNone(first.byte_size)
+
+        out = StringIO()
+        call_command("backfill_photo_meta", stdout=out)
+        self.assertIn("Photos updated: 2", out.getvalue())
+        for photo in (first, shared):
+            photo.refresh_from_db()
+            self.assertEqual((photo.width, photo.height, photo.byte_size), (640, 480, len(data)))
+            self.assertEqual(photo.mime_type, "image/jpeg")
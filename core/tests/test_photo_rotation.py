@@ -0,0 +1,155 @@
+import json
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core import photo_store, views
+from core.models import Photo, Property
+from core.utils import image_pipeline
+
+
+def _jpeg_bytes(size=(1200, 600)):
+    buf = BytesIO()
+    image_pipeline.Image.new("RGB", size, (20, 90, 160)).save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+class PhotoRotationTest(TestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.prop = Property.objects.create(title="Rotate", address="Addr")
+        self.photo = Photo(property=self.prop)
+        self.photo.image.save("rotate.jpg", ContentFile(_jpeg_bytes()), save=True)
+
+    def _rotate(self, direction):
+        resp = self.client.post(
+            reverse("panel_photo_rotate", args=[self.photo.id]) + f"?dir={direction}"
+        )
+        return json.loads(resp.content.decode("utf-8"))
+
+    def _stored_size(self, photo):
+        with image_pipeline.Image.open(os.path.join(self._media.name, photo.image.name)) as im:
+            return im.size
+
+    def test_click_only_updates_orientation(self):
+        before = os.path.getmtime(os.path.join(self._media.name, self.photo.image.name))
+        self.assertEqual(self._rotate("right")["orientation"], 90)
+        self.assertEqual(self._rotate("right")["orientation"], 180)
+        self.assertEqual(self._rotate("left")["orientation"], 90)
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.orientation, 90)
+        self.assertEqual(self._stored_size(self.photo), (1200, 600))
+        self.assertEqual(
+            before, os.path.getmtime(os.path.join(self._media.name, self.photo.image.name))
+        )
+
+        resp = self.client.get(reverse("panel_edit", args=[self.prop.id]))
+        self.assertContains(resp, "transform: rotate(90deg)")
+
+    def test_full_turn_is_a_no_op(self):
+        for _ in range(4):
+            self._rotate("left")
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.orientation, 0)
+        self.assertEqual(photo_store.apply_pending_orientations(), 0)
+
+    def test_worker_applies_rotation_once_and_rebuilds_variants(self):
+        self._rotate("right")
+        call_command("photo_worker", "--once", stdout=StringIO())
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.orientation, 0)
+        self.assertEqual(self._stored_size(self.photo), (600, 1200))
+        self.assertIn("w320.jpg", self.photo.variant_keys())
+        thumb = image_pipeline.variant_name(self.photo.image.name, "w320.jpg")
+        with image_pipeline.Image.open(os.path.join(self._media.name, thumb)) as im:
+            self.assertEqual(im.size, (320, 640))
+
+    def test_feed_export_applies_pending_rotation(self):
+        self.prop.export_to_cian = True
+        self.prop.save(update_fields=["export_to_cian"])
+        self._rotate("left")
+        self.client.get(reverse("export_cian"))
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.orientation, 0)
+        self.assertEqual(self._stored_size(self.photo), (600, 1200))
+
+    def test_feed_export_rotates_at_most_the_limit(self):
+        self.prop.export_to_cian = True
+        self.prop.save(update_fields=["export_to_cian"])
+        other = Photo(property=self.prop)
+        other.image.save("other.jpg", ContentFile(_jpeg_bytes()), save=True)
+        Photo.objects.filter(pk__in=[self.photo.pk, other.pk]).update(orientation=90)
+        with mock.patch.object(views, "FEED_ROTATION_LIMIT", 1):
+            self.client.get(reverse("export_cian"))
+        self.assertEqual(photo_store.pending_orientations().count(), 1)
+
+    def test_shared_file_is_copied_before_rotation(self):
+        twin = photo_store.share_image(Photo(property=self.prop), self.photo)
+        twin.save()
+        self._rotate("right")
+        photo_store.apply_pending_orientations()
+        self.photo.refresh_from_db()
+        twin.refresh_from_db()
+        self.assertNotEqual(self.photo.image.name, twin.image.name)
+        self.assertEqual(self._stored_size(self.photo), (600, 1200))
+        self.assertEqual(self._stored_size(twin), (1200, 600))
+
+    def test_rotated_file_stays_in_its_directory(self):
+        first = self.photo.image.name
+        directory = os.path.dirname(first)
+        for _ in range(2):
+            self._rotate("right")
+            photo_store.apply_pending_orientations()
+            self.photo.refresh_from_db()
+            self.assertEqual(os.path.dirname(self.photo.image.name), directory)
+            self.assertTrue(os.path.exists(os.path.join(self._media.name, self.photo.image.name)))
+        self.assertFalse(os.path.exists(os.path.join(self._media.name, first)))
+        self.assertEqual(self._stored_size(self.photo), (1200, 600))
+
+    def test_failed_row_update_keeps_original_file(self):
+        self._rotate("right")
+        original = os.path.join(self._media.name, self.photo.image.name)
+        photo = Photo.objects.get(pk=self.photo.pk)
+        with mock.patch.object(Photo.objects, "filter", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                photo_store.apply_orientation(photo)
+        self.assertTrue(os.path.exists(original))
+        # повёрнутая копия, записанная до сбоя, тоже убрана
+        self.assertEqual(os.listdir(os.path.dirname(original)), [os.path.basename(original)])
+
+    def test_missing_file_resets_orientation(self):
+        self._rotate("right")
+        os.remove(os.path.join(self._media.name, self.photo.image.name))
+        with self.assertLogs("upload", "WARNING"):
+            self.assertEqual(photo_store.apply_pending_orientations(), 0)
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.orientation, 0)
+
+    def test_unexpected_failure_backs_off(self):
+        self.addCleanup(photo_store._rotation_failures.clear)
+        self._rotate("right")
+        with mock.patch.object(
+            photo_store, "apply_orientation", side_effect=PermissionError("read-only")
+        ) as rotate:
+            with self.assertLogs("upload", "ERROR"):
+                photo_store.apply_pending_orientations()
+            photo_store.apply_pending_orientations()  # следующий опрос воркера
+        self.assertEqual(rotate.call_count, 1)
+        self.photo.refresh_from_db()
+        self.assertEqual(self.photo.orientation, 90)  # поворот не потерян
+
+        with mock.patch.object(photo_store, "ROTATION_RETRY_AFTER", 0):
+            self.assertEqual(photo_store.apply_pending_orientations(), 1)
+        self.assertFalse(photo_store._rotation_failures)
@@ -0,0 +1,97 @@
+import random
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from core import photo_similar
+from core.models import Photo, Property
+from core.utils import image_pipeline
+
+
+def _scene(seed, size=(1200, 900)):
+    """Крупные цветные блоки: у разных seed — разная «композиция»."""
+
+    rng = random.Random(seed)
+    img = image_pipeline.Image.new("RGB", (12, 9))
+    img.putdata([tuple(rng.randrange(256) for _ in range(3)) for _ in range(12 * 9)])
+    return img.resize(size, image_pipeline.Image.BILINEAR)
+
+
+def _jpeg(img, quality=90):
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+class BKTreeTest(SimpleTestCase):
+    def test_search_matches_linear_scan(self):
+        rng = random.Random(7)
+        values = [rng.getrandbits(64) for _ in range(500)]
+        tree = photo_similar.BKTree(values)
+        self.assertEqual(tree.size, len(set(values)))
+        for probe in values[:20] + [rng.getrandbits(64) for _ in range(5)]:
+            for radius in (0, 8, 24):
+                expected = sorted(
+                    (photo_similar.hamming(probe, v), v)
+                    for v in set(values)
+                    if photo_similar.hamming(probe, v) <= radius
+                )
+                self.assertEqual(tree.search(probe, radius), expected)
+
+
+class DHashTest(SimpleTestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+
+    def _distance(self, a, b):
+        return photo_similar.hamming(int(a, 16), int(b, 16))
+
+    def test_recompressed_and_resized_copy_is_close(self):
+        original = image_pipeline.dhash(_jpeg(_scene(1)))
+        copy = image_pipeline.dhash(_jpeg(_scene(1).resize((640, 480)), quality=60))
+        other = image_pipeline.dhash(_jpeg(_scene(2)))
+        self.assertEqual(len(original), 16)
+        self.assertLessEqual(self._distance(original, copy), 4)
+        self.assertGreater(self._distance(original, other), photo_similar.DEFAULT_MAX_DISTANCE)
+
+    def test_undecodable_data_gives_empty_hash(self):
+        self.assertEqual(image_pipeline.dhash(b"not an image"), "")
+
+
+class DuplicateReportTest(TestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def _upload(self, prop, payload):
+        self.client.post(
+            reverse("panel_add_photo", args=[prop.id]),
+            {"image": SimpleUploadedFile("p.jpg", payload, content_type="image/jpeg")},
+        )
+
+    def test_near_duplicates_across_listings_are_grouped(self):
+        first = Property.objects.create(title="First", address="Addr 1")
+        second = Property.objects.create(title="Second", address="Addr 2")
+        self._upload(first, _jpeg(_scene(1)))
+        self._upload(first, _jpeg(_scene(2)))
+        # тот же кадр, но другие байты: дедупликация по sha256 его не поймает
+        self._upload(second, _jpeg(_scene(1).resize((1000, 750)), quality=70))
+
+        photos = list(Photo.objects.order_by("id"))
+        self.assertTrue(all(ph.dhash for ph in photos))
+        groups = photo_similar.duplicate_groups()
+        self.assertEqual([[ph.id for ph in g] for g in groups], [[photos[0].id, photos[2].id]])
+
+        out = StringIO()
+        call_command("find_duplicate_photos", "--cross-listing", stdout=out)
+        self.assertIn("Groups: 1, redundant photos: 1", out.getvalue())
@@ -1,12 +1,18 @@
 import io
+import os
+import tempfile
 from typing import Iterable
+from unittest import mock
 
 from django.contrib.messages import get_messages
 from django.core.files.uploadedfile import SimpleUploadedFile
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
+from core import views
 from core.models import Photo, Property
+from core.utils import image_pipeline
+from core.utils.decode_sandbox import DecodeFailed
 
 try:  # pragma: no cover - fallback when Pillow missing in environment
     from PIL import Image
@@ -62,3 +68,143 @@ def test_upload_invalid_file_error(self):
         self.assertEqual(resp.status_code, 200)
         self.assertIn("Неподдерживаемый формат или повреждённое изображение.", resp.content.decode("utf-8"))
         self.assertFalse(Photo.objects.filter(property=self.prop).exists())
+
+    @override_settings(PHOTO_UPLOAD_MAX_BYTES=100)
+    def test_upload_too_large_rejected_before_decode(self):
+        if not PIL_AVAILABLE:
+            self.skipTest("Pillow not available")
+        data = _img_bytes("PNG", size=(200, 200))
+        self.assertGreater(len(data), 100)
+        with mock.patch.object(views, "compress_upload") as compress:
+            resp = self._post_image(data, "big.png", "image/png", follow=True)
+        compress.assert_not_called()
+        self.assertIn("Файл слишком большой", resp.content.decode("utf-8"))
+        self.assertFalse(Photo.objects.filter(property=self.prop).exists())
+
+    def test_upload_over_pixel_budget_rejected_before_decode(self):
+        if not PIL_AVAILABLE:
+            self.skipTest("Pillow not available")
+        data = _img_bytes("JPEG", size=(64, 48))
+        with mock.patch.object(image_pipeline, "MAX_PIXELS", 1000), mock.patch.object(
+            views, "compress_upload"
+        ) as compress:
+            resp = self._post_image(data, "photo.jpg", "image/jpeg", follow=True)
+        compress.assert_not_called()
+        self.assertIn("Слишком большое изображение: 64×48", resp.content.decode("utf-8"))
+        self.assertFalse(Photo.objects.filter(property=self.prop).exists())
+
+    def test_sandbox_failure_rejects_only_that_file(self):
+        if not PIL_AVAILABLE:
+            self.skipTest("Pillow not available")
+        data = _img_bytes("JPEG", size=(64, 48))
+        failure = DecodeFailed("timeout", "Изображение обрабатывалось дольше 60 с — уменьшите его.")
+        with mock.patch.object(views, "compress_upload", side_effect=failure):
+            resp = self._post_image(data, "photo.jpg", "image/jpeg", follow=True)
+        self.assertIn("обрабатывалось дольше 60 с", resp.content.decode("utf-8"))
+        self.assertFalse(Photo.objects.filter(property=self.prop).exists())
+
+    def test_signature_checked_instead_of_extension(self):
+        resp = self._post_image(b"GIF89a-but-truncated", "photo.jpg", "image/jpeg", follow=True)
+        self.assertFalse(Photo.objects.filter(property=self.prop).exists())
+        resp = self._post_image(b"<html>not an image</html>", "photo.jpg", "image/jpeg", follow=True)
+        self.assertIn("Неподдерживаемый формат или повреждённое изображение.", resp.content.decode("utf-8"))
+
+    def test_failed_batch_save_leaves_no_files(self):
+        if not PIL_AVAILABLE:
+            self.skipTest("Pillow not available")
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        uploads = [
+            SimpleUploadedFile("one.jpg", _img_bytes("JPEG", (1200, 900)), content_type="image/jpeg"),
+            SimpleUploadedFile("two.jpg", _img_bytes("JPEG", color=(200, 0, 0)), content_type="image/jpeg"),
+        ]
+        original_save = Photo.save
+
+        def failing_second_save(photo, *args, **kwargs):
+            original_save(photo, *args, **kwargs)  # файлы уже записаны
+            if photo.image.name.rsplit("/", 1)[-1].startswith("two"):
+                raise RuntimeError("db down")
+
+        with override_settings(MEDIA_ROOT=media.name), mock.patch.object(
+            Photo, "save", failing_second_save
+        ):
+            resp = self.client.post(
+                reverse("panel_add_photo", args=[self.prop.id]), data={"images": uploads}
+            )
+        self.assertEqual(resp.status_code, 302)
+        self.assertFalse(Photo.objects.filter(property=self.prop).exists())
+        left = [name for _root, _dirs, names in os.walk(media.name) for name in names]
+        self.assertEqual(left, [])
+
+    @override_settings(FILE_UPLOAD_MAX_MEMORY_SIZE=0)
+    def test_disk_upload_compressed_from_temporary_file(self):
+        if not PIL_AVAILABLE:
+            self.skipTest("Pillow not available")
+        data = _img_bytes("JPEG", size=(64, 48))
+        with mock.patch.object(views, "compress_upload", wraps=views.compress_upload) as spy:
+            resp = self._post_image(data, "photo.jpg", "image/jpeg")
+        self.assertEqual(resp.status_code, 302)
+        source, source_len = spy.call_args.args
+        # исходник читается с диска по пути, а не копией в bytes
+        self.assertIsInstance(source, str)
+        self.assertEqual(source_len, len(data))
+        self.assertTrue(Photo.objects.filter(property=self.prop).exists())
+
+
+class PhotoBatchUploadTest(TestCase):
+    def setUp(self) -> None:
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.prop = Property.objects.create(title="Batch", address="Addr")
+
+    def _files(self, *names):
+        files = []
+        for idx, name in enumerate(names):
+            color = (10 * idx, 20, 30)  # разные байты — иначе сработает дедупликация
+            payload = b"broken" if name.startswith("bad") else _img_bytes("JPEG", (40, 30), color)
+            files.append(SimpleUploadedFile(name, payload, content_type="image/jpeg"))
+        return files
+
+    def test_parallel_batch_keeps_order_and_default(self):
+        if not PIL_AVAILABLE:
+            self.skipTest("Pillow not available")
+        Photo.objects.create(property=self.prop, full_url="http://example.com/old.jpg", sort=10, is_default=True)
+        with self.settings(PHOTO_UPLOAD_WORKERS=4):
+            resp = self.client.post(
+                reverse("panel_add_photo", args=[self.prop.id]),
+                data={"images": self._files("a.jpg", "bad.jpg", "b.jpg", "c.jpg"), "is_default": "on"},
+            )
+        self.assertEqual(resp.status_code, 302)
+        msgs = list(self._messages(resp))
+        self.assertIn("Неподдерживаемый формат или повреждённое изображение.", msgs)
+        self.assertIn("Фото добавлено.", msgs)
+
+        new = list(
+            Photo.objects.filter(property=self.prop, image__isnull=False)
+            .exclude(image="")
+            .order_by("sort")
+        )
+        self.assertEqual([p.sort for p in new], [0, 20, 30])
+        self.assertEqual([p.image.name.rsplit("/", 1)[-1][:1] for p in new], ["a", "b", "c"])
+        self.assertEqual(
+            list(Photo.objects.filter(property=self.prop, is_default=True)), [new[0]]
+        )
+
+    def test_default_not_moved_when_first_file_fails(self):
+        if not PIL_AVAILABLE:
+            self.skipTest("Pillow not available")
+        with self.settings(PHOTO_UPLOAD_WORKERS=4):
+            self.client.post(
+                reverse("panel_add_photo", args=[self.prop.id]),
+                data={"images": self._files("bad.jpg", "a.jpg"), "is_default": "on"},
+            )
+        photos = list(Photo.objects.filter(property=self.prop))
+        self.assertEqual(len(photos), 1)
+        self.assertFalse(photos[0].is_default)
+        self.assertEqual(photos[0].sort, 10)
+
+    def _messages(self, response) -> Iterable[str]:
+        return [m.message for m in get_messages(response.wsgi_request)]
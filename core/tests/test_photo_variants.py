@@ -0,0 +1,165 @@
+import os
+import tempfile
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from core.models import Photo, Property
+from core.utils import image_pipeline
+
+
+def _jpeg_bytes(size=(1200, 900)):
+    buf = BytesIO()
+    image_pipeline.Image.new("RGB", size, (120, 60, 30)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class PhotoVariantsTest(TestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.prop = Property.objects.create(title="Variants", address="Addr")
+
+    def _variant_path(self, photo, key):
+        return os.path.join(
+            self._media.name, image_pipeline.variant_name(photo.image.name, key)
+        )
+
+    def test_upload_stores_thumbnails_next_to_image(self):
+        self.client.post(
+            reverse("panel_add_photo", args=[self.prop.id]),
+            {"image": SimpleUploadedFile("big.jpg", _jpeg_bytes(), content_type="image/jpeg")},
+        )
+        photo = Photo.objects.get(property=self.prop)
+        self.assertEqual(
+            [key for key in photo.variant_keys() if key.endswith(".jpg")], ["w320.jpg", "w960.jpg"]
+        )
+        for key, width in (("w320.jpg", 320), ("w960.jpg", 960)):
+            with image_pipeline.Image.open(self._variant_path(photo, key)) as thumb:
+                self.assertEqual(thumb.size[0], width)
+        self.assertIn(" 320w, ", photo.thumb_srcset)
+        self.assertTrue(photo.thumb_src.endswith(".w320.jpg"))
+
+        resp = self.client.get(reverse("panel_edit", args=[self.prop.id]))
+        self.assertContains(resp, "960w")
+
+        paths = [self._variant_path(photo, key) for key in photo.variant_keys()]
+        photo.delete()
+        for path in paths:
+            self.assertFalse(os.path.exists(path))
+
+    def test_small_upload_has_no_variants(self):
+        self.client.post(
+            reverse("panel_add_photo", args=[self.prop.id]),
+            {"image": SimpleUploadedFile("s.jpg", _jpeg_bytes((200, 150)), content_type="image/jpeg")},
+        )
+        photo = Photo.objects.get(property=self.prop)
+        self.assertEqual(photo.variants, "")
+        self.assertEqual(photo.thumb_src, photo.src)
+        self.assertEqual(photo.thumb_srcset, "")
+
+    def test_backfill_command(self):
+        photo = Photo(property=self.prop)
+        photo.image.save("legacy.jpg", ContentFile(_jpeg_bytes((1000, 750))), save=True)
+        self.assertEqual(photo.variants, "")
+
+        call_command("build_photo_variants", stdout=StringIO())
+        photo.refresh_from_db()
+        self.assertIn("w320.jpg", photo.variant_keys())
+        self.assertIn("w960.jpg", photo.variant_keys())
+        self.assertTrue(os.path.exists(self._variant_path(photo, "w960.jpg")))
+
+    def test_backfill_skips_small_photos_on_next_run(self):
+        photo = Photo(property=self.prop)
+        photo.image.save("tiny.jpg", ContentFile(_jpeg_bytes((200, 150))), save=True)
+        Photo.objects.filter(pk=photo.pk).update(width=None)  # загружено до колонки width
+
+        out = StringIO()
+        call_command("build_photo_variants", stdout=out)
+        self.assertIn(f"Small {photo.pk}", out.getvalue())
+        photo.refresh_from_db()
+        self.assertEqual((photo.width, photo.variants), (200, ""))
+
+        out = StringIO()
+        with mock.patch.object(image_pipeline, "decode_for_target") as decode:
+            call_command("build_photo_variants", stdout=out)
+        decode.assert_not_called()
+        self.assertNotIn("Small", out.getvalue())
+
+    def test_replacing_image_drops_old_variants(self):
+        self.client.post(
+            reverse("panel_add_photo", args=[self.prop.id]),
+            {"image": SimpleUploadedFile("big.jpg", _jpeg_bytes(), content_type="image/jpeg")},
+        )
+        photo = Photo.objects.get(property=self.prop)
+        old_thumb = self._variant_path(photo, "w320.jpg")
+        photo.image = ContentFile(_jpeg_bytes((100, 80)), name="other.jpg")
+        photo.save()
+        self.assertFalse(os.path.exists(old_thumb))
+        self.assertEqual(photo.variants, "")
+
+
+    def test_variant_never_overwrites_another_photos_file(self):
+        squatter = Photo(property=self.prop)
+        squatter.image.save("a.w320.jpg", ContentFile(b"someone else's photo"), save=True)
+        squatter_path = os.path.join(self._media.name, squatter.image.name)
+
+        main, derivatives = image_pipeline.compress_upload(_jpeg_bytes())
+        content = ContentFile(main, name="a.jpg")
+        content.derivatives = derivatives
+        photo = Photo(property=self.prop, image=content)
+        photo.save()
+        self.assertEqual(os.path.dirname(photo.image.name), os.path.dirname(squatter.image.name))
+
+        with open(squatter_path, "rb") as fh:
+            self.assertEqual(fh.read(), b"someone else's photo")
+        photo.refresh_from_db()
+        self.assertNotIn("w320.jpg", photo.variant_keys())
+        self.assertIn("w960.jpg", photo.variant_keys())
+
+        photo.store_variants(derivatives)  # повторная сборка тоже не трогает чужой файл
+        photo.delete()
+        self.assertTrue(os.path.exists(squatter_path))
+
+class DisplayFormatsTest(TestCase):
+    def setUp(self):
+        if "webp" not in image_pipeline.display_formats():
+            self.skipTest("Pillow without WebP encoder")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name, SITE_BASE_URL="https://crm.test")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.prop = Property.objects.create(title="Display", address="Addr")
+        self.client.post(
+            reverse("panel_add_photo", args=[self.prop.id]),
+            {"image": SimpleUploadedFile("big.jpg", _jpeg_bytes(), content_type="image/jpeg")},
+        )
+        self.photo = Photo.objects.get(property=self.prop)
+
+    def test_webp_variants_are_served_via_picture(self):
+        self.assertIn("w320.webp", self.photo.variant_keys())
+        name = image_pipeline.variant_name(self.photo.image.name, "w320.webp")
+        with image_pipeline.Image.open(os.path.join(self._media.name, name)) as thumb:
+            self.assertEqual(thumb.format, "WEBP")
+        resp = self.client.get(reverse("panel_edit", args=[self.prop.id]))
+        self.assertContains(resp, '<source type="image/webp"')
+        self.assertContains(resp, ".w960.webp 960w")
+
+    def test_feed_keeps_jpeg(self):
+        from core.cian import _resolve_photo_url
+
+        url = _resolve_photo_url(self.photo)
+        self.assertTrue(url.endswith(".jpg"), url)
+        self.assertNotIn(".w320.", url)
+
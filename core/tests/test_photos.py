@@ -6,7 +6,9 @@
 from django.conf import settings
 from django.contrib.messages import get_messages
 from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 from PIL import Image
 
@@ -136,6 +138,37 @@ def test_reorder_photos_updates_sort(self):
         msgs = [m.message for m in get_messages(response.wsgi_request)]
         self.assertIn("Порядок фото сохранён.", msgs)
 
+    def test_reorder_json_uses_single_update(self):
+        photos = [
+            Photo.objects.create(property=self.prop, full_url=f"http://example.com/{i}.jpg", sort=i)
+            for i in range(5)
+        ]
+        order = [p.id for p in reversed(photos)]
+        url = reverse("panel_photos_reorder", kwargs={"prop_id": self.prop.id})
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                url,
+                {"order": ",".join(map(str, order))},
+                HTTP_X_REQUESTED_WITH="XMLHttpRequest",
+            )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"ok": True, "order": order})
+        statements = [q["sql"].split()[0] for q in queries.captured_queries]
+        self.assertEqual(statements.count("UPDATE"), 1)
+        self.assertEqual(statements.count("SELECT"), 1)
+        self.assertEqual(
+            list(Photo.objects.filter(property=self.prop).order_by("sort").values_list("id", flat=True)),
+            order,
+        )
+
+    def test_reorder_json_without_order_is_rejected(self):
+        url = reverse("panel_photos_reorder", kwargs={"prop_id": self.prop.id})
+        response = self.client.post(url, {"order": ""}, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["error"], "invalid_payload")
+
     def test_feed_uses_saved_order(self):
         prop = Property.objects.create(
             title="Feed", address="Москва", category="flat", operation="sale",
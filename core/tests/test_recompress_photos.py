@@ -0,0 +1,80 @@
+import os
+import tempfile
+from io import BytesIO, StringIO
+
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import photo_store
+from core.models import Photo, Property
+from core.utils import image_pipeline
+
+
+def _jpeg_bytes(size, quality=95, noise=True):
+    Image = image_pipeline.Image
+    img = Image.effect_noise(size, 30).convert("RGB") if noise else Image.new("RGB", size, (5, 5, 5))
+    buf = BytesIO()
+    img.save(buf, format="JPEG", quality=quality)
+    return buf.getvalue()
+
+
+class RecompressPhotosTest(TestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        prop = Property.objects.create(title="Recompress", address="Addr")
+
+        self.big = Photo(property=prop)
+        self.big.image.save("big.jpg", ContentFile(_jpeg_bytes((3000, 2000))), save=True)
+        self.twin = photo_store.share_image(Photo(property=prop), self.big)
+        self.twin.save()
+        self.small = Photo(property=prop)
+        self.small.image.save("small.jpg", ContentFile(_jpeg_bytes((800, 600), 80, False)), save=True)
+        self.checkpoint = os.path.join(self._media.name, "recompress.ckpt")
+
+    def _run(self, *args):
+        out = StringIO()
+        call_command(
+            "recompress_photos", "--workers", "2", "--checkpoint", self.checkpoint, *args,
+            stdout=out, stderr=StringIO(),
+        )
+        return out.getvalue()
+
+    def test_recompresses_out_of_bounds_and_skips_the_rest(self):
+        old_name = self.big.image.name
+        old_size = self.big.image.size
+        small_name = self.small.image.name
+
+        out = self._run()
+        self.assertIn("Recompressed: 1", out)
+        self.assertIn("within bounds: 1, shared: 1", out)
+        self.assertIn("saved", out)
+
+        self.big.refresh_from_db()
+        self.twin.refresh_from_db()
+        self.small.refresh_from_db()
+        self.assertNotEqual(self.big.image.name, old_name)
+        self.assertEqual(self.twin.image.name, self.big.image.name)
+        self.assertFalse(os.path.exists(os.path.join(self._media.name, old_name)))
+        self.assertLess(self.big.image.size, old_size)
+        with image_pipeline.Image.open(self.big.image.path) as im:
+            self.assertEqual(max(im.size), image_pipeline.MAX_SIDE)
+        self.assertIn("w960.jpg", self.big.variant_keys())
+        self.assertEqual(self.small.image.name, small_name)
+
+        with open(self.checkpoint, encoding="utf-8") as fh:
+            self.assertEqual(int(fh.read()), self.small.id)
+
+    def test_resumes_from_checkpoint(self):
+        with open(self.checkpoint, "w", encoding="utf-8") as fh:
+            fh.write(str(self.twin.id))
+        out = self._run()
+        self.assertIn(f"Resuming after id {self.twin.id}", out)
+        self.assertIn("Checked: 1 ", out)
+        self.assertIn("Recompressed: 0", out)
@@ -0,0 +1,209 @@
+import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO, StringIO
+from unittest import mock
+
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+
+from core import remote_photos
+from core.models import Photo, Property
+from core.utils import image_pipeline
+
+
+def _jpeg_bytes(size=(1200, 900)):
+    buf = BytesIO()
+    image_pipeline.Image.new("RGB", size, (40, 90, 160)).save(buf, format="JPEG")
+    return buf.getvalue()
+
+
+class _StandIn(BaseHTTPRequestHandler):
+    """Локальная замена внешнего сервера: /photo.jpg с ETag, остальное — 404."""
+
+    body = b""
+    etag = '"v1"'
+    redirect = None
+    requests_seen = []
+
+    def do_GET(self):
+        self.requests_seen.append((self.path, self.headers.get("If-None-Match")))
+        if self.redirect and self.path == "/go":
+            self.send_response(302)
+            self.send_header("Location", self.redirect)
+            self.end_headers()
+            return
+        if self.path != "/photo.jpg":
+            self.send_response(404)
+            self.end_headers()
+            return
+        if self.headers.get("If-None-Match") == self.etag:
+            self.send_response(304)
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "image/jpeg")
+        self.send_header("Content-Length", str(len(self.body)))
+        self.send_header("ETag", self.etag)
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+class _Trickle(BaseHTTPRequestHandler):
+    """Сервер, который отдаёт тело по байту раз в 0,2 с — каждое чтение укладывается
+    в timeout, а весь файл не кончается никогда."""
+
+    def do_GET(self):
+        try:
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", "100000")
+            self.end_headers()
+            for _ in range(1000):
+                self.wfile.write(b"x")
+                self.wfile.flush()
+                time.sleep(0.2)
+        except OSError:
+            pass  # клиент закрыл соединение по своему пределу
+
+    def log_message(self, *args):
+        pass
+
+
+class RemotePhotoFetchTest(TestCase):
+    def setUp(self):
+        if not hasattr(image_pipeline.Image, "effect_noise"):
+            self.skipTest("Pillow not available")
+        self._media = tempfile.TemporaryDirectory()
+        self.addCleanup(self._media.cleanup)
+        override = override_settings(MEDIA_ROOT=self._media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        allow_local = mock.patch.object(remote_photos, "ALLOW_PRIVATE_HOSTS", True)
+        allow_local.start()
+        self.addCleanup(allow_local.stop)
+
+        _StandIn.body = _jpeg_bytes()
+        _StandIn.requests_seen = []
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _StandIn)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.base = f"http://127.0.0.1:{server.server_address[1]}"
+        self.prop = Property.objects.create(title="Remote", address="Addr")
+
+    def test_download_stores_local_copy_then_revalidates(self):
+        photo = Photo.objects.create(property=self.prop, full_url=f"{self.base}/photo.jpg")
+        broken = Photo.objects.create(property=self.prop, full_url=f"{self.base}/missing.jpg")
+
+        stats = remote_photos.ingest_remote_photos(concurrency=2, timeout=5)
+        self.assertEqual(stats["stored"], 1)
+        self.assertEqual(stats["failed"], 1)
+
+        photo.refresh_from_db()
+        self.assertTrue(photo.image)
+        self.assertTrue(os.path.exists(os.path.join(self._media.name, photo.image.name)))
+        self.assertEqual(photo.remote_status, 200)
+        self.assertEqual(photo.remote_etag, '"v1"')
+        self.assertIn("w320.jpg", photo.variant_keys())
+        self.assertEqual(photo.mime_type, "image/jpeg")
+        broken.refresh_from_db()
+        self.assertEqual(broken.remote_status, 404)
+        self.assertFalse(broken.image)
+
+        # --force скачивает безусловно, даже если файл не менялся
+        out = StringIO()
+        call_command("fetch_remote_photos", "--force", stdout=out)
+        self.assertIn("Stored: 1", out.getvalue())
+        photo.refresh_from_db()
+        stored_name = photo.image.name
+
+        # проверенные недавно ссылки без --force не трогаются
+        _StandIn.requests_seen = []
+        stats = remote_photos.ingest_remote_photos(Photo.objects.filter(pk=photo.pk), force=False)
+        self.assertEqual(stats, {"stored": 0, "not_modified": 0, "unchanged": 0, "failed": 0})
+
+        # повторная проверка — условная: 304, файл не перекачивается
+        Photo.objects.filter(pk=photo.pk).update(remote_checked_at=None)
+        stats = remote_photos.ingest_remote_photos(Photo.objects.filter(pk=photo.pk))
+        self.assertEqual(stats["not_modified"], 1)
+        self.assertEqual(_StandIn.requests_seen, [("/photo.jpg", '"v1"')])
+        photo.refresh_from_db()
+        self.assertEqual(photo.remote_status, 304)
+        self.assertEqual(photo.image.name, stored_name)
+
+    def test_unreachable_host_is_recorded(self):
+        photo = Photo.objects.create(property=self.prop, full_url="http://127.0.0.1:9/photo.jpg")
+        stats = remote_photos.ingest_remote_photos(timeout=2)
+        self.assertEqual(stats["failed"], 1)
+        photo.refresh_from_db()
+        self.assertEqual(photo.remote_status, 0)
+        self.assertIsNotNone(photo.remote_checked_at)
+
+    def test_slow_server_is_cut_off_by_total_deadline(self):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), _Trickle)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        for idx in range(3):
+            Photo.objects.create(property=self.prop, full_url=f"{base}/slow{idx}.jpg")
+
+        real_fetch = remote_photos.fetch_one
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def counting_fetch(*args, **kwargs):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            try:
+                return real_fetch(*args, **kwargs)
+            finally:
+                with lock:
+                    active[0] -= 1
+
+        started = time.monotonic()
+        with mock.patch.object(remote_photos, "fetch_one", counting_fetch):
+            stats = remote_photos.ingest_remote_photos(concurrency=1, timeout=0.5)
+        elapsed = time.monotonic() - started
+
+        self.assertEqual(stats["failed"], 3)
+        # 3 файла по пределу 0,5 × DEADLINE_FACTOR, строго по одному
+        self.assertLess(elapsed, 3 * 0.5 * remote_photos.DEADLINE_FACTOR + 2)
+        self.assertEqual(peak[0], 1)
+        self.assertEqual(set(Photo.objects.values_list("remote_status", flat=True)), {0})
+
+    def test_private_addresses_are_refused(self):
+        photo = Photo.objects.create(property=self.prop, full_url=f"{self.base}/photo.jpg")
+        with mock.patch.object(remote_photos, "ALLOW_PRIVATE_HOSTS", False):
+            result = remote_photos.fetch_one(photo.pk, photo.full_url)
+            for url in ("http://169.254.169.254/latest/", "http://10.0.0.1/a.jpg", "file:///etc/passwd"):
+                with self.assertRaises(remote_photos.BlockedURL):
+                    remote_photos._check_url(url)
+        self.assertEqual(result.status, 0)
+        self.assertIn("non-public address", result.error)
+        self.assertEqual(_StandIn.requests_seen, [])
+
+    def test_redirect_to_private_address_is_refused(self):
+        result_urls = []
+        real_check = remote_photos._check_url
+
+        def check(url):
+            result_urls.append(url)
+            if "/photo.jpg" in url:
+                raise remote_photos.BlockedURL("non-public address")
+            real_check(url)
+
+        _StandIn.redirect = "/photo.jpg"
+        self.addCleanup(setattr, _StandIn, "redirect", None)
+        with mock.patch.object(remote_photos, "_check_url", check):
+            result = remote_photos.fetch_one(1, f"{self.base}/go")
+        self.assertEqual(result_urls, [f"{self.base}/go", f"{self.base}/photo.jpg"])
+        self.assertEqual(result.status, 0)
+        self.assertNotIn(("/photo.jpg", None), _StandIn.requests_seen)
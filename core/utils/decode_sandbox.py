@@ -0,0 +1,272 @@
+"""Сжатие загрузок в отдельных процессах (песочница декодера).
+
+Декодеры Pillow/libvips разбирают присланные пользователями файлы, а
+LOAD_TRUNCATED_IMAGES включён: патологический файл может надолго занять CPU
+или раздуть память. Здесь compress_upload выполняется в небольшом пуле
+заранее запущенных процессов (forkserver — без унаследованных соединений
+с БД и потоков веб-воркера):
+
+- у каждого процесса потолок адресного пространства (resource.RLIMIT_AS);
+- на задачу — таймаут, зависший процесс убивается (SIGKILL);
+- после max_tasks задач процесс заменяется свежим (утечки, фрагментация).
+
+Упавший, зависший или вышедший за память процесс проваливает только свою
+загрузку (DecodeFailed), остальные процессы пула продолжают работать.
+Включается настройкой PHOTO_DECODE_SANDBOX; без неё compress_upload
+вызывается в текущем процессе, как раньше.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+
+from . import image_pipeline
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows: лимит памяти недоступен
+    resource = None
+
+log = logging.getLogger("upload")
+
+DEFAULT_MEMORY_MB = 2048
+DEFAULT_TIMEOUT = 60.0  # секунд на одну загрузку
+DEFAULT_MAX_TASKS = 50
+
+
+class DecodeFailed(image_pipeline.InvalidImage):
+    """Процесс песочницы не вернул результат: таймаут, нехватка памяти или падение."""
+
+    def __init__(self, reason: str, message: str):
+        self.reason = reason
+        super().__init__(message)
+
+
+def _worker_main(
+    conn, memory_bytes: int, max_pixels: int, backend: str, load_truncated: bool
+) -> None:
+    """Цикл процесса песочницы: (source, source_len) -> ответ, None — выход."""
+
+    if memory_bytes and resource is not None:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    image_pipeline.ImageFile.LOAD_TRUNCATED_IMAGES = load_truncated
+    image_pipeline.configure_limits(max_pixels)
+    image_pipeline.configure_backend(backend)
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, OSError):
+            return
+        if task is None:
+            return
+        source, source_len = task
+        try:
+            reply = ("ok", image_pipeline.compress_upload(source, source_len))
+        except image_pipeline.ImageTooLarge as e:
+            reply = ("too_large", (e.width, e.height, e.limit))
+        except image_pipeline.InvalidImage as e:
+            reply = ("invalid", str(e))
+        except MemoryError:
+            reply = ("memory", "")
+        except Exception as e:
+            reply = ("invalid", repr(e))
+        conn.send(reply)
+
+
+class _Worker:
+    def __init__(self, ctx, args):
+        self.conn, child = ctx.Pipe()
+        self.process = ctx.Process(
+            target=_worker_main, args=(child, *args), name="photo-decode", daemon=True
+        )
+        self.process.start()
+        child.close()
+        self.tasks = 0
+
+    def stop(self, kill: bool = False) -> None:
+        if kill:
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                self.process.kill()
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class DecodePool:
+    """Пул процессов песочницы; не больше size задач одновременно."""
+
+    def __init__(
+        self,
+        size: int,
+        memory_mb: int = DEFAULT_MEMORY_MB,
+        timeout: float = DEFAULT_TIMEOUT,
+        max_tasks: int = DEFAULT_MAX_TASKS,
+    ):
+        self.size = max(1, int(size))
+        self.timeout = timeout
+        self.max_tasks = max(0, int(max_tasks))
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context(
+            "forkserver" if "forkserver" in methods else "spawn"
+        )
+        # в процесс уходят уже выбранные настройки: повторный замер бэкендов не нужен
+        self._args = (
+            max(0, int(memory_mb)) * 1024 * 1024,
+            image_pipeline.MAX_PIXELS,
+            image_pipeline.current_backend(),
+            bool(getattr(image_pipeline.ImageFile, "LOAD_TRUNCATED_IMAGES", False)),
+        )
+        self._slots = threading.BoundedSemaphore(self.size)
+        self._idle: queue.SimpleQueue[_Worker] = queue.SimpleQueue()
+        self._all: set[_Worker] = set()
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def start(self) -> "DecodePool":
+        """Запустить все процессы заранее, чтобы первая загрузка не ждала старта."""
+
+        for _ in range(self.size):
+            self._idle.put(self._spawn())
+        return self
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx, self._args)
+        with self._lock:
+            self._all.add(worker)
+        return worker
+
+    def _retire(self, worker: _Worker, kill: bool = False) -> None:
+        with self._lock:
+            self._all.discard(worker)
+        worker.stop(kill=kill)
+
+    def _checkout(self) -> _Worker:
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._spawn()  # процесс взамен убитого или выслужившего срок
+            if worker.process.is_alive():
+                return worker
+            self._retire(worker, kill=True)
+
+    def compress_upload(self, source, source_len: int | None = None):
+        """image_pipeline.compress_upload в процессе песочницы.
+
+        source — bytes или путь к файлу (процесс читает его сам); файловый
+        объект передаётся содержимым.
+        """
+
+        if self._closed:
+            raise RuntimeError("decode pool is closed")
+        if not isinstance(source, (bytes, str, os.PathLike)):
+            source = image_pipeline._read_source(source)
+        elif isinstance(source, os.PathLike):
+            source = os.fspath(source)
+
+        with self._slots:
+            worker = self._checkout()
+            try:
+                worker.conn.send((source, source_len))
+                if not worker.conn.poll(self.timeout):
+                    self._retire(worker, kill=True)
+                    log.warning("decode sandbox: task killed after %.0fs", self.timeout)
+                    raise DecodeFailed(
+                        "timeout",
+                        f"Изображение обрабатывалось дольше {self.timeout:.0f} с — "
+                        "уменьшите его и загрузите снова.",
+                    )
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError):
+                code = worker.process.exitcode
+                self._retire(worker, kill=True)
+                log.warning("decode sandbox: worker died (exit code %s)", code)
+                raise DecodeFailed("crash", "Неподдерживаемый формат или повреждённое изображение.")
+
+            worker.tasks += 1
+            if status == "memory" or (self.max_tasks and worker.tasks >= self.max_tasks):
+                self._retire(worker)  # после MemoryError кучу процесса лучше не переиспользовать
+            else:
+                self._idle.put(worker)
+
+        if status == "ok":
+            return payload
+        if status == "too_large":
+            raise image_pipeline.ImageTooLarge(*payload)
+        if status == "memory":
+            raise DecodeFailed(
+                "memory", "Не хватило памяти на обработку изображения — уменьшите его."
+            )
+        raise image_pipeline.InvalidImage(payload)
+
+    def close(self) -> None:
+        self._closed = True
+        with self._lock:
+            workers = list(self._all)
+            self._all.clear()
+        for worker in workers:
+            worker.stop(kill=not worker.process.is_alive())
+
+
+_config: dict | None = None
+_pool: DecodePool | None = None
+_pool_lock = threading.Lock()
+
+
+def configure_sandbox(
+    enabled: bool,
+    workers: int = 1,
+    memory_mb: int = DEFAULT_MEMORY_MB,
+    timeout: float = DEFAULT_TIMEOUT,
+    max_tasks: int = DEFAULT_MAX_TASKS,
+) -> None:
+    """Настроить песочницу; вызывается из CoreConfig.ready. Пул стартует при
+    первой загрузке (manage.py-команды без загрузок процессов не плодят)."""
+
+    global _config
+    shutdown()
+    _config = (
+        dict(size=workers, memory_mb=memory_mb, timeout=timeout, max_tasks=max_tasks)
+        if enabled
+        else None
+    )
+
+
+def get_pool() -> DecodePool | None:
+    global _pool
+    if _config is None:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            _pool = DecodePool(**_config).start()
+        return _pool
+
+
+def shutdown() -> None:
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.close()
+
+
+atexit.register(shutdown)
+
+
+def compress_upload(source, source_len: int | None = None):
+    """compress_upload в песочнице, если она включена, иначе в текущем процессе."""
+
+    pool = get_pool()
+    if pool is None:
+        return image_pipeline.compress_upload(source, source_len)
+    return pool.compress_upload(source, source_len)
@@ -1,8 +1,13 @@
 from __future__ import annotations
 
+import math
 import os
+import shutil
 import site
+import subprocess
 import sys
+import time
+from functools import lru_cache
 from io import BytesIO
 
 def _try_import_real_pillow():
@@ -77,12 +82,59 @@ def exif_transpose(img):
 
 MAX_SIDE = 2560
 MIN_TARGET = 150 * 1024  # ~150KB
+QUALITY_MIN, QUALITY_MAX = 55, 95
+PROXY_MAX_SIDE = 640
+PROXY_BPP_CORRECTION = 0.6
+PROXY_CALIBRATION_STEPS = 3
+REDUCE_MODES = ("RGB", "RGBA", "L", "LA")
+THUMB_WIDTHS = (320, 960)
+THUMB_QUALITY = 80
+# Бюджет пикселей на один исходник (ширина × высота по заголовку): больше —
+# отказ до декодирования. Задаётся configure_limits (PHOTO_UPLOAD_MAX_PIXELS).
+MAX_PIXELS = 100_000_000
+# Сигнатуры форматов: (смещение, байты, формат). HEIC/AVIF — по бренду ftyp.
+_MAGIC = (
+    (0, b"\xff\xd8\xff", "jpeg"),
+    (0, b"\x89PNG\r\n\x1a\n", "png"),
+    (8, b"WEBP", "webp"),
+    (0, b"GIF8", "gif"),
+    (0, b"BM", "bmp"),
+    (0, b"II*\x00", "tiff"),
+    (0, b"MM\x00*", "tiff"),
+    (4, b"ftypavif", "avif"),
+    (4, b"ftypheic", "heic"),
+    (4, b"ftypheix", "heic"),
+    (4, b"ftypmif1", "heic"),
+)
+SNIFF_BYTES = 16
+# JPEG не больше MAX_SIDE и не плотнее этого (бит на пиксель, ~q85) уже «в норме»:
+# при загрузке он сохраняется как есть, без перекодирования (см. passthrough_jpeg).
+PASSTHROUGH_MAX_BPP = 1.5
+PASSTHROUGH_MODES = ("RGB", "L")
+# Сегменты, без которых JPEG отображается иначе: JFIF (APP0), ICC-профиль (APP2),
+# Adobe (APP14, цветовое преобразование). Остальные APPn и комментарии — метаданные.
+_JPEG_KEEP_APP = {0xE0, 0xE2, 0xEE}
+# Форматы только для панели (фиды ЦИАН/ДомКлик ссылаются на основной JPEG).
+# Порядок — от предпочтительного: так же выводятся <source> в <picture>.
+DISPLAY_FORMATS = (
+    ("avif", "AVIF", {"quality": 50}),
+    ("webp", "WEBP", {"quality": 75, "method": 4}),
+)
 
 
 class InvalidImage(Exception):
     pass
 
 
+class ImageTooLarge(InvalidImage):
+    """Заголовок обещает больше MAX_PIXELS пикселей — декодировать не будем."""
+
+    def __init__(self, width: int, height: int, limit: int):
+        self.width, self.height, self.limit = width, height, limit
+        size = f": {width}×{height} ({width * height / 1e6:.0f} Мп," if width and height else " ("
+        super().__init__(f"Слишком большое изображение{size} максимум {limit / 1e6:.0f} Мп).")
+
+
 def _decode_stub_placeholder(orig: bytes) -> Image.Image | None:
     header = b"FAKEIMG\n"
     if not orig.startswith(header):
@@ -106,7 +158,7 @@ def _resize_max_side_pillow(img: Image.Image, max_side: int = MAX_SIDE) -> Image
     w, h = img.size
     scale = min(1.0, float(max_side) / float(max(w, h)))
     if scale < 1.0:
-        img = img.resize((int(w * scale), int(h * scale)), Image.LANCZOS)
+        img = img.resize((max(1, round(w * scale)), max(1, round(h * scale))), Image.LANCZOS)
     return img
 
 
@@ -116,42 +168,349 @@ def _jpeg_save_size_pillow(img: Image.Image, q: int) -> bytes:
     return buf.getvalue()
 
 
-def _binary_search_quality(gen_fn, src_len: int, target_ratio: float = 0.2) -> bytes:
-    target = max(int(src_len * target_ratio), MIN_TARGET)
-    lo, hi = 55, 95
-    best = None
+def _best_quality_under(size_fn, limit: int, lo: int, hi: int) -> int:
+    """Наибольшее q из [lo, hi] с size_fn(q) <= limit (lo, если не влезает ни одно)."""
+
+    best = lo
     while lo <= hi:
         q = (lo + hi) // 2
-        data = gen_fn(q)
-        best = data
-        if len(data) > target:
-            hi = q - 1
+        if size_fn(q) <= limit:
+            best, lo = q, q + 1
         else:
-            lo = q + 1
+            hi = q - 1
     return best
 
 
-def compress_with_pillow(orig: bytes) -> bytes:
+def _search_quality(
+    encode_fn,
+    target: int,
+    lo: int = QUALITY_MIN,
+    hi: int = QUALITY_MAX,
+    proxy_fn=None,
+    proxy_scale: float = 1.0,
+) -> tuple[bytes, int]:
+    """Подобрать наибольшее качество, при котором JPEG укладывается в target.
+
+    Без proxy_fn — обычная бисекция полных кодирований (~6 штук). С proxy_fn
+    (кодирование уменьшенной копии, в десятки раз дешевле) бисекция идёт по
+    прокси, а полных кодирований обычно два: первое по оценке
+    proxy * proxy_scale калибрует коэффициент full/proxy, второе — по
+    уточнённой оценке (и так до PROXY_CALIBRATION_STEPS раз, пока q не
+    повторится). Если все оценки промахнулись вверх, добираем бисекцией ниже.
+    Возвращает (bytes, q); если не влезает даже lo — кодирование с lo.
+    """
+
+    full: dict[int, bytes] = {}
+
+    def full_len(q: int) -> int:
+        if q not in full:
+            full[q] = encode_fn(q)
+        return len(full[q])
+
+    if proxy_fn is not None:
+        proxy: dict[int, int] = {}
+
+        def proxy_len(q: int) -> int:
+            if q not in proxy:
+                proxy[q] = len(proxy_fn(q))
+            return proxy[q]
+
+        ratios: dict[int, float] = {}
+
+        def ratio_at(q: int) -> float:
+            # коэффициент full/proxy зависит от q: интерполируем по двум ближайшим замерам
+            if not ratios:
+                return proxy_scale
+            near = sorted(ratios, key=lambda m: (abs(m - q), m))[:2]
+            if len(near) == 1:
+                return ratios[near[0]]
+            (qa, ra), (qb, rb) = sorted((m, ratios[m]) for m in near)
+            return max(1e-3, ra + (rb - ra) * (q - qa) / float(qb - qa))
+
+        for _step in range(PROXY_CALIBRATION_STEPS):
+            q = _best_quality_under(lambda q: proxy_len(q) * ratio_at(q), target, lo, hi)
+            if q in full:
+                break
+            ratios[q] = full_len(q) / float(max(1, proxy_len(q)))
+        fitting = [q for q, data in full.items() if len(data) <= target]
+        if fitting:
+            q = max(fitting)
+            return full[q], q
+        hi = min(full) - 1
+
+    q = _best_quality_under(full_len, target, lo, hi)
+    full_len(q)
+    return full[q], q
+
+
+def _proxy_image(img: Image.Image, max_side: int = PROXY_MAX_SIDE):
+    """Уменьшенная копия для оценки размера JPEG и отношение площадей full/proxy."""
+
+    w, h = img.size
+    factor = max(w, h) // max_side
+    if factor < 2 or not hasattr(img, "reduce"):
+        return None, 1.0
+    proxy = img.reduce(factor)
+    pw, ph = proxy.size
+    # мелкая копия «плотнее» по деталям: bpp у неё выше, чем у оригинала
+    return proxy, (w * h) / float(pw * ph) * PROXY_BPP_CORRECTION
+
+
+def _target_size(src_len: int, target_ratio: float = 0.2) -> int:
+    return max(int(src_len * target_ratio), MIN_TARGET)
+
+
+def encode_jpeg_to_target(
+    img: Image.Image, target: int, lo: int = QUALITY_MIN, hi: int = QUALITY_MAX
+) -> tuple[bytes, int]:
+    """Закодировать изображение Pillow в JPEG не больше target (по возможности)."""
+
+    proxy, scale = _proxy_image(img)
+    proxy_fn = (lambda q: _jpeg_save_size_pillow(proxy, q)) if proxy is not None else None
+    return _search_quality(
+        lambda q: _jpeg_save_size_pillow(img, q),
+        target,
+        lo,
+        hi,
+        proxy_fn=proxy_fn,
+        proxy_scale=scale,
+    )
+
+
+def image_info(data: bytes) -> tuple[int, int, str] | None:
+    """(ширина, высота, mime) по заголовку файла; пиксели не декодируются."""
+
+    try:
+        with Image.open(BytesIO(data)) as probe:
+            width, height = probe.size
+            return width, height, getattr(Image, "MIME", {}).get(probe.format, "")
+    except Exception:
+        return None
+
+
+def dhash(data: bytes, size: int = 8) -> str:
+    """Разностный перцептивный хеш (dHash, size*size бит) в hex; '' если не раскодировать.
+
+    Уменьшенная серая копия (size+1)×size: бит — ярче ли пиксель соседа справа.
+    Пересжатие, масштаб и лёгкая цветокоррекция почти не меняют хеш.
+    """
+
+    try:
+        with Image.open(BytesIO(data)) as img:
+            if getattr(img, "format", None) == "JPEG" and hasattr(img, "draft"):
+                img.draft("L", (size * 8, size * 8))
+            small = img.convert("L").resize((size + 1, size), Image.LANCZOS)
+    except Exception:
+        return ""
+    pixels = list(small.getdata())
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return f"{bits:0{size * size // 4}x}"
+
+
+def sniff_format(head: bytes) -> str | None:
+    """Формат по первым SNIFF_BYTES байтам (сигнатуре), а не по имени или Content-Type."""
+
+    for offset, magic, fmt in _MAGIC:
+        if head[offset:offset + len(magic)] == magic:
+            if fmt == "webp" and head[:4] != b"RIFF":
+                continue
+            return fmt
+    return None
+
+
+def configure_limits(max_pixels: int) -> None:
+    """Задать MAX_PIXELS; вызывается из CoreConfig.ready (0 — без ограничения)."""
+
+    global MAX_PIXELS
+    MAX_PIXELS = max(0, int(max_pixels or 0))
+    if hasattr(Image, "MAX_IMAGE_PIXELS"):
+        # собственная защита Pillow (ошибка при 2× лимита) — в тех же пределах
+        Image.MAX_IMAGE_PIXELS = MAX_PIXELS or None
+
+
+def _check_pixels(width: int, height: int) -> None:
+    if MAX_PIXELS and width * height > MAX_PIXELS:
+        raise ImageTooLarge(width, height, MAX_PIXELS)
+
+
+def probe_dimensions(source) -> tuple[int, int] | None:
+    """Размеры по заголовку (без декодирования) с проверкой MAX_PIXELS.
+
+    None — Pillow формат не распознал (решит декодер); ImageTooLarge — бомба.
+    """
+
+    bomb_error = getattr(Image, "DecompressionBombError", None)
     try:
-        img = Image.open(BytesIO(orig))
+        with Image.open(_open_source(source)) as probe:
+            width, height = probe.size
+    except Exception as e:
+        if bomb_error is not None and isinstance(e, bomb_error):
+            raise ImageTooLarge(0, 0, MAX_PIXELS) from e
+        return None
+    _check_pixels(width, height)
+    return width, height
+
+
+def jpeg_within_bounds(
+    width: int, height: int, length: int, max_bpp: float = PASSTHROUGH_MAX_BPP
+) -> bool:
+    if max(width, height) > MAX_SIDE:
+        return False
+    return length <= MIN_TARGET or length * 8 <= max_bpp * width * height
+
+
+def passthrough_jpeg(source, source_len: int) -> bool:
+    """Можно ли сохранить исходник без перекодирования. Читается только заголовок.
+
+    Нужны: JPEG в RGB/L, без поворота по EXIF, в пределах jpeg_within_bounds.
+    """
+
+    try:
+        with Image.open(_open_source(source)) as probe:
+            if probe.format != "JPEG" or probe.mode not in PASSTHROUGH_MODES:
+                return False
+            width, height = probe.size
+            orientation = probe.getexif().get(0x0112, 1)
+    except Exception:
+        return False
+    if orientation not in (0, 1):
+        return False  # пиксели надо повернуть — это уже перекодирование
+    return jpeg_within_bounds(width, height, source_len)
+
+
+def strip_jpeg_metadata(data: bytes) -> bytes:
+    """Убрать EXIF/XMP/IPTC/комментарии, не трогая сжатые данные (без потерь).
+
+    Разбираются только сегменты до SOS; при любой странности возвращается исходник.
+    """
+
+    if data[:2] != b"\xff\xd8":
+        return data
+    out = [data[:2]]
+    pos = 2
+    while pos + 4 <= len(data):
+        if data[pos] != 0xFF:
+            return data
+        marker = data[pos + 1]
+        if marker == 0xFF:  # байт-заполнитель
+            pos += 1
+            continue
+        if marker == 0xDA:  # начало сканов: дальше только данные изображения
+            out.append(data[pos:])
+            return b"".join(out)
+        length = int.from_bytes(data[pos + 2:pos + 4], "big")
+        end = pos + 2 + length
+        if length < 2 or end > len(data):
+            return data
+        is_metadata = (0xE0 <= marker <= 0xEF and marker not in _JPEG_KEEP_APP) or marker == 0xFE
+        if not is_metadata:
+            out.append(data[pos:end])
+        pos = end
+    return data
+
+
+def _draft_size(size, max_side: int = MAX_SIDE):
+    """Размер, который должен покрыть декодер, чтобы после ресайза осталось max_side."""
+
+    w, h = size
+    scale = float(max_side) / float(max(w, h))
+    if scale >= 1.0:
+        return None
+    return (max(1, math.ceil(w * scale)), max(1, math.ceil(h * scale)))
+
+
+def _reduce_to_cover(img: Image.Image, max_side: int = MAX_SIDE) -> Image.Image:
+    """Быстрое целочисленное уменьшение (box) с запасом: результат не меньше max_side."""
+
+    factor = max(img.size) // max_side
+    if factor < 2 or not hasattr(img, "reduce"):
+        return img
+    return img.reduce(factor)
+
+
+def _open_source(source):
+    """bytes → BytesIO; путь (str/Path) и файловые объекты Pillow читает сам, по частям."""
+
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    if hasattr(source, "seek"):
+        source.seek(0)
+    return source
+
+
+def _read_source(source) -> bytes:
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, "rb") as fh:
+            return fh.read()
+    source.seek(0)
+    return source.read()
+
+
+def _source_len(source) -> int:
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray)):
+        return len(source)
+    return getattr(source, "size", None) or len(_read_source(source))
+
+
+def decode_for_target(orig, max_side: int = MAX_SIDE, reduced: bool = True) -> Image.Image:
+    """Раскодировать исходник (bytes, путь к файлу или файловый объект) в RGB
+    не больше max_side по длинной стороне.
+
+    JPEG декодируется сразу в уменьшенном масштабе DCT (Image.draft, 1/2–1/8):
+    берётся самый мелкий масштаб, который ещё покрывает целевой размер, так что
+    48-мегапиксельное фото не разворачивается в память целиком. Остальные
+    форматы после полного декодирования сначала ужимаются reduce(), и только
+    остаток доводится LANCZOS. reduced=False — прежнее полное декодирование
+    (для сравнения в bench_images).
+    """
+
+    try:
+        img = Image.open(_open_source(orig))
+        _check_pixels(*img.size)  # до load(): пиксели ещё не распакованы
+        if reduced and getattr(img, "format", None) == "JPEG" and hasattr(img, "draft"):
+            draft_size = _draft_size(img.size, max_side)
+            if draft_size is not None:
+                img.draft(None, draft_size)
         img.load()
         img = ImageOps.exif_transpose(img)
     except (UnidentifiedImageError, OSError, ValueError) as e:
         raise InvalidImage(str(e))
-    # PNG/WebP with alpha → RGB
-    if img.mode not in ("RGB", "L"):
-        img = img.convert("RGB")
-    else:
-        # grayscale L → promote to RGB for JPEG
-        img = img.convert("RGB")
-    img = _resize_max_side_pillow(img, MAX_SIDE)
-    return _binary_search_quality(lambda q: _jpeg_save_size_pillow(img, q), len(orig), 0.2)
+    if reduced and img.mode in REDUCE_MODES:
+        img = _reduce_to_cover(img, max_side)
+    # PNG/WebP with alpha → RGB; grayscale L → promote to RGB for JPEG
+    img = img.convert("RGB")
+    if reduced:
+        img = _reduce_to_cover(img, max_side)
+    return _resize_max_side_pillow(img, max_side)
+
 
+def compress_with_pillow(orig, source_len: int | None = None) -> bytes:
+    img = decode_for_target(orig, MAX_SIDE)
+    return encode_jpeg_to_target(img, _target_size(source_len or _source_len(orig)))[0]
 
-def compress_with_vips(orig: bytes) -> bytes:
+
+def compress_with_vips(orig, source_len: int | None = None) -> bytes:
     import pyvips  # lazy import
 
-    image = pyvips.Image.new_from_buffer(orig, "", access="sequential")
+    if source_len is None:
+        source_len = _source_len(orig)
+    if isinstance(orig, (str, os.PathLike)):
+        # с диска libvips читает потоково, не загружая файл в память
+        image = pyvips.Image.new_from_file(os.fspath(orig), access="sequential")
+    else:
+        if not isinstance(orig, (bytes, bytearray)):
+            orig = _read_source(orig)
+        image = pyvips.Image.new_from_buffer(orig, "", access="sequential")
+    # как exif_transpose в decode_for_target
+    image = image.autorot()
     # Flatten alpha to white if present
     if image.hasalpha():
         image = image.flatten(background=[255, 255, 255])
@@ -165,25 +524,290 @@ def compress_with_vips(orig: bytes) -> bytes:
     if scale < 1.0:
         image = image.resize(scale)
 
-    def save_q(q: int) -> bytes:
-        return image.jpegsave_buffer(Q=q, optimize_coding=True, interlace=True, strip=True)
+    def save_q(img, q: int) -> bytes:
+        return img.jpegsave_buffer(Q=q, optimize_coding=True, interlace=True, strip=True)
+
+    factor = max(image.width, image.height) // PROXY_MAX_SIDE
+    proxy_fn, proxy_scale = None, 1.0
+    if factor >= 2:
+        image = image.copy_memory()  # sequential-источник нельзя читать повторно
+        proxy = image.shrink(factor, factor).copy_memory()
+        proxy_fn = lambda q: save_q(proxy, q)  # noqa: E731
+        proxy_scale = (
+            image.width * image.height / float(proxy.width * proxy.height) * PROXY_BPP_CORRECTION
+        )
+    data, _q = _search_quality(
+        lambda q: save_q(image, q),
+        _target_size(source_len),
+        proxy_fn=proxy_fn,
+        proxy_scale=proxy_scale,
+    )
+    return data
+
+
+# Бэкенды сжатия основного JPEG. Производные (make_derivatives) всегда
+# делает Pillow: с vips — из уже сжатого основного файла (≤ MAX_SIDE).
+BACKENDS = {"pillow": compress_with_pillow, "vips": compress_with_vips}
+BACKEND_PROBE_SIZE = (1600, 1200)
+
+_backend: str | None = None
+
+
+@lru_cache(maxsize=None)
+def available_backends() -> tuple[str, ...]:
+    found = ["pillow"]
+    try:
+        import pyvips
+
+        pyvips.Image.black(1, 1).jpegsave_buffer()  # библиотека libvips реально грузится
+    except Exception:
+        pass
+    else:
+        found.append("vips")
+    return tuple(found)
+
+
+def _probe_backends(backends) -> str:
+    """Быстрейший из бэкендов на синтетическом кадре BACKEND_PROBE_SIZE."""
+
+    if not hasattr(Image, "effect_noise"):
+        return backends[0]
+    sample = BytesIO()
+    Image.effect_noise(BACKEND_PROBE_SIZE, 40).convert("RGB").save(sample, format="JPEG", quality=95)
+    sample = sample.getvalue()
+    timings = {}
+    for name in backends:
+        started = time.perf_counter()
+        try:
+            BACKENDS[name](sample)
+        except Exception:
+            continue
+        timings[name] = time.perf_counter() - started
+    return min(timings, key=timings.get) if timings else backends[0]
 
-    return _binary_search_quality(save_q, len(orig), 0.2)
+
+def configure_backend(preference: str = "auto") -> str:
+    """Выбрать бэкенд сжатия: 'pillow', 'vips' или 'auto' (замер при старте).
+
+    Недоступный бэкенд молча заменяется на Pillow. Вызывается из
+    CoreConfig.ready с настройкой PHOTO_IMAGE_BACKEND.
+    """
+
+    global _backend
+    available = available_backends()
+    if preference in available:
+        _backend = preference
+    elif preference == "auto" and len(available) > 1:
+        _backend = _probe_backends(available)
+    else:
+        _backend = "pillow"
+    return _backend
+
+
+def current_backend() -> str:
+    return _backend or configure_backend()
 
 
 def compress_to_jpeg(orig: bytes) -> bytes:
-    """Try Pillow first; fall back to stub decoding or pyvips on failure."""
+    """Сначала выбранный бэкенд (current_backend), затем Pillow, stub-заглушка и pyvips."""
 
+    tried_vips = current_backend() == "vips"
+    if tried_vips:
+        try:
+            return compress_with_vips(orig)
+        except Exception:
+            pass  # Pillow ниже разберёт файл сам и вернёт понятную ошибку
     try:
         return compress_with_pillow(orig)
     except InvalidImage:
         placeholder = _decode_stub_placeholder(orig)
         if placeholder is not None:
             placeholder = _resize_max_side_pillow(placeholder, MAX_SIDE)
-            return _binary_search_quality(
-                lambda q: _jpeg_save_size_pillow(placeholder, q), len(orig), 0.2
-            )
+            return encode_jpeg_to_target(placeholder, _target_size(len(orig)))[0]
+        if tried_vips:
+            raise
         try:
             return compress_with_vips(orig)
         except Exception as e:
             raise InvalidImage(str(e))
+
+
+def variant_key(width: int, ext: str = "jpg") -> str:
+    return f"w{width}.{ext}"
+
+
+def variant_name(name: str, key: str) -> str:
+    """Имя производного файла рядом с основным: photos/…/a.jpg → photos/…/a.w320.jpg."""
+
+    root, _ext = os.path.splitext(name)
+    return f"{root}.{key}"
+
+
+def parse_variant_key(key: str):
+    """'w320.jpg' → (320, 'jpg'); None для нераспознанных ключей."""
+
+    head, _, ext = key.partition(".")
+    if not head.startswith("w") or not head[1:].isdigit() or not ext:
+        return None
+    return int(head[1:]), ext
+
+
+def _thumbnail(img: Image.Image, width: int) -> Image.Image:
+    w, h = img.size
+    height = max(1, round(h * width / float(w)))
+    factor = w // (width * 2)
+    if factor >= 2 and hasattr(img, "reduce"):
+        img = img.reduce(factor)
+    return img.resize((width, height), Image.LANCZOS)
+
+
+@lru_cache(maxsize=None)
+def display_formats() -> tuple[str, ...]:
+    """Расширения из DISPLAY_FORMATS, которые умеет кодировать установленный Pillow.
+
+    Проверяется пробным кодированием один раз на процесс (прогревается в
+    CoreConfig.ready); AVIF появляется, только если есть кодек (Pillow 11.2+
+    или pillow-avif-plugin).
+    """
+
+    found = []
+    for ext, fmt, options in DISPLAY_FORMATS:
+        try:
+            Image.new("RGB", (8, 8)).save(BytesIO(), format=fmt, **options)
+        except Exception:
+            continue
+        found.append(ext)
+    return tuple(found)
+
+
+def _encode_variant(img: Image.Image, ext: str) -> bytes:
+    buf = BytesIO()
+    if ext == "jpg":
+        img.save(buf, format="JPEG", quality=THUMB_QUALITY, optimize=True, progressive=True)
+    else:
+        fmt, options = next((f, o) for e, f, o in DISPLAY_FORMATS if e == ext)
+        img.save(buf, format=fmt, **options)
+    return buf.getvalue()
+
+
+def make_derivatives(img: Image.Image, widths=THUMB_WIDTHS) -> dict[str, bytes]:
+    """Уменьшенные копии для галереи панели из уже раскодированного изображения.
+
+    Для каждой ширины — JPEG и доступные display_formats(). Ширины больше
+    самой картинки пропускаются: в srcset вместо них пойдёт основной файл.
+    """
+
+    variants: dict[str, bytes] = {}
+    try:
+        width = img.size[0]
+        for target in sorted(widths):
+            if target >= width:
+                continue
+            thumb = _thumbnail(img, target)
+            for ext in ("jpg", *display_formats()):
+                variants[variant_key(target, ext)] = _encode_variant(thumb, ext)
+    except Exception:  # pragma: no cover - производные не должны ломать загрузку
+        return {}
+    return variants
+
+
+def compress_upload(source, source_len: int | None = None) -> tuple[bytes, dict[str, bytes]]:
+    """Основной JPEG и производные (make_derivatives) из одного декодирования.
+
+    source — bytes, путь к временному файлу загрузки или файловый объект: с диска
+    Pillow читает исходник потоково, и целиком в памяти он не оказывается.
+    source_len нужен для целевого размера, если source — не bytes. JPEG, который
+    уже в норме (passthrough_jpeg), сохраняется как есть без метаданных. С бэкендом
+    vips основной JPEG кодирует libvips, а производные строятся из него. Если
+    Pillow не справился, работает прежний каскад compress_to_jpeg без производных.
+    """
+
+    if source_len is None:
+        source_len = _source_len(source)
+    probe_dimensions(source)  # ImageTooLarge — раньше любого декодера, в т.ч. vips
+    if passthrough_jpeg(source, source_len):
+        data = strip_jpeg_metadata(_read_source(source))
+        try:
+            return data, make_derivatives(decode_for_target(data, MAX_SIDE))
+        except InvalidImage:
+            pass  # заголовок обманул — ниже обычный путь
+    if current_backend() == "vips":
+        try:
+            data = compress_with_vips(source, source_len)
+        except Exception:
+            data = None  # ниже — обычный путь через Pillow
+        if data is not None:
+            try:
+                return data, make_derivatives(decode_for_target(data, MAX_SIDE))
+            except InvalidImage:
+                return data, {}
+    try:
+        img = decode_for_target(source, MAX_SIDE)
+    except ImageTooLarge:
+        raise
+    except InvalidImage:
+        return compress_to_jpeg(_read_source(source)), {}
+    data = encode_jpeg_to_target(img, _target_size(source_len))[0]
+    return data, make_derivatives(img)
+
+
+# Поворот по часовой → transpose Pillow.
+_ROTATE_TRANSPOSE = {90: "ROTATE_270", 180: "ROTATE_180", 270: "ROTATE_90"}
+
+
+def _rotate_lossless(orig: bytes, degrees: int) -> bytes | None:
+    """Поворот без перекодирования через jpegtran, если он есть и размеры кратны MCU."""
+
+    jpegtran = shutil.which("jpegtran")
+    if not jpegtran or not orig.startswith(b"\xff\xd8"):
+        return None
+    try:
+        result = subprocess.run(
+            [jpegtran, "-copy", "none", "-perfect", "-optimize", "-rotate", str(degrees)],
+            input=orig,
+            capture_output=True,
+            timeout=30,
+            check=False,
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    if result.returncode != 0 or not result.stdout:
+        return None
+    return result.stdout
+
+
+def rotate_jpeg(orig: bytes, degrees: int) -> tuple[bytes, Image.Image]:
+    """Повернуть сохранённый JPEG на degrees (90/180/270 по часовой).
+
+    Сначала — без потерь (jpegtran -perfect). Иначе — декодирование, поворот и
+    кодирование с исходными таблицами квантования, чтобы не терять качество
+    сверх одного поколения. Возвращает (bytes, повёрнутое изображение для
+    производных).
+    """
+
+    degrees = degrees % 360
+    if degrees not in _ROTATE_TRANSPOSE:
+        raise ValueError(f"unsupported rotation: {degrees}")
+    lossless = _rotate_lossless(orig, degrees)
+    if lossless is not None:
+        with Image.open(BytesIO(lossless)) as rotated:
+            rotated.load()
+            return lossless, rotated.convert("RGB")
+    try:
+        src = Image.open(BytesIO(orig))
+        src.load()
+    except (UnidentifiedImageError, OSError, ValueError) as e:
+        raise InvalidImage(str(e))
+    rotated = src.convert("RGB").transpose(getattr(Image.Transpose, _ROTATE_TRANSPOSE[degrees]))
+    buf = BytesIO()
+    options = {"optimize": True, "progressive": True}
+    qtables = getattr(src, "quantization", None)
+    if qtables:
+        options["qtables"] = qtables
+        get_sampling = getattr(sys.modules.get(type(src).__module__), "get_sampling", None)
+        if get_sampling is not None:
+            options["subsampling"] = get_sampling(src)
+    else:
+        options["quality"] = 90
+    rotated.save(buf, format="JPEG", **options)
+    return buf.getvalue(), rotated
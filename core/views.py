@@ -3,9 +3,9 @@
 import logging
 import os
 import re
+from concurrent.futures import ThreadPoolExecutor
 from decimal import Decimal, InvalidOperation
-from functools import lru_cache
-from typing import Optional
+from functools import cached_property, lru_cache
 from io import BytesIO
 from pathlib import Path
 
@@ -16,7 +16,8 @@
 from django.core.management import call_command
 from django.db import connection, transaction
 from django.db.migrations.loader import MigrationLoader
-from django.db.models import Max, Q
+from django.db.models import F, Q
+from django.db.models.functions import Mod
 from django.http import (
     HttpResponse,
     HttpResponseNotAllowed,
@@ -46,16 +47,28 @@ def exif_transpose(img):
 
     ImageOps = _StubImageOps()  # type: ignore
 
+from . import geo, photo_jobs, photo_store
 from .cian import build_cian_feed, resolve_category
+from .facets import property_facets
+from .filters import DEFAULT_SORT, SORT_ORDERINGS, PropertyListFilter
 from .forms import PropertyForm, fields_for_category, group_fields
 from .models import Photo, Property
-from .utils.image_pipeline import InvalidImage, compress_to_jpeg
+from .utils.decode_sandbox import DecodeFailed, compress_upload
+from .utils.image_pipeline import (
+    SNIFF_BYTES,
+    ImageTooLarge,
+    InvalidImage,
+    probe_dimensions,
+    sniff_format,
+)
 
 
 log = logging.getLogger("upload")
 ImageFile.LOAD_TRUNCATED_IMAGES = True
 
 INVALID_IMAGE_MESSAGE = "Неподдерживаемый формат или повреждённое изображение."
+# сколько отложенных поворотов фид применяет сам; остальные доделает photo_worker
+FEED_ROTATION_LIMIT = 5
 
 
 def _ensure_migrated():
@@ -231,138 +244,108 @@ def _pillow_supports_rotation() -> bool:
     return callable(exif_transpose)
 
 
-def _image_has_rotation_api(img) -> bool:
-    required = ("rotate", "transpose", "convert", "getexif")
-    for attr in required:
-        if not hasattr(img, attr):
-            return False
-    return True
-
-
-def _check_decoder_available(kind: str) -> bool:
-    """Return True if Pillow reports decoder support for *kind* ("jpeg"/"webp"/"png")."""
+def _check_upload_supported(uploaded_file):
+    """Быстрая проверка по имени/типу без чтения файла; возвращает имя в нижнем регистре."""
 
-    # Try Pillow's features API first
-    try:  # pragma: no branch - optional dependency
-        from PIL import features as pil_features  # type: ignore
+    name_l = (uploaded_file.name or "photo").lower()
+    ct_l = (getattr(uploaded_file, "content_type", "") or "").lower()
+    # HEIC/HEIF — сразу отказ с нужной формулировкой
+    if name_l.endswith((".heic", ".heif")) or ct_l in {"image/heic", "image/heif"}:
+        raise ValueError("HEIC/HEIF пока не поддерживается — сохраните как JPG/PNG/WebP.")
+    max_bytes = getattr(settings, "PHOTO_UPLOAD_MAX_BYTES", 0)
+    size = getattr(uploaded_file, "size", None) or 0
+    if max_bytes and size > max_bytes:
+        raise ValueError(
+            f"Файл слишком большой: максимум {max_bytes / (1024 * 1024):.0f} МБ."
+        )
+    return name_l
 
-        probes_map = {
-            "jpeg": ("jpeg", "jpg", "libjpeg", "libjpeg_turbo"),
-            "webp": ("webp",),
-            "png": ("zlib", "libpng", "png"),
-        }
-        for probe in probes_map.get(kind, ()):  # pragma: no branch - small tuple
-            try:
-                if pil_features.check(probe):
-                    return True
-            except Exception:  # pragma: no cover - defensive
-                continue
-        if kind in probes_map:
-            return False
-    except ImportError:  # pragma: no cover - stub Pillow shipped in tests
-        pass
 
-    # Fall back to registered extensions when features API is unavailable
-    registered = getattr(Image, "registered_extensions", None)
-    if callable(registered):
-        try:
-            mapping = {
-                ext.lower(): handler for ext, handler in registered().items()  # type: ignore[arg-type]
-            }
-            if kind == "jpeg":
-                return any(ext in mapping for ext in (".jpg", ".jpeg"))
-            if kind == "webp":
-                return ".webp" in mapping
-            if kind == "png":
-                return ".png" in mapping
-        except Exception:  # pragma: no cover - defensive
-            pass
+def _check_upload_header(uploaded_file):
+    """Сигнатура и размеры по заголовку — до любого декодирования.
 
-    # Assume supported when we cannot determine availability explicitly
-    return True
+    Неизвестная сигнатура — «неподдерживаемый формат» (что бы ни говорили имя
+    и Content-Type), HEIC по содержимому — отдельная ошибка, изображение
+    больше PHOTO_UPLOAD_MAX_PIXELS — отказ (защита от decompression bomb).
+    """
 
+    try:
+        uploaded_file.seek(0)
+        head = uploaded_file.read(SNIFF_BYTES)
+    finally:
+        uploaded_file.seek(0)
+    fmt = sniff_format(head)
+    if fmt is None:
+        raise ValueError(INVALID_IMAGE_MESSAGE)
+    if fmt == "heic":
+        raise ValueError("HEIC/HEIF пока не поддерживается — сохраните как JPG/PNG/WebP.")
+    try:
+        probe_dimensions(_upload_source(uploaded_file))
+    except ImageTooLarge as e:
+        raise ValueError(str(e))
+    finally:
+        uploaded_file.seek(0)
+    return fmt
 
-def _guess_decoder_kind(name_l: str, ct_l: str) -> Optional[str]:
-    jpeg_exts = (".jpg", ".jpeg")
-    webp_exts = (".webp",)
-    png_exts = (".png",)
-    if name_l.endswith(webp_exts) or ct_l in {"image/webp", "image/x-webp"}:
-        return "webp"
-    if name_l.endswith(jpeg_exts) or ct_l in {"image/jpeg", "image/pjpeg"}:
-        return "jpeg"
-    if name_l.endswith(png_exts) or ct_l == "image/png":
-        return "png"
-    return None
 
+def _upload_source(uploaded_file):
+    """Откуда читать исходник: путь к временному файлу (крупные загрузки уже на диске)
+    или сам файловый объект — без копирования содержимого в bytes."""
 
-def _looks_like_image(kind: str, payload: bytes) -> bool:
-    if not payload:
-        return False
-    if kind == "jpeg":
-        return payload.startswith(b"\xFF\xD8")
-    if kind == "webp":
-        return len(payload) >= 12 and payload[:4] == b"RIFF" and payload[8:12] == b"WEBP"
-    if kind == "png":
-        return payload.startswith(b"\x89PNG\r\n\x1a\n")
-    return True
-
-
-def _fallback_file_name(original: Optional[str], kind: str) -> str:
-    if original:
-        return original
-    if kind == "webp":
-        suffix = ".webp"
-    elif kind == "png":
-        suffix = ".png"
-    else:
-        suffix = ".jpg"
-    return f"photo{suffix}"
-
-
-def _encode_jpeg_to_target(img, base_name, orig_bytes):
-    target = max(150 * 1024, len(orig_bytes) // 5)  # ≈×5, но не меньше ~150KB
-    lo, hi, best = 65, 90, None
-    while lo <= hi:
-        q = (lo + hi) // 2
-        buf = BytesIO()
-        img.save(buf, format="JPEG", quality=q, optimize=True, progressive=True)
-        if buf.tell() <= target:
-            best, lo = buf, q + 1
-        else:
-            hi = q - 1
-    if best is None:
-        best = BytesIO()
-        img.save(best, format="JPEG", quality=75, optimize=True, progressive=True)
-    best.seek(0)
-    return ContentFile(best.read(), name=f"{base_name}.jpg")
+    temporary_path = getattr(uploaded_file, "temporary_file_path", None)
+    if callable(temporary_path):
+        return temporary_path()
+    return getattr(uploaded_file, "file", None) or uploaded_file
 
 
 def _process_one_file(uploaded_file):
     """
     Для JPEG/PNG/WEBP: всегда раскодировать через Pillow и перекодировать в JPEG с целевым размером.
-    Для HEIC/HEIF — вернуть явную ошибка-строку (требуется тестами).
-    Для совсем мусора/битого — тоже явная ошибка-строку.
+    Для HEIC/HEIF, файлов больше PHOTO_UPLOAD_MAX_BYTES и изображений больше
+    PHOTO_UPLOAD_MAX_PIXELS — вернуть явную ошибку-строку (до декодирования).
+    Для совсем мусора/битого — тоже явная ошибка-строку. С PHOTO_DECODE_SANDBOX
+    сжатие идёт в отдельном процессе; таймаут или нехватка памяти там — тоже
+    ошибка только этого файла.
     """
-    name_l = (uploaded_file.name or "photo").lower()
-    ct_l = (getattr(uploaded_file, "content_type", "") or "").lower()
-    # HEIC/HEIF — сразу отказ с нужной формулировкой
-    if name_l.endswith((".heic", ".heif")) or ct_l in {"image/heic", "image/heif"}:
-        raise ValueError("HEIC/HEIF пока не поддерживается — сохраните как JPG/PNG/WebP.")
+    name_l = _check_upload_supported(uploaded_file)
+    _check_upload_header(uploaded_file)
     try:
+        data, derivatives = compress_upload(_upload_source(uploaded_file), uploaded_file.size)
+        base = name_l.rsplit("/", 1)[-1].rsplit(".", 1)[0] or "photo"
+        processed = ContentFile(data, name=f"{base}.jpg")
+        # Photo.save() разложит их рядом с основным файлом (w320.jpg, …)
+        processed.derivatives = derivatives
+        return processed
+    except (ImageTooLarge, DecodeFailed) as e:
+        raise ValueError(str(e))
+    except InvalidImage:
+        raise ValueError(INVALID_IMAGE_MESSAGE)
+    finally:
         try:
             uploaded_file.seek(0)
         except Exception:
             pass
-        orig = uploaded_file.read()
+
+
+def _compress_uploads(files):
+    """
+    Сжать пачку загрузок с ограниченным параллелизмом (Pillow отпускает GIL
+    на decode/encode). Возвращает [(ContentFile | None, Exception | None)]
+    в исходном порядке файлов.
+    """
+
+    def run(uploaded):
         try:
-            uploaded_file.seek(0)
-        except Exception:
-            pass
-        data = compress_to_jpeg(orig)
-        base = name_l.rsplit("/", 1)[-1].rsplit(".", 1)[0] or "photo"
-        return ContentFile(data, name=f"{base}.jpg")
-    except InvalidImage:
-        raise ValueError(INVALID_IMAGE_MESSAGE)
+            return _process_one_file(uploaded), None
+        except Exception as e:  # ошибки разбираем в вызывающем коде по порядку
+            return None, e
+
+    workers = min(len(files), max(1, int(getattr(settings, "PHOTO_UPLOAD_WORKERS", 1) or 1)))
+    if workers <= 1:
+        return [run(uploaded) for uploaded in files]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="photo-upload") as pool:
+        return list(pool.map(run, files))
+
 
 def healthz(request):
     return HttpResponse("ok", content_type="text/plain")
@@ -668,12 +651,90 @@ def _panel_form_context(form, prop, photos):
     }
 
 
-def panel_list(request):
-    _ensure_migrated()
+class _PanelRow:
+    """Строка таблицы panel_list.
 
-    q = request.GET.get("q", "").strip()
-    show = request.GET.get("show")
-    include_archived = request.GET.get("include_archived") == "1"
+    Отображаемые значения считаются лениво: при попадании во фрагментный кэш
+    шаблона (ключ — id + updated_at) форматирование адреса/цены не выполняется.
+    """
+
+    def __init__(self, prop):
+        self.prop = prop
+        self.id = prop.pk
+        updated_at = getattr(prop, "updated_at", None)
+        self.cache_version = updated_at.isoformat() if updated_at else ""
+
+    @cached_property
+    def type(self):
+        return _short_category(self.prop)
+
+    @cached_property
+    def address(self):
+        return _compact_address(self.prop) or (getattr(self.prop, "address", "") or "")
+
+    @cached_property
+    def full_address(self):
+        return getattr(self.prop, "address", "") or ""
+
+    @cached_property
+    def external_id(self):
+        return getattr(self.prop, "external_id", "") or ""
+
+    @cached_property
+    def floors(self):
+        floor_number = getattr(self.prop, "floor_number", None)
+        building_floors = getattr(self.prop, "building_floors", None)
+        has_floor = floor_number not in (None, "")
+        has_building_floors = building_floors not in (None, "")
+        if has_floor and has_building_floors:
+            return f"{floor_number}/{building_floors}"
+        if has_floor:
+            return str(floor_number)
+        if has_building_floors:
+            return f"—/{building_floors}"
+        return ""
+
+    @cached_property
+    def created(self):
+        return _format_date(getattr(self.prop, "created_at", None))
+
+    @cached_property
+    def updated(self):
+        return _format_date(getattr(self.prop, "updated_at", None))
+
+    @cached_property
+    def price_display(self):
+        return _format_price_compact(getattr(self.prop, "price", None))
+
+    @cached_property
+    def price_raw(self):
+        price_value = getattr(self.prop, "price", None)
+        if price_value in (None, ""):
+            return ""
+        try:
+            return str(int(Decimal(price_value)))
+        except (InvalidOperation, TypeError, ValueError):
+            return ""
+
+    @property
+    def is_archived(self):
+        return bool(getattr(self.prop, "is_archived", False))
+
+    @property
+    def export_to_cian(self):
+        return bool(getattr(self.prop, "export_to_cian", False))
+
+    @property
+    def export_to_domklik(self):
+        return bool(getattr(self.prop, "export_to_domklik", False))
+
+
+def _panel_list_queryset(params):
+    """Собрать queryset для panel_list по GET-параметрам (поиск, архив, фильтры, сортировка)."""
+
+    q = params.get("q", "").strip()
+    show = params.get("show")
+    include_archived = params.get("include_archived") == "1"
 
     props = Property.objects.all()
     if show == "archived":
@@ -696,49 +757,22 @@ def panel_list(request):
                 )
             props = props.filter(token_q)
 
-    props = props.order_by("-updated_at", "-id")
-    props_list = list(props)
+    props = props.order_by(*SORT_ORDERINGS[DEFAULT_SORT])
+    filterset = PropertyListFilter(params, queryset=props)
+    return filterset.qs, filterset
 
-    rows = []
-    for prop in props_list:
-        floor_number = getattr(prop, "floor_number", None)
-        building_floors = getattr(prop, "building_floors", None)
-        has_floor = floor_number not in (None, "")
-        has_building_floors = building_floors not in (None, "")
-        if has_floor and has_building_floors:
-            floors_display = f"{floor_number}/{building_floors}"
-        elif has_floor:
-            floors_display = str(floor_number)
-        elif has_building_floors:
-            floors_display = f"—/{building_floors}"
-        else:
-            floors_display = ""
 
-        price_value = getattr(prop, "price", None)
-        raw_price = ""
-        if price_value not in (None, ""):
-            try:
-                raw_price = str(int(Decimal(price_value)))
-            except (InvalidOperation, TypeError, ValueError):
-                raw_price = ""
+def panel_list(request):
+    _ensure_migrated()
 
-        rows.append(
-            {
-                "id": prop.pk,
-                "type": _short_category(prop),
-                "address": _compact_address(prop) or (getattr(prop, "address", "") or ""),
-                "full_address": getattr(prop, "address", "") or "",
-                "external_id": getattr(prop, "external_id", "") or "",
-                "floors": floors_display,
-                "created": _format_date(getattr(prop, "created_at", None)),
-                "updated": _format_date(getattr(prop, "updated_at", None)),
-                "price_display": _format_price_compact(price_value),
-                "price_raw": raw_price,
-                "is_archived": bool(getattr(prop, "is_archived", False)),
-                "export_to_cian": bool(getattr(prop, "export_to_cian", False)),
-                "export_to_domklik": bool(getattr(prop, "export_to_domklik", False)),
-            }
-        )
+    q = request.GET.get("q", "").strip()
+    show = request.GET.get("show")
+    include_archived = request.GET.get("include_archived") == "1"
+
+    props, filterset = _panel_list_queryset(request.GET)
+    props_list = list(props)
+
+    rows = [_PanelRow(prop) for prop in props_list]
 
     show_archived_flag = include_archived or show == "all"
     return render(
@@ -749,10 +783,97 @@ def panel_list(request):
             "q": q,
             "show": show,
             "include_archived": show_archived_flag,
+            "filter_form": filterset.form,
+            "facets": property_facets(),
+            "panel_row_cache_timeout": getattr(settings, "PANEL_ROW_CACHE_TIMEOUT", 3600),
         },
     )
 
 
+def _parse_floats(raw, count):
+    try:
+        values = [float(x) for x in (raw or "").split(",")]
+    except ValueError:
+        return None
+    if len(values) != count or any(v != v for v in values):  # NaN
+        return None
+    return values
+
+
+def panel_geo(request):
+    """
+    Геопоиск для карты (JSON).
+      ?bbox=south,west,north,east          — объекты в прямоугольнике
+      ?lat=..&lng=..&radius=км             — объекты в радиусе (с расстоянием)
+      &zoom=N                              — вместо точек вернуть кластеры для зума
+      &include_archived=1                  — включая архив
+    """
+
+    _ensure_migrated()
+    props = Property.objects.exclude(lat=None).exclude(lng=None)
+    if request.GET.get("include_archived") != "1":
+        props = props.filter(is_archived=False)
+
+    distances = None
+    if request.GET.get("bbox"):
+        bbox = _parse_floats(request.GET.get("bbox"), 4)
+        if (
+            not bbox
+            or not (-90 <= bbox[0] <= bbox[2] <= 90)
+            or not (-180 <= bbox[1] <= bbox[3] <= 180)
+        ):
+            return JsonResponse({"ok": False, "error": "invalid_bbox"}, status=400)
+        props = geo.filter_bbox(props, *bbox)
+    elif request.GET.get("radius"):
+        center = _parse_floats(
+            f"{request.GET.get('lat', '')},{request.GET.get('lng', '')},{request.GET.get('radius', '')}",
+            3,
+        )
+        if (
+            not center
+            or not (-90 <= center[0] <= 90)
+            or not (-180 <= center[1] <= 180)
+            or not (0 < center[2] <= 500)
+        ):
+            return JsonResponse({"ok": False, "error": "invalid_radius"}, status=400)
+        distances = geo.within_radius(props, *center)
+    else:
+        return JsonResponse({"ok": False, "error": "bbox_or_radius_required"}, status=400)
+
+    zoom_raw = (request.GET.get("zoom") or "").strip()
+    if zoom_raw:
+        if not zoom_raw.isdigit():
+            return JsonResponse({"ok": False, "error": "invalid_zoom"}, status=400)
+        if distances is not None:
+            props = Property.objects.filter(pk__in=[obj.pk for obj, _ in distances])
+        return JsonResponse(
+            {"ok": True, "mode": "clusters", "items": geo.cluster(props, int(zoom_raw))}
+        )
+
+    try:
+        limit = max(1, min(int(request.GET.get("limit") or 500), 5000))
+    except ValueError:
+        limit = 500
+
+    if distances is None:
+        pairs = [(obj, None) for obj in props.order_by("id")[:limit]]
+    else:
+        pairs = distances[:limit]
+    items = []
+    for obj, distance in pairs:
+        item = {
+            "id": obj.pk,
+            "lat": float(obj.lat),
+            "lng": float(obj.lng),
+            "address": obj.address or "",
+            "price": _format_price_compact(obj.price),
+        }
+        if distance is not None:
+            item["distance_km"] = round(distance, 3)
+        items.append(item)
+    return JsonResponse({"ok": True, "mode": "points", "items": items})
+
+
 @require_POST
 def panel_update_price(request, pk):
     _ensure_migrated()
@@ -892,15 +1013,15 @@ def panel_edit(request, pk):
             status=200,
         )
     form = PropertyForm(instance=prop)
-    return render(
-        request,
-        "core/panel_edit.html",
-        _panel_form_context(
-            form,
-            prop,
-            list(prop.photos.order_by("-is_default", "sort", "id")),
-        ),
+    for error in photo_jobs.pop_failed_jobs(prop):
+        messages.error(request, error)
+    context = _panel_form_context(
+        form,
+        prop,
+        list(prop.photos.order_by("-is_default", "sort", "id")),
     )
+    context["photo_jobs_pending"] = photo_jobs.job_status(prop)["pending"]
+    return render(request, "core/panel_edit.html", context)
 
 
 def panel_add_photo(request, pk):
@@ -924,60 +1045,117 @@ def panel_add_photo(request, pk):
         messages.error(request, "Не выбрано ни файла, ни URL.")
         return redirect(f"/panel/edit/{pk}/")
 
+    if files and getattr(settings, "PHOTO_UPLOAD_QUEUE", False):
+        accepted = []
+        for uploaded in files:
+            try:
+                _check_upload_supported(uploaded)
+                _check_upload_header(uploaded)
+                accepted.append(uploaded)
+            except ValueError as e:
+                log.warning("upload rejected: %s", e)
+                messages.error(request, str(e))
+        queued = photo_jobs.enqueue_uploads(prop, accepted, make_default=make_default)
+        if queued:
+            messages.success(request, f"Фото поставлены в обработку: {len(queued)}.")
+            # главное фото уже закреплено за первым файлом очереди
+            make_default = make_default and not queued[0].make_default
+        files = []
+        if not url:
+            return redirect(f"/panel/edit/{pk}/")
+
     created = 0
     default_set = False
-    max_sort = (
-        Photo.objects.filter(property=prop).aggregate(Max("sort")).get("sort__max")
-        or 0
-    )
-
-    for idx, uploaded in enumerate(files):
-        try:
-            processed = _process_one_file(uploaded)
-            ph = Photo(property=prop)
-            ph.image = processed
-            if make_default and not default_set and idx == 0:
-                Photo.objects.filter(property=prop).update(is_default=False)
-                ph.is_default = True
-                ph.sort = 0
-                default_set = True
-            else:
-                max_sort += 10
-                ph.sort = max_sort
-            ph.save()
-            created += 1
-        except ValueError as e:
-            log.warning("upload rejected: %s", e)
-            messages.error(request, str(e))
-        except Exception:
-            log.exception("upload failed")
+    max_sort = photo_jobs.next_sort_value(prop)
+    new_photos = []
+
+    # Одинаковые исходники (повторная загрузка, тот же файл дважды в пачке)
+    # не сжимаем заново — ссылаемся на уже сохранённый файл.
+    digests = [photo_store.source_digest(uploaded) for uploaded in files]
+    reusable = photo_store.find_reusable(digests)
+    first_idx = {}
+    for idx, digest in enumerate(digests):
+        if digest not in reusable:
+            first_idx.setdefault(digest, idx)
+    to_compress = sorted(first_idx.values())
+    # Сжатие — параллельно (вне транзакции), запись — одной транзакцией ниже.
+    compressed = dict(zip(to_compress, _compress_uploads([files[i] for i in to_compress])))
+    batch_photos = {}
+
+    for idx, digest in enumerate(digests):
+        processed, error = compressed.get(first_idx.get(digest), (None, None))
+        if isinstance(error, ValueError):
+            log.warning("upload rejected: %s", error)
+            messages.error(request, str(error))
+            continue
+        if error is not None:
+            log.error("upload failed", exc_info=error)
             messages.error(
                 request,
                 "Не удалось загрузить одно из фото (код: UnexpectedError)",
             )
+            continue
+        ph = Photo(property=prop, source_hash=digest)
+        if digest in reusable:
+            photo_store.share_image(ph, reusable[digest])
+        elif first_idx[digest] == idx:
+            ph.image = processed
+            batch_photos[digest] = ph
+        else:
+            ph._share_with = batch_photos[digest]
+        if make_default and not default_set and idx == 0:
+            ph.is_default = True
+            ph.sort = 0
+            default_set = True
+        else:
+            max_sort += 10
+            ph.sort = max_sort
+        new_photos.append(ph)
 
     if url:
+        ph = Photo(property=prop, full_url=url)
+        if make_default and not default_set:
+            ph.is_default = True
+            ph.sort = 0
+            default_set = True
+        else:
+            max_sort += 10
+            ph.sort = max_sort
+        new_photos.append(ph)
+
+    if new_photos:
         try:
-            ph = Photo(property=prop, full_url=url)
-            if make_default and not default_set:
-                Photo.objects.filter(property=prop).update(is_default=False)
-                ph.is_default = True
-                ph.sort = 0
-                default_set = True
-            else:
-                max_sort += 10
-                ph.sort = max_sort
-            ph.save()
-            created += 1
+            with transaction.atomic():
+                if default_set:
+                    Photo.objects.filter(property=prop).update(is_default=False)
+                for ph in new_photos:
+                    shared = getattr(ph, "_share_with", None)
+                    if shared is not None:
+                        photo_store.share_image(ph, shared)
+                    ph.save()
+            created = len(new_photos)
         except Exception:
-            log.exception("upload failed (url)")
-            messages.error(request, "Не удалось добавить фото по ссылке.")
+            log.exception("upload failed (save)")
+            # строки откатились, а записанные в хранилище файлы остались бы сиротами
+            photo_store.discard_written_files(batch_photos.values())
+            if url and len(new_photos) == 1:
+                messages.error(request, "Не удалось добавить фото по ссылке.")
+            else:
+                messages.error(
+                    request,
+                    "Не удалось загрузить одно из фото (код: UnexpectedError)",
+                )
 
     if created:
         messages.success(request, "Фото добавлено.")
     return redirect(f"/panel/edit/{pk}/")
 
 
+def panel_photo_jobs_status(request, pk):
+    prop = get_object_or_404(Property, pk=pk)
+    return JsonResponse({"ok": True, **photo_jobs.job_status(prop)})
+
+
 @require_POST
 def panel_photo_delete(request, pk):
     ph = get_object_or_404(Photo, pk=pk)
@@ -1003,6 +1181,9 @@ def panel_photo_set_default(request, pk):
 
 @require_POST
 def panel_photo_rotate(request, pk):
+    """Поворот только в метаданных (Photo.orientation); файл поворачивается позже
+    один раз — см. photo_store.apply_orientation."""
+
     direction = (request.GET.get("dir") or "").lower()
     if direction not in {"left", "right"}:
         return JsonResponse({"ok": False, "error": "invalid_direction"}, status=400)
@@ -1014,52 +1195,14 @@ def panel_photo_rotate(request, pk):
     if not photo.image:
         return JsonResponse({"ok": False, "error": "no_local_image"}, status=400)
 
-    try:
-        photo.image.open("rb")
-        original_bytes = photo.image.read()
-    finally:
-        try:
-            photo.image.close()
-        except Exception:
-            pass
-
-    try:
-        img = Image.open(BytesIO(original_bytes))
-        img.load()
-        img = ImageOps.exif_transpose(img)
-    except (UnidentifiedImageError, OSError, ValueError):
-        return JsonResponse({"ok": False, "error": "invalid_image"}, status=400)
-
-    if not _image_has_rotation_api(img):
-        return JsonResponse({"ok": False, "error": "rotate_unsupported"})
+    delta = 270 if direction == "left" else 90
+    Photo.objects.filter(pk=photo.pk).update(orientation=Mod(F("orientation") + delta, 360))
+    photo.refresh_from_db(fields=["orientation"])
+    return JsonResponse({"ok": True, "id": photo.id, "orientation": photo.orientation})
 
-    angle = -90 if direction == "left" else 90
-    rotated = img.rotate(angle, expand=True)
-    rotated = rotated.convert("RGB")
 
-    buf = BytesIO()
-    rotated.save(buf, format="JPEG", optimize=True, progressive=True, quality=85)
-    data = buf.getvalue()
-
-    storage = getattr(photo.image, "storage", None)
-    name = getattr(photo.image, "name", None)
-    target_name = name or photo.image.name
-    if not target_name:
-        target_name = photo.image.field.generate_filename(photo, f"photo-{photo.id}.jpg")
-
-    if storage and name:
-        try:
-            storage.delete(name)
-        except Exception:
-            pass
-
-    try:
-        photo.image.save(target_name, ContentFile(data), save=False)
-        photo.save(update_fields=["image"])
-    except Exception:
-        return JsonResponse({"ok": False, "error": "save_failed"}, status=500)
-
-    return JsonResponse({"ok": True, "id": photo.id})
+def _wants_json(request):
+    return request.headers.get("X-Requested-With") == "XMLHttpRequest"
 
 
 @require_POST
@@ -1068,25 +1211,34 @@ def panel_photos_reorder(request, prop_id):
     """
     Принимает order="3,1,2" — список photo.id в новом порядке.
     Все фото должны принадлежать property=prop_id.
+    Запрос из JS (X-Requested-With: XMLHttpRequest) получает JSON вместо редиректа.
     """
 
+    as_json = _wants_json(request)
     order = (request.POST.get("order") or "").strip()
     if not order:
+        if as_json:
+            return JsonResponse({"ok": False, "error": "invalid_payload"}, status=400)
         messages.error(request, "Не передан порядок.")
         return redirect(f"/panel/edit/{prop_id}/")
 
     ids = [int(x) for x in order.split(",") if x.strip().isdigit()]
     photos = {
-        p.id: p for p in Photo.objects.filter(property_id=prop_id, id__in=ids)
+        p.id: p for p in Photo.objects.filter(property_id=prop_id, id__in=ids).only("id", "sort")
     }
+    changed = []
     pos = 10
     for pid in ids:
-        p = photos.get(pid)
+        p = photos.pop(pid, None)
         if p:
             p.sort = pos
-            p.save(update_fields=["sort"])
+            changed.append(p)
             pos += 10
+    # один UPDATE … CASE без save() и pre_save-сигналов на каждое фото
+    Photo.objects.bulk_update(changed, ["sort"])
 
+    if as_json:
+        return JsonResponse({"ok": True, "order": [p.id for p in changed]})
     messages.success(request, "Порядок фото сохранён.")
     return redirect(f"/panel/edit/{prop_id}/")
 
@@ -1106,10 +1258,8 @@ def panel_photos_bulk_delete(request):
 
     prop = get_object_or_404(Property, pk=property_id)
     qs = Photo.objects.filter(property=prop, id__in=id_values)
-    deleted_ids = []
-    for item in qs:
-        deleted_ids.append(item.id)
-        item.delete()
+    # файлы удалит photo_store.sweep_cleanup, запрос их не ждёт
+    deleted_ids = photo_store.bulk_delete(qs)
 
     return JsonResponse({"ok": True, "deleted": deleted_ids})
 
@@ -1121,6 +1271,11 @@ def export_cian(request):
         .order_by("id")
         .prefetch_related("photos")
     )
+    # отложенные повороты должны попасть в файлы до того, как площадка их заберёт;
+    # не больше FEED_ROTATION_LIMIT за запрос, чтобы GET фида не упирался в перекодирование
+    photo_store.apply_pending_orientations(
+        Photo.objects.filter(property__in=qs), limit=FEED_ROTATION_LIMIT
+    )
     feed_result = build_cian_feed(qs)
     xml_bytes = feed_result.xml
 
@@ -1159,6 +1314,11 @@ def export_domklik(request):
         .order_by("id")
         .prefetch_related("photos")
     )
+    # отложенные повороты должны попасть в файлы до того, как площадка их заберёт;
+    # не больше FEED_ROTATION_LIMIT за запрос, чтобы GET фида не упирался в перекодирование
+    photo_store.apply_pending_orientations(
+        Photo.objects.filter(property__in=qs), limit=FEED_ROTATION_LIMIT
+    )
     feed_result = build_cian_feed(qs)
     xml_bytes = feed_result.xml
 
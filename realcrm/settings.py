@@ -102,6 +102,33 @@ def _env_list(name: str):
 }
 
 
+# Cache
+# Локальная память процесса по умолчанию; CACHE_DIR переключает на файловый кэш,
+# общий для всех воркеров (PythonAnywhere). Используется для счётчиков сайдбара
+# и фрагментов строк panel_list; ключи обоих версионируются данными из БД
+# (updated_at), так что и с кэшем на процесс устаревшее не отдаётся.
+_cache_dir = os.getenv("CACHE_DIR", "").strip()
+if _cache_dir:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+            "LOCATION": _cache_dir,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+            "LOCATION": "realcrm",
+            "OPTIONS": {"MAX_ENTRIES": 5000},
+        }
+    }
+
+# Время жизни закэшированной строки списка (ключ уже меняется при каждом
+# сохранении объекта, так что TTL лишь подчищает устаревшие версии).
+PANEL_ROW_CACHE_TIMEOUT = int(os.getenv("PANEL_ROW_CACHE_TIMEOUT", "3600"))
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -149,6 +176,14 @@ def _env_list(name: str):
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Очередь обработки фото: загрузка только сохраняет исходники, сжатие делает
+# `manage.py photo_worker` (always-on task). Без воркера держать выключенным.
+PHOTO_UPLOAD_QUEUE = os.getenv("PHOTO_UPLOAD_QUEUE", "False").lower() == "true"
+
+# Сколько файлов из одной загрузки сжимать параллельно (потоки; Pillow
+# отпускает GIL). Ограничение держит в узде и пиковую память воркера.
+PHOTO_UPLOAD_WORKERS = int(os.getenv("PHOTO_UPLOAD_WORKERS", str(min(4, os.cpu_count() or 1))))
+
 # Общий секретный ключ доступа к панели (НЕ публиковать)
 SHARED_KEY = os.getenv("SHARED_KEY", "")
 
@@ -170,3 +205,27 @@ def _env_list(name: str):
         },
     },
 }
+
+# Загрузки крупнее FILE_UPLOAD_MAX_MEMORY_SIZE Django пишет во временный файл,
+# и сжатие читает исходник прямо оттуда, не держа его целиком в памяти.
+FILE_UPLOAD_MAX_MEMORY_SIZE = int(os.getenv("FILE_UPLOAD_MAX_MEMORY_SIZE", str(2 * 1024 * 1024)))
+# Фото больше этого отклоняются до декодирования (0 — без ограничения).
+PHOTO_UPLOAD_MAX_BYTES = int(os.getenv("PHOTO_UPLOAD_MAX_BYTES", str(40 * 1024 * 1024)))
+
+# Чем сжимать основной JPEG: pillow, vips (pyvips + libvips) или auto — при
+# старте замеряются доступные и берётся более быстрый.
+PHOTO_IMAGE_BACKEND = os.getenv("PHOTO_IMAGE_BACKEND", "auto").lower()
+
+# Бюджет пикселей исходника (ширина × высота по заголовку): больше — отказ до
+# декодирования, чтобы один огромный или вредоносный файл не съел память воркера.
+PHOTO_UPLOAD_MAX_PIXELS = int(os.getenv("PHOTO_UPLOAD_MAX_PIXELS", str(100_000_000)))
+
+# Песочница декодера: сжатие загрузок в отдельных процессах с потолком памяти
+# (МБ адресного пространства на процесс), таймаутом на файл (с) и заменой
+# процесса после N задач. Зависший или упавший декодер проваливает только
+# свою загрузку, а не весь веб-воркер.
+PHOTO_DECODE_SANDBOX = os.getenv("PHOTO_DECODE_SANDBOX", "False").lower() == "true"
+PHOTO_DECODE_WORKERS = int(os.getenv("PHOTO_DECODE_WORKERS", str(PHOTO_UPLOAD_WORKERS)))
+PHOTO_DECODE_MEMORY_MB = int(os.getenv("PHOTO_DECODE_MEMORY_MB", "2048"))
+PHOTO_DECODE_TIMEOUT = float(os.getenv("PHOTO_DECODE_TIMEOUT", "60"))
+PHOTO_DECODE_MAX_TASKS = int(os.getenv("PHOTO_DECODE_MAX_TASKS", "50"))
@@ -14,6 +14,11 @@
     path("panel/create/", core_views.panel_create, name="panel_create"),
     path("panel/edit/<int:pk>/", core_views.panel_edit, name="panel_edit"),
     path("panel/edit/<int:pk>/add-photo/", core_views.panel_add_photo, name="panel_add_photo"),
+    path(
+        "panel/edit/<int:pk>/photo-jobs/",
+        core_views.panel_photo_jobs_status,
+        name="panel_photo_jobs_status",
+    ),
     path("panel/photo/<int:pk>/delete/", core_views.panel_photo_delete, name="panel_photo_delete"),
     path("panel/photo/<int:pk>/rotate/", core_views.panel_photo_rotate, name="panel_photo_rotate"),
     path(
@@ -34,6 +39,7 @@
     path("panel/export/cian/", core_views.export_cian, name="export_cian"),
     path("panel/export/domklik/", core_views.export_domklik, name="export_domklik"),
     path("panel/export/cian/check/", core_views.export_cian_check, name="export_cian_check"),
+    path("panel/geo/", core_views.panel_geo, name="panel_geo"),
     path("panel/<int:pk>/price/", core_views.panel_update_price, name="panel_update_price"),
     path(
         "panel/<int:pk>/toggle-archive/",
@@ -111,8 +111,17 @@ def test_rotate_endpoint(self):
             self.assertEqual(response.status_code, 200)
             payload = json.loads(response.content.decode("utf-8"))
             self.assertTrue(payload.get("ok"))
+            self.assertEqual(payload.get("orientation"), 90)
 
+            # поворот отложенный: файл перезаписывается только при применении
             photo.refresh_from_db()
+            self.assertEqual(photo.orientation, 90)
+            from core import photo_store
+
+            self.assertEqual(photo_store.apply_pending_orientations(), 1)
+
+            photo.refresh_from_db()
+            self.assertEqual(photo.orientation, 0)
             photo.image.open("rb")
             try:
                 with Image.open(photo.image) as rotated:
@@ -56,3 +56,37 @@ def test_replace_image_removes_old_file(settings, tmp_path):
 
     assert not os.path.exists(old_path)
     assert os.path.exists(photo.image.path)
+
+
+@pytest.mark.django_db
+def test_save_without_image_change_runs_no_lookup(settings, tmp_path, django_assert_num_queries):
+    settings.MEDIA_ROOT = str(tmp_path)
+    prop = Property.objects.create(title="Тест", address="Москва")
+    photo = Photo.objects.create(property=prop)
+    photo.image.save("keep.jpg", ContentFile(b"data"), save=True)
+    photo = Photo.objects.get(pk=photo.pk)
+
+    with django_assert_num_queries(1):  # только UPDATE
+        photo.sort = 30
+        photo.save(update_fields=["sort"])
+    with django_assert_num_queries(1):
+        photo.is_default = True
+        photo.save()
+
+    assert os.path.exists(photo.image.path)
+
+
+@pytest.mark.django_db
+def test_replace_image_on_loaded_instance_removes_old_file(settings, tmp_path):
+    settings.MEDIA_ROOT = str(tmp_path)
+    prop = Property.objects.create(title="Тест", address="Москва")
+    photo = Photo.objects.create(property=prop)
+    photo.image.save("first.jpg", ContentFile(b"old"), save=True)
+    old_path = photo.image.path
+
+    loaded = Photo.objects.get(pk=photo.pk)
+    loaded.image = SimpleUploadedFile("second.jpg", b"new", content_type="image/jpeg")
+    loaded.save()
+
+    assert not os.path.exists(old_path)
+    assert os.path.exists(loaded.image.path)